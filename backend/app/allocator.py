@@ -0,0 +1,113 @@
+import os
+import random
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+# How many free slot ids are read per refill of a park's candidate queue
+FREE_SLOT_REFILL_SIZE = int(os.getenv("FREE_SLOT_REFILL_SIZE", "64"))
+
+
+class FreeSlotPool:
+    """
+    Per-park queues of slot ids believed to be free.
+
+    Picking a candidate is O(1); the id is only a hint, the conditional UPDATE in
+    `claim_slot` decides who gets the slot. Refills are shuffled so workers in
+    other processes reading the same free slots do not all race for the same row.
+    """
+
+    def __init__(self, refill_size: int = FREE_SLOT_REFILL_SIZE):
+        self.refill_size = refill_size
+        self._free = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def pop(self, park_id: int):
+        with self._lock:
+            queue = self._free.get(park_id)
+            return queue.popleft() if queue else None
+
+    def push(self, park_id: int, slot_id: int):
+        with self._lock:
+            queue = self._free[park_id]
+            if slot_id not in queue:
+                queue.append(slot_id)
+
+    def refill(self, db: Session, park_id: int) -> int:
+        ids = db.execute(
+            select(models.Slot.id)
+            .where(models.Slot.park_id == park_id, models.Slot.is_occupied == False)
+            .limit(self.refill_size)
+        ).scalars().all()
+        random.shuffle(ids)
+        with self._lock:
+            self._free[park_id] = deque(ids)
+        return len(ids)
+
+    def discard(self, park_id: int):
+        with self._lock:
+            self._free.pop(park_id, None)
+
+
+free_slots = FreeSlotPool()
+
+
+def claim_slot(db: Session, slot_id: int, park_id: int) -> bool:
+    """
+    Atomically marks a free slot occupied. Exactly one concurrent caller wins.
+    The claim is part of the caller's transaction.
+    """
+    result = db.execute(
+        update(models.Slot)
+        .where(models.Slot.id == slot_id, models.Slot.park_id == park_id, models.Slot.is_occupied == False)
+        .values(is_occupied=True, last_updated=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claim_any_slot(db: Session, park_id: int):
+    """
+    Postgres only: claims some free slot in one statement, skipping rows locked by
+    concurrent claims. Returns the slot id or None.
+    """
+    candidate = (
+        select(models.Slot.id)
+        .where(models.Slot.park_id == park_id, models.Slot.is_occupied == False)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return db.execute(
+        update(models.Slot)
+        .where(models.Slot.id == candidate)
+        .values(is_occupied=True, last_updated=datetime.utcnow())
+        .returning(models.Slot.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def allocate_slot(db: Session, park_id: int, slot_id: int = None, max_refills: int = 3):
+    """
+    Claims the requested slot, or any free slot of the park. Returns the claimed slot id or None.
+    """
+    if slot_id:
+        return slot_id if claim_slot(db, slot_id, park_id) else None
+
+    for _ in range(max_refills):
+        candidate = free_slots.pop(park_id)
+        while candidate is not None:
+            if claim_slot(db, candidate, park_id):
+                return candidate
+            candidate = free_slots.pop(park_id)
+        if not free_slots.refill(db, park_id):
+            break
+
+    if db.get_bind().dialect.name == "postgresql":
+        return claim_any_slot(db, park_id)
+    return None
@@ -0,0 +1,199 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+# How often every park's occupancy is sampled into its hourly rollup
+OCCUPANCY_SAMPLE_SECONDS = float(os.getenv("OCCUPANCY_SAMPLE_SECONDS", "300"))
+# Parks per rollup upsert statement while sampling
+OCCUPANCY_SAMPLE_BATCH_SIZE = int(os.getenv("OCCUPANCY_SAMPLE_BATCH_SIZE", "500"))
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(db: Session, table, keys: dict, increments: dict, values: dict = None):
+    """
+    INSERT ... ON CONFLICT (keys) DO UPDATE adding `increments` to the existing row.
+    """
+    _upsert_rows(db, table, list(keys), list(increments), [{**keys, **(values or {}), **increments}])
+
+
+def _upsert_rows(db: Session, table, keys, increments, rows):
+    # Multi-row form of _upsert; every row has the same columns
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(table, name) + stmt.excluded[name] for name in increments},
+    )
+    db.execute(stmt)
+
+
+def record_park_hour(db: Session, park_id: int, ts: datetime, **increments):
+    """
+    Adds to the hourly rollup row of a park. Runs in the caller's transaction.
+    """
+    _upsert(db, models.ParkHourlyStat, {"park_id": park_id, "bucket": hour_bucket(ts)}, increments)
+
+
+def record_slot_usage(db: Session, park_id: int, slot_id: int, **increments):
+    _upsert(db, models.SlotUsageStat, {"slot_id": slot_id}, increments, values={"park_id": park_id})
+
+
+def record_booking(db: Session, park_id: int, slot_id: int, amount: float, ts: datetime):
+    record_park_hour(db, park_id, ts, revenue=amount or 0.0, bookings=1)
+    record_slot_usage(db, park_id, slot_id, bookings=1)
+
+
+def record_slot_events(db: Session, park_id: int, logs, ts: datetime):
+    """
+    Rolls a batch of camera entry/exit logs into the park's hour and the slots' usage counters.
+    """
+    entries = [log["slot_id"] for log in logs if log["event_type"] == "entry"]
+    record_park_hour(db, park_id, ts, entries=len(entries), exits=len(logs) - len(entries))
+    for slot_id in entries:
+        record_slot_usage(db, park_id, slot_id, entries=1)
+
+
+def occupied_counts(db: Session, after_id: int = 0, limit: int = OCCUPANCY_SAMPLE_BATCH_SIZE):
+    """
+    Returns [(park_id, occupied slots)] for the next `limit` parks by id after `after_id`,
+    including parks with none occupied.
+    """
+    page = select(models.Park.id).where(models.Park.id > after_id).order_by(models.Park.id).limit(limit).subquery()
+    return db.execute(
+        select(page.c.id, func.count(models.Slot.id))
+        .outerjoin(models.Slot, and_(models.Slot.park_id == page.c.id, models.Slot.is_occupied == True))
+        .group_by(page.c.id)
+        .order_by(page.c.id) # Same row order in every process, so concurrent upserts cannot deadlock
+    ).all()
+
+
+def sample_occupancy(db: Session, now: datetime = None) -> int:
+    """
+    Adds one occupancy sample of every park to its current hour, whether or not anything
+    happened there, so quiet hours carry the level forward instead of reading as empty.
+    Runs outside the booking and camera write paths, one short transaction per page of
+    parks. Returns the number of parks sampled.
+    """
+    bucket = hour_bucket(now or datetime.utcnow())
+    sampled, after_id = 0, 0
+    while counts := occupied_counts(db, after_id):
+        _upsert_rows(db, models.ParkHourlyStat, ["park_id", "bucket"], ["occupied_sum", "samples"], [
+            {"park_id": park_id, "bucket": bucket, "occupied_sum": occupied, "samples": 1}
+            for park_id, occupied in counts
+        ])
+        db.commit()
+        sampled += len(counts)
+        after_id = counts[-1][0]
+    return sampled
+
+
+def get_park_analytics(db: Session, park: models.Park, days: int = 7, top: int = 5, now: datetime = None):
+    """
+    Revenue and occupancy by day and by hour of day over the last `days` days, plus the
+    busiest slots. Reads at most days * 24 rollup rows, however long the park's history is.
+    """
+    now = now or datetime.utcnow()
+    since = datetime.combine((now - timedelta(days=days - 1)).date(), datetime.min.time())
+    rows = db.query(models.ParkHourlyStat).filter(
+        models.ParkHourlyStat.park_id == park.id,
+        models.ParkHourlyStat.bucket >= since
+    ).all()
+
+    capacity = park.total_slots or 0
+    def occupancy(occupied_sum, samples):
+        if not samples or not capacity:
+            return 0
+        return round(100 * occupied_sum / samples / capacity)
+
+    by_day = {}
+    by_hour = {}
+    for row in rows:
+        day = by_day.setdefault(row.bucket.date(), [0.0, 0, 0])
+        day[0] += row.revenue or 0.0
+        day[1] += row.occupied_sum or 0
+        day[2] += row.samples or 0
+        hour = by_hour.setdefault(row.bucket.hour, [0, 0])
+        hour[0] += row.occupied_sum or 0
+        hour[1] += row.samples or 0
+
+    trend = []
+    for offset in range(days - 1, -1, -1):
+        date = (now - timedelta(days=offset)).date()
+        revenue, occupied_sum, samples = by_day.get(date, (0.0, 0, 0))
+        trend.append({
+            "name": DAY_NAMES[date.weekday()],
+            "date": date.isoformat(),
+            "revenue": round(revenue, 2),
+            "occupancy": occupancy(occupied_sum, samples),
+        })
+
+    hourly = [
+        {"hour": h, "occupancy": occupancy(*by_hour.get(h, (0, 0)))}
+        for h in range(24)
+    ]
+
+    usage = models.SlotUsageStat.bookings + models.SlotUsageStat.entries
+    top_slots = db.query(models.Slot.slot_number, usage).join(
+        models.SlotUsageStat, models.SlotUsageStat.slot_id == models.Slot.id
+    ).filter(models.SlotUsageStat.park_id == park.id).order_by(usage.desc()).limit(top).all()
+
+    return {
+        "trend": trend,
+        "hourly": hourly,
+        "top_slots": [{"slot": number, "count": count} for number, count in top_slots],
+    }
+
+
+class OccupancySampler:
+    """
+    Background thread running `sample_occupancy` every `interval` seconds.
+    """
+
+    def __init__(self, interval: float = OCCUPANCY_SAMPLE_SECONDS):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="occupancy-sampler", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> int:
+        db = database.WorkerSessionLocal()
+        try:
+            return sample_occupancy(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Occupancy sampling failed: {e}")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+occupancy_sampler = OccupancySampler()
@@ -1,9 +1,12 @@
 import os
+import threading
+import time
+import requests
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
+from jose import jwt
 from dotenv import load_dotenv
-from . import models, database
+from . import models, database, metrics
 from sqlalchemy.orm import Session
 
 load_dotenv()
@@ -11,41 +14,178 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Tokens are verified locally: HS256 with the project's JWT secret, or asymmetric
+# keys published at the JWKS endpoint.
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Resolved users are reused for this long, so polling clients cost no lookups
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
 
 security = HTTPBearer()
 
+
+class JWKSCache:
+    """
+    Signing keys from the JWKS endpoint, refreshed in a background thread.
+    An unknown `kid` triggers an immediate refresh, at most once per `min_refresh_interval`.
+    """
+
+    def __init__(self, url: str, refresh_interval: float = JWKS_REFRESH_SECONDS, min_refresh_interval: float = 30.0):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.keys = {}
+        self.fetched_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=5)
+        response.raise_for_status()
+        return {key["kid"]: key for key in response.json().get("keys", []) if "kid" in key}
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.fetched_at is not None and now - self.fetched_at < self.min_refresh_interval:
+                return
+            self.fetched_at = now
+        try:
+            keys = self._fetch()
+        except Exception as e:
+            print(f"JWKS refresh failed: {e}")
+            return
+        with self._lock:
+            self.keys = keys
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh(force=True)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+            self._thread.start()
+
+    def get_key(self, kid: str):
+        self.start()
+        key = self.keys.get(kid)
+        if key is None:
+            self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+
+class UserCache:
+    """
+    Small TTL cache of resolved (detached) User objects keyed by token subject.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._users[user_id]
+                return None
+            return user
+
+    def put(self, user_id: str, user: models.User):
+        with self._lock:
+            if len(self._users) >= self.max_size:
+                now = time.monotonic()
+                self._users = {k: v for k, v in self._users.items() if v[0] >= now}
+                if len(self._users) >= self.max_size:
+                    self._users.clear()
+            self._users[user_id] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self, user_id: str = None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+jwks_cache = JWKSCache(SUPABASE_JWKS_URL) if SUPABASE_JWKS_URL else None
+user_cache = UserCache()
+
+
+def verify_token(token: str) -> dict:
+    """
+    Verifies a Supabase access token's signature, expiry and audience. Returns its claims.
+    """
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise ValueError("HS256 token but SUPABASE_JWT_SECRET is not configured")
+        key = SUPABASE_JWT_SECRET
+    elif alg in ASYMMETRIC_ALGORITHMS:
+        key = jwks_cache.get_key(header.get("kid")) if jwks_cache else None
+        if key is None:
+            raise ValueError(f"Unknown signing key {header.get('kid')}")
+    else:
+        raise ValueError(f"Unsupported token algorithm {alg}")
+    return jwt.decode(token, key, algorithms=[alg], audience=SUPABASE_JWT_AUDIENCE)
+
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(database.get_db)):
     """
     Standard dependency to verify the Supabase JWT token and return the User model.
     """
     token = credentials.credentials
     try:
-        # Verify token with Supabase Auth
-        user_response = supabase.auth.get_user(token)
-        if not user_response.user:
-             raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_id = str(user_response.user.id)
-        
+        started = time.perf_counter()
+        try:
+            claims = verify_token(token)
+        except Exception:
+            metrics.auth_latency.observe(time.perf_counter() - started, result="invalid")
+            raise
+        metrics.auth_latency.observe(time.perf_counter() - started, result="ok")
+        user_id = str(claims["sub"])
+
+        user = user_cache.get(user_id)
+        metrics.auth_user_cache.inc(result="hit" if user is not None else "miss")
+        if user is not None:
+            return user
+
         # Look up user in the profiles table
         user = db.query(models.User).filter(models.User.id == user_id).first()
-        
+
         # If user doesn't exist in local profile table (fallback sync)
         if not user:
-             role = user_response.user.user_metadata.get('role', 'user')
-             full_name = user_response.user.user_metadata.get('full_name', '')
-             new_user = models.User(
+             metadata = claims.get("user_metadata") or {}
+             user = models.User(
                  id=user_id,
-                 email=user_response.user.email,
-                 role=role,
-                 full_name=full_name
+                 email=claims.get("email"),
+                 role=metadata.get('role', 'user'),
+                 full_name=metadata.get('full_name', '')
              )
-             db.add(new_user)
+             db.add(user)
              db.commit()
-             db.refresh(new_user)
-             return new_user
-             
+             db.refresh(user)
+
+        # Detach so later commits in other sessions cannot expire the cached copy
+        db.expunge(user)
+        user_cache.put(user_id, user)
         return user
 
     except Exception as e:
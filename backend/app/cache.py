@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import events, models
+
+# Upper bound on staleness if an invalidating event is ever missed
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+
+
+class DashboardState:
+    def __init__(self, park_id, park_name, owner_id, total_slots, total_revenue, slots):
+        self.park_id = park_id
+        self.park_name = park_name
+        self.owner_id = owner_id
+        self.total_slots = total_slots
+        self.total_revenue = total_revenue
+        self.slots = slots # {slot_id: {"id", "slot_number", "is_occupied"}} in slot order
+        self.occupied = sum(1 for s in slots.values() if s["is_occupied"])
+        self.loaded_at = time.monotonic()
+        self._snapshot = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = {
+                "park_name": self.park_name,
+                "total_slots": self.total_slots,
+                "occupied_slots": self.occupied,
+                "available_slots": self.total_slots - self.occupied,
+                "total_revenue": self.total_revenue,
+                "slots": [dict(s) for s in self.slots.values()],
+            }
+        return self._snapshot
+
+    def apply(self, event: dict) -> bool:
+        """
+        Folds a park event into the cached state. Returns False if the event cannot be applied.
+        """
+        if event.get("type") == "slot":
+            slot = self.slots.get(event.get("slot_id"))
+            if slot is None:
+                return False
+            occupied = bool(event.get("is_occupied"))
+            if slot["is_occupied"] != occupied:
+                self.occupied += 1 if occupied else -1
+                slot["is_occupied"] = occupied
+        elif event.get("type") == "booking":
+            if event.get("amount") is None:
+                return False
+            self.total_revenue += event["amount"]
+        else:
+            return True
+        self._snapshot = None
+        return True
+
+
+def load_dashboard_state(db: Session, park_id: int):
+    """
+    Loads park header, slot grid and revenue total in a single statement. Revenue is
+    summed from the hourly rollups, a primary key range, not the park's booking history.
+    """
+    revenue = (
+        select(func.coalesce(func.sum(models.ParkHourlyStat.revenue), 0.0))
+        .where(models.ParkHourlyStat.park_id == park_id)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(
+            models.Park.name, models.Park.owner_id, models.Park.total_slots, revenue,
+            models.Slot.id, models.Slot.slot_number, models.Slot.is_occupied,
+        )
+        .select_from(models.Park)
+        .outerjoin(models.Slot, models.Slot.park_id == models.Park.id)
+        .where(models.Park.id == park_id)
+        .order_by(models.Slot.id)
+    ).all()
+    if not rows:
+        return None
+
+    name, owner_id, total_slots, total_revenue = rows[0][:4]
+    slots = {
+        slot_id: {"id": slot_id, "slot_number": number, "is_occupied": bool(occupied)}
+        for _, _, _, _, slot_id, number, occupied in rows if slot_id is not None
+    }
+    return DashboardState(park_id, name, owner_id, total_slots or 0, float(total_revenue or 0.0), slots)
+
+
+class DashboardCache:
+    """
+    Per-park dashboard state kept current by park events on the bus. Slot and booking
+    events are applied in place, so a poll is a dictionary lookup.
+    """
+
+    def __init__(self, bus=events.bus, ttl: float = DASHBOARD_CACHE_TTL_SECONDS):
+        self.bus = bus
+        self.ttl = ttl
+        self._states = {}
+        self._generations = {}
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def _on_event(self, topic: str, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        park_id = event.get("park_id")
+        with self._lock:
+            # Lets a load that raced with this event know its result is already stale
+            self._generations[park_id] = self._generations.get(park_id, 0) + 1
+            state = self._states.get(park_id)
+            if state is not None and not state.apply(event):
+                del self._states[park_id]
+
+    def peek(self, park_id: int):
+        """
+        Returns (owner_id, dashboard dict) if the park is cached and fresh, else None.
+        Never touches the database, so async handlers can call it on the event loop.
+        """
+        with self._lock:
+            state = self._states.get(park_id)
+            if state is not None and time.monotonic() - state.loaded_at < self.ttl:
+                return state.owner_id, state.snapshot()
+        return None
+
+    def get(self, db: Session, park_id: int):
+        """
+        Returns (owner_id, dashboard dict) for a park, or None if it does not exist.
+        """
+        with self._lock:
+            state = self._states.get(park_id)
+            if state is not None and time.monotonic() - state.loaded_at < self.ttl:
+                return state.owner_id, state.snapshot()
+            if park_id not in self._subscriptions:
+                self._subscriptions[park_id] = self.bus.subscribe(events.park_topic(park_id), self._on_event)
+            generation = self._generations.get(park_id, 0)
+
+        state = load_dashboard_state(db, park_id)
+        if state is None:
+            with self._lock:
+                unsubscribe = self._subscriptions.pop(park_id, None)
+            if unsubscribe:
+                unsubscribe()
+            return None
+        with self._lock:
+            if self._generations.get(park_id, 0) == generation:
+                self._states[park_id] = state
+            return state.owner_id, state.snapshot()
+
+    def invalidate(self, park_id: int):
+        with self._lock:
+            self._states.pop(park_id, None)
+
+
+dashboard_cache = DashboardCache()
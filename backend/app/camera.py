@@ -1,92 +1,915 @@
-import cv2
+import multiprocessing
+import os
+import queue
 import threading
 import time
-from . import crud, database, models
-from sqlalchemy.orm import Session
-try:
-    from ultralytics import YOLO
-except ImportError:
-    YOLO = None
-    print("Ultralytics not installed, camera analysis will be mocked.")
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from . import crud, database, snapshots, vision
+
+# OpenCV and ultralytics (which pulls in torch) take seconds to import, so they are
+# loaded on first use; API-only processes never pay for them
+_yolo_class = None
+_yolo_checked = False
+
+def load_yolo():
+    """
+    Returns the ultralytics YOLO class, or None if ultralytics is not installed.
+    """
+    global _yolo_class, _yolo_checked
+    if not _yolo_checked:
+        try:
+            from ultralytics import YOLO
+            _yolo_class = YOLO
+        except ImportError:
+            print("Ultralytics not installed, camera analysis is disabled.")
+        _yolo_checked = True
+    return _yolo_class
+
+# Per-camera frame budget and shared inference batching
+CAMERA_FPS = float(os.getenv("CAMERA_FPS", "2"))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_SECONDS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "50")) / 1000
+YOLO_WEIGHTS = os.getenv("YOLO_WEIGHTS", "yolov8n.pt")
+SLOT_IOU_THRESHOLD = float(os.getenv("SLOT_IOU_THRESHOLD", "0.3"))
+# Consecutive frames a slot must disagree with its stored state before it flips
+SLOT_DEBOUNCE_FRAMES = int(os.getenv("SLOT_DEBOUNCE_FRAMES", "3"))
+# Detection results waiting for a camera's result thread; further results are dropped
+CAMERA_RESULT_QUEUE_SIZE = int(os.getenv("CAMERA_RESULT_QUEUE_SIZE", "8"))
+
+# Supervision: worker budget, reconnect backoff and stall detection
+CAMERA_MAX_WORKERS = int(os.getenv("CAMERA_MAX_WORKERS", "32"))
+CAMERA_RECONNECT_MIN_SECONDS = float(os.getenv("CAMERA_RECONNECT_MIN_SECONDS", "1"))
+CAMERA_RECONNECT_MAX_SECONDS = float(os.getenv("CAMERA_RECONNECT_MAX_SECONDS", "60"))
+CAMERA_STALL_SECONDS = float(os.getenv("CAMERA_STALL_SECONDS", "30"))
+CAMERA_SUPERVISOR_INTERVAL = float(os.getenv("CAMERA_SUPERVISOR_INTERVAL", "5"))
+# Restart backoff only resets once an analyzer has kept running this long
+CAMERA_STABLE_SECONDS = float(os.getenv("CAMERA_STABLE_SECONDS", "120"))
+# Run inference in this many worker processes instead of threads of the API process (0 = in-process)
+CAMERA_INFERENCE_PROCESSES = int(os.getenv("CAMERA_INFERENCE_PROCESSES", "0"))
+# Motion gate: frames are only sent to the model when slot pixels changed since the last
+# applied detections, cropped to the changed slots, with a full frame every MOTION_REFRESH_SECONDS
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.02")) # Fraction of a slot's pixels
+MOTION_PIXEL_DELTA = int(os.getenv("MOTION_PIXEL_DELTA", "25")) # Gray level difference
+MOTION_REFRESH_SECONDS = float(os.getenv("MOTION_REFRESH_SECONDS", "30"))
+MOTION_CROP_MARGIN = float(os.getenv("MOTION_CROP_MARGIN", "0.5")) # Of the largest changed slot
+MOTION_MAX_CROP_FRACTION = float(os.getenv("MOTION_MAX_CROP_FRACTION", "0.5")) # Larger crops send the full frame
+
+# COCO classes counted as vehicles: car, motorcycle, bus, truck
+VEHICLE_CLASSES = (2, 3, 5, 7)
+
+
+
+class VideoSource:
+    """
+    OpenCV capture for an RTSP URL or a local video file.
+
+    Local files are paced to their native frame rate and looped, so they behave
+    like a live stream when testing offline.
+    """
+
+    def __init__(self, url: str):
+        import cv2
+        self.url = url
+        self.cap = cv2.VideoCapture(url)
+        self.is_file = os.path.exists(url)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next_frame_at = time.monotonic()
+
+    def is_opened(self) -> bool:
+        return self.cap.isOpened()
+
+    def grab(self) -> bool:
+        if self.frame_interval:
+            delay = self._next_frame_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_frame_at = max(self._next_frame_at + self.frame_interval, time.monotonic())
+        ok = self.cap.grab()
+        if not ok and self.is_file:
+            # Loop local files
+            import cv2
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok = self.cap.grab()
+        return ok
+
+    def retrieve(self):
+        ok, frame = self.cap.retrieve()
+        return frame if ok else None
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticSource:
+    """
+    Frame source backed by a callable `make_frame(seq) -> ndarray` or a sequence of frames,
+    emitted at `fps` like a live camera.
+    """
+
+    def __init__(self, frames, fps: float = 25.0, loop: bool = True):
+        self.frames = frames
+        self.loop = loop
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.seq = -1
+        self._next_frame_at = time.monotonic()
+
+    def is_opened(self) -> bool:
+        return True
+
+    def grab(self) -> bool:
+        if self.frame_interval:
+            delay = self._next_frame_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_frame_at = max(self._next_frame_at + self.frame_interval, time.monotonic())
+        self.seq += 1
+        if callable(self.frames):
+            return True
+        if self.seq >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                return False
+            self.seq = 0
+        return True
+
+    def retrieve(self):
+        if callable(self.frames):
+            return self.frames(self.seq)
+        return self.frames[self.seq]
+
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """
+    Accepts an RTSP URL / file path, or an already constructed source object.
+    """
+    if isinstance(source, str):
+        return VideoSource(source)
+    return source
+
+
+class YoloDetector:
+    """
+    Runs YOLO on a batch of frames and returns vehicle boxes (N, 4) per frame.
+    """
+
+    def __init__(self, weights: str = YOLO_WEIGHTS):
+        self.model = load_yolo()(weights)
+
+    def __call__(self, frames):
+        results = self.model(frames, verbose=False)
+        detections = []
+        for r in results:
+            boxes = r.boxes.xyxy.cpu().numpy()
+            classes = r.boxes.cls.cpu().numpy().astype(int)
+            detections.append(boxes[np.isin(classes, VEHICLE_CLASSES)])
+        return detections
+
+
+_process_detector = None
+
+def _init_process_detector(weights: str):
+    global _process_detector
+    _process_detector = YoloDetector(weights)
+
+def _process_detect(frames):
+    return _process_detector(frames)
+
+
+class ProcessPoolDetector:
+    """
+    Runs YoloDetector in separate processes so decoding in this process is not
+    contending with inference for the GIL. Each process loads the model once.
+    """
+
+    def __init__(self, processes: int, weights: str = YOLO_WEIGHTS):
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process_detector,
+            initargs=(weights,),
+        )
+
+    def __call__(self, frames):
+        return self.pool.submit(_process_detect, frames).result()
+
+    def warm_up(self, frames):
+        # One call per process so every process has loaded its model before the first camera
+        for future in [self.pool.submit(_process_detect, frames) for _ in range(self.processes)]:
+            future.result()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class InferenceWorker:
+    """
+    Single model worker shared by all cameras.
+
+    Each camera has at most one pending frame; a newer frame replaces an older one
+    that has not been picked up yet, so a slow model never builds a backlog.
+    Pending frames from different cameras are run through the model as one batch.
+    `concurrency` batches may be in flight at once (useful with a process pool detector).
+    """
+
+    def __init__(self, detector, batch_size: int = INFERENCE_BATCH_SIZE, max_wait: float = INFERENCE_MAX_WAIT_SECONDS, concurrency: int = 1):
+        self.detector = detector
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.concurrency = max(1, concurrency)
+        self.running = False
+        self.batches = 0
+        self.frames = 0
+        self.detect_seconds = 0.0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"inference-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = None):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        if hasattr(self.detector, "shutdown"):
+            self.detector.shutdown()
+
+    def submit(self, key, frame, captured_at: float, callback) -> bool:
+        """
+        Queues a frame for `key`. Returns True if it replaced a stale pending frame.
+        """
+        with self._cond:
+            replaced = key in self._pending
+            self._pending[key] = (frame, captured_at, callback)
+            self._cond.notify()
+        return replaced
+
+    def discard(self, key):
+        with self._cond:
+            self._pending.pop(key, None)
+
+    @property
+    def seconds_per_frame(self):
+        return self.detect_seconds / self.frames if self.frames else None
+
+    def _next_batch(self):
+        with self._cond:
+            while self.running and not self._pending:
+                self._cond.wait()
+            if not self.running:
+                return []
+            # Give other cameras a moment to fill the batch
+            deadline = time.monotonic() + self.max_wait
+            while self.running and len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # Oldest frames first
+            keys = sorted(self._pending, key=lambda k: self._pending[k][1])[:self.batch_size]
+            return [(k,) + self._pending.pop(k) for k in keys]
+
+    def _run(self):
+        while self.running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                detections = self.detector([item[1] for item in batch])
+            except Exception as e:
+                print(f"Inference failed: {e}")
+                continue
+            self.detect_seconds += time.monotonic() - started
+            self.batches += 1
+            self.frames += len(batch)
+            for (key, frame, captured_at, callback), boxes in zip(batch, detections):
+                try:
+                    callback(boxes, frame, captured_at)
+                except Exception as e:
+                    print(f"Detection handler failed for camera {key}: {e}")
+
+
+class OccupancyTracker:
+    """
+    Debounced occupancy state for one camera's slots.
+
+    A slot only flips after `debounce_frames` consecutive observations disagree
+    with its current state, so detector flicker never reaches the database.
+    `saved` is the state last written to the database.
+    """
+
+    def __init__(self, initial_state, debounce_frames: int = SLOT_DEBOUNCE_FRAMES):
+        self.state = np.asarray(initial_state, dtype=bool).copy()
+        self.saved = self.state.copy()
+        self.debounce_frames = max(1, debounce_frames)
+        self._streak = np.zeros(len(self.state), dtype=np.int32)
+        self.observations = 0
+        self.writes = 0
+        self.flickers = 0
+
+    @property
+    def suppressed(self) -> int:
+        """
+        Slot observations that did not turn into a database write.
+        """
+        return self.observations - self.writes
+
+    @property
+    def pending(self) -> np.ndarray:
+        """
+        Slots with disagreeing observations that have not flipped yet.
+        """
+        return self._streak > 0
+
+    @property
+    def unsaved(self) -> np.ndarray:
+        """
+        Slots whose debounced state differs from the database.
+        """
+        return self.state != self.saved
+
+    def mark_saved(self, indices):
+        self.saved[indices] = self.state[indices]
+
+    def update(self, observed, seen=None) -> np.ndarray:
+        """
+        Feeds one frame of raw occupancy. `seen` limits it to the slots the frame covered;
+        the others keep their state and streaks. Returns indices of slots whose state flipped.
+        """
+        observed = np.asarray(observed, dtype=bool)
+        seen = np.ones(len(observed), dtype=bool) if seen is None else np.asarray(seen, dtype=bool)
+        differs = (observed != self.state) & seen
+        # Disagreements that reverted before reaching the threshold
+        self.flickers += int(np.count_nonzero(~differs & seen & (self._streak > 0)))
+        self._streak = np.where(differs, self._streak + 1, np.where(seen, 0, self._streak))
+        flip = self._streak >= self.debounce_frames
+
+        self.state[flip] = observed[flip]
+        self._streak[flip] = 0
+        changed = np.flatnonzero(flip)
+        self.observations += int(np.count_nonzero(seen))
+        self.writes += len(changed)
+        return changed
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_inference_worker():
+    """
+    Returns the process-wide inference worker, loading the model on first use.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            if load_yolo() is None:
+                return None
+            try:
+                if CAMERA_INFERENCE_PROCESSES > 0:
+                    detector = ProcessPoolDetector(CAMERA_INFERENCE_PROCESSES)
+                else:
+                    detector = YoloDetector()
+            except Exception as e:
+                print(f"Failed to load YOLO model: {e}")
+                return None
+            _worker = InferenceWorker(detector, concurrency=max(1, CAMERA_INFERENCE_PROCESSES))
+            _worker.start()
+        return _worker
+
+def warm_up_inference(frame_shape=(640, 640, 3)) -> bool:
+    """
+    Loads the shared model and runs one blank frame through it, so the first real
+    frame does not pay for lazy initialisation. Returns False if no model is available.
+    """
+    worker = get_inference_worker()
+    if worker is None:
+        return False
+    started = time.monotonic()
+    frames = [np.zeros(frame_shape, dtype=np.uint8)]
+    if hasattr(worker.detector, "warm_up"):
+        worker.detector.warm_up(frames)
+    else:
+        worker.detector(frames)
+    print(f"Inference model warmed up in {time.monotonic() - started:.1f}s")
+    return True
+
+def stop_inference_worker(timeout: float = None):
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop(timeout)
+            _worker = None
 
-# Global dictionary to stop threads
-active_cameras = {}
 
 class CameraAnalyzer:
-    def __init__(self, park_id: int, rtsp_url: str):
+    def __init__(self, park_id: int, source, rois=None, fps: float = CAMERA_FPS, worker: InferenceWorker = None):
+        """
+        `source` is an RTSP URL, a local video path or a frame source object.
+        `rois` maps slot_id -> polygon [[x, y], ...] in frame pixels; if omitted
+        they are loaded from the slots table when the stream starts.
+        """
         self.park_id = park_id
-        self.rtsp_url = rtsp_url
+        self.source = source
+        self.fps = fps
+        self.worker = worker
         self.running = False
+        self._rois = rois
+        self._mask = None
+        self.tracker = None
+        self.debounce_frames = SLOT_DEBOUNCE_FRAMES
+        self._thread = None
+        self._result_thread = None
+        self._results = queue.Queue(maxsize=CAMERA_RESULT_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self._source_changed = False
+
+        self.state = "starting"
+        self.error = None
+        self.started_at = None
+        self.reconnects = 0
+        self.last_frame_at = None
+        self.frames_captured = 0
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.last_latency = None
+        self.last_write_latency = None # Frame capture to committed slot update
+        self.writes_committed = 0
+        self.write_errors = 0
+
+        self.motion_gating = MOTION_GATE_ENABLED
+        self._gate = None
+        self._last_refresh = 0.0
+        self.motion_checked = 0
+        self.motion_skipped = 0
+        self.motion_cropped = 0
+        self.motion_cpu_seconds = 0.0
+
+    @property
+    def rtsp_url(self):
+        return self.source if isinstance(self.source, str) else None
+
+    def set_source(self, source):
+        """
+        Switches the stream without restarting the analyzer; the capture loop reopens on its next iteration.
+        """
+        self.source = source
+        self._source_changed = True
+
+    def set_rois(self, rois):
+        """
+        Replaces the slot ROIs; the mask is rebuilt from the next frame.
+        """
+        self._rois = rois
+        self._mask = None
+        self._gate = None
+        self.tracker = None
+
+    def _load_rois(self):
+        db = database.WorkerSessionLocal()
         try:
-            self.model = YOLO('yolov8n.pt') if YOLO else None # Load model once
-        except Exception as e:
-            print(f"Failed to load YOLO model: {e}")
-            self.model = None
+            return crud.get_slot_rois(db, self.park_id)
+        finally:
+            db.close()
 
     def start(self):
+        if self.worker is None:
+            self.worker = get_inference_worker()
+        if self.worker is None:
+            print(f"No inference model available, not analysing Park {self.park_id}")
+            return False
         self.running = True
-        thread = threading.Thread(target=self._process_stream)
-        thread.start()
+        self.started_at = time.monotonic()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._process_stream, name=f"camera-{self.park_id}", daemon=True)
+        self._result_thread = threading.Thread(target=self._process_results, name=f"camera-{self.park_id}-results", daemon=True)
+        self._thread.start()
+        self._result_thread.start()
+        return True
 
     def stop(self):
+        # Also fences a thread still blocked in grab(): once it returns it neither submits
+        # frames nor applies detections, even if a replacement analyzer is running
         self.running = False
+        self._stop_event.set()
+        if self.worker is not None:
+            self.worker.discard(self.park_id)
 
-    def _process_stream(self):
-        # cap = cv2.VideoCapture(self.rtsp_url) 
-        # For demo, we might fail to open RTSP so we Mock or handle gracefully
-        
-        db_gen = database.get_db()
-        db = next(db_gen)
+    def join(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+        if self._result_thread:
+            self._result_thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
 
+    def _process_stream(self):
         print(f"Starting analysis for Park {self.park_id}")
-        
-        while self.running:
-            # ret, frame = cap.read()
-            # if not ret:
-            #     # Handle reconnection
-            #     time.sleep(5)
-            #     continue
-
-            # Run YOLO inference
-            # results = self.model(frame)
-            
-            # Logic to Map bounding boxes to predefined Slots (ROIs)
-            # This is complex and requires setup (defining coordinates for each slot)
-            
-            # MOCK LOGIC for demo:
-            # Randomly flip slot status to simulate real-time updates
-            import random
-            slots = db.query(models.Slot).filter(models.Slot.park_id == self.park_id).all()
-            if slots:
-                slot = random.choice(slots)
-                # Toggle status
-                new_status = not slot.is_occupied
-                crud.update_slot_status(db, slot.id, new_status)
-                
-                # Log event if it became occupied
-                if new_status:
-                    log = models.Log(
-                        park_id=self.park_id,
-                        event_type="entry",
-                        description=f"Vehicle detected in slot {slot.slot_number}"
-                    )
-                    db.add(log)
-                    db.commit()
-
-            time.sleep(10) # Poll every 10s
-
-        # cap.release()
+        try:
+            self._capture_loop()
+        except Exception as e:
+            # Left for the supervisor to notice and restart
+            self.error = str(e)
+            self.state = "crashed"
+            print(f"Analysis for Park {self.park_id} crashed: {e}")
+            return
+        self.state = "stopped"
         print(f"Stopped analysis for Park {self.park_id}")
 
-def start_analysis(park_id: int, rtsp_url: str):
-    if park_id in active_cameras:
-        return # Already running
-    
-    analyzer = CameraAnalyzer(park_id, rtsp_url)
-    active_cameras[park_id] = analyzer
-    analyzer.start()
+    def _capture_loop(self):
+        if self._rois is None:
+            self._rois = self._load_rois()
+        interval = 1.0 / self.fps if self.fps else 0.0
+        last_submit = 0.0
+        backoff = CAMERA_RECONNECT_MIN_SECONDS
+        src = open_source(self.source)
+
+        while self.running:
+            if self._source_changed:
+                self._source_changed = False
+                src.release()
+                src = open_source(self.source)
+
+            # Grab continuously so the decoder never falls behind the live stream,
+            # but only decode and submit frames within the per-camera budget
+            if not src.is_opened() or not src.grab():
+                src.release()
+                self.state = "reconnecting"
+                self.reconnects += 1
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, CAMERA_RECONNECT_MAX_SECONDS)
+                src = open_source(self.source)
+                continue
+            backoff = CAMERA_RECONNECT_MIN_SECONDS
+            self.state = "running"
+            self.last_frame_at = time.monotonic()
+            self.frames_captured += 1
+
+            now = time.monotonic()
+            if now - last_submit < interval:
+                continue
+            frame = src.retrieve()
+            if frame is None or not self.running:
+                continue
+            last_submit = now
+            submit, region, small = self._gate_frame(frame, now)
+            if not submit:
+                continue
+            image = frame
+            if region is not None:
+                x1, y1, x2, y2 = region
+                image = np.ascontiguousarray(frame[y1:y2, x1:x2])
+            self.frames_submitted += 1
+            callback = self._detections_callback(frame, region, small)
+            if self.worker.submit(self.park_id, image, time.time(), callback):
+                self.frames_dropped += 1
+
+        src.release()
+
+    def _gate_frame(self, frame, now: float):
+        """
+        Returns (submit, region, shrunk frame). `region` is the crop to run detection on,
+        None for the whole frame. Every frame is submitted whole until the slot mask exists.
+        """
+        mask, tracker = self._mask, self.tracker
+        if not self.motion_gating or mask is None or tracker is None or mask.frame_shape != frame.shape[:2]:
+            return True, None, None
+        started = time.thread_time()
+        gate = self._gate
+        if gate is None or gate.mask is not mask:
+            gate = self._gate = vision.MotionGate(mask, MOTION_THRESHOLD, MOTION_PIXEL_DELTA,
+                                                  MOTION_CROP_MARGIN, MOTION_MAX_CROP_FRACTION)
+        small = gate.shrink(frame)
+        submit, region = True, None
+        if now - self._last_refresh < MOTION_REFRESH_SECONDS:
+            # Slots still being debounced or not yet written need further frames even when nothing moves
+            slots = gate.changed(small) | tracker.pending | tracker.unsaved
+            submit = bool(slots.any())
+            region = gate.crop(slots) if submit else None
+        self.motion_checked += 1
+        self.motion_skipped += not submit
+        self.motion_cropped += region is not None
+        self.motion_cpu_seconds += time.thread_time() - started
+        return submit, region, small
+
+    def _detections_callback(self, frame, region, small):
+        # Runs on the shared inference thread, so only hands the result over to this camera
+        def callback(boxes, image, captured_at):
+            try:
+                self._results.put_nowait((boxes, frame, captured_at, region, small))
+            except queue.Full:
+                self.frames_dropped += 1
+        return callback
+
+    def _process_results(self):
+        while self.running:
+            try:
+                result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._on_detections(*result)
+            except Exception as e:
+                print(f"Detection handler failed for camera {self.park_id}: {e}")
+
+    def _on_detections(self, boxes, frame, captured_at: float, region=None, small=None):
+        if not self.running:
+            return # Stopped or replaced while this frame was queued
+        self.frames_processed += 1
+        self.last_latency = time.time() - captured_at
+        if not self._rois:
+            return
+
+        mask, tracker = self._mask, self.tracker
+        if mask is None or mask.frame_shape != frame.shape[:2]:
+            # Rasterize once per stream resolution and resume from the stored slot states
+            mask = vision.SlotMask(self._rois, frame.shape)
+            tracker = OccupancyTracker(self._load_slot_states(mask.slot_ids), self.debounce_frames)
+            self._mask, self.tracker = mask, tracker
+
+        gate = self._gate
+        if gate is not None and gate.mask is not mask:
+            gate = None
+        seen = None
+        if region is not None:
+            if gate is None:
+                return # ROIs were reloaded while this crop was in flight
+            # Boxes are relative to the crop, and only slots inside it were looked at
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4) + np.array(region[:2] * 2, dtype=np.float32)
+            seen = gate.covered(region)
+        else:
+            self._last_refresh = time.monotonic()
+        if gate is not None and small is not None:
+            gate.reference = small
+
+        tracker.update(mask.occupancy(boxes, SLOT_IOU_THRESHOLD), seen)
+        # Diffed against the last successful write, so a failed one is retried on the next frame
+        changed = np.flatnonzero(tracker.unsaved)
+        if not len(changed):
+            return
+
+        db = database.WorkerSessionLocal()
+        try:
+            log_ids = crud.apply_slot_changes(db, self.park_id, {
+                int(mask.slot_ids[i]): bool(tracker.state[i]) for i in changed.tolist()
+            })
+        except Exception as e:
+            self.write_errors += 1
+            print(f"Slot update for Park {self.park_id} failed, retrying: {e}")
+            return
+        finally:
+            db.close()
+        tracker.mark_saved(changed)
+        self.writes_committed += 1
+        self.last_write_latency = time.time() - captured_at
+        if snapshots.SNAPSHOTS_ENABLED:
+            # The frame that triggered the change is kept as evidence for its logs
+            snapshots.encoder.submit(self.park_id, frame, log_ids)
+
+    def _load_slot_states(self, slot_ids):
+        db = database.WorkerSessionLocal()
+        try:
+            states = crud.get_slot_states(db, slot_ids.tolist())
+        finally:
+            db.close()
+        return np.array([states.get(int(i), False) for i in slot_ids], dtype=bool)
+
+    def stats(self):
+        tracker = self.tracker
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_submitted": self.frames_submitted,
+            "frames_dropped": self.frames_dropped,
+            "frames_processed": self.frames_processed,
+            "last_latency": self.last_latency,
+            "last_write_latency": self.last_write_latency,
+            "write_errors": self.write_errors,
+            "slot_writes": tracker.writes if tracker else 0,
+            "suppressed_writes": tracker.suppressed if tracker else 0,
+            "suppressed_flickers": tracker.flickers if tracker else 0,
+            **self.motion_stats(),
+        }
+
+    def motion_stats(self):
+        """
+        How often the motion gate skipped or cropped inference, and the model time that saved
+        net of the gate's own CPU time, estimated from the worker's mean time per frame.
+        """
+        per_frame = self.worker.seconds_per_frame if self.worker is not None else None
+        return {
+            "motion_checked": self.motion_checked,
+            "motion_skipped": self.motion_skipped,
+            "motion_cropped": self.motion_cropped,
+            "motion_skip_ratio": self.motion_skipped / self.motion_checked if self.motion_checked else None,
+            "motion_gate_cpu_seconds": self.motion_cpu_seconds,
+            "motion_saved_seconds": self.motion_skipped * per_frame - self.motion_cpu_seconds if per_frame else None,
+        }
+
+
+class CameraSupervisor:
+    """
+    Owns every CameraAnalyzer in this process.
+
+    At most `max_workers` analyzers run at once; further cameras wait in a queue
+    until capacity frees up. A background thread restarts analyzers that crashed
+    or stopped producing frames, with exponential backoff between attempts.
+    """
+
+    def __init__(self, max_workers: int = CAMERA_MAX_WORKERS, check_interval: float = CAMERA_SUPERVISOR_INTERVAL,
+                 stall_seconds: float = CAMERA_STALL_SECONDS, worker: InferenceWorker = None):
+        self.max_workers = max_workers
+        self.check_interval = check_interval
+        self.stall_seconds = stall_seconds
+        self.worker = worker
+        self.cameras = {}
+        self.queued = OrderedDict()
+        self._restarts = {}
+        self._restart_at = {}
+        self._fps = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._supervise, name="camera-supervisor", daemon=True)
+            self._thread.start()
+
+    def _launch(self, park_id: int, source, rois=None) -> bool:
+        analyzer = CameraAnalyzer(park_id, source, rois=rois, worker=self.worker)
+        if not analyzer.start():
+            return False
+        self.cameras[park_id] = analyzer
+        return True
+
+    def start(self, park_id: int, source, rois=None) -> bool:
+        """
+        Starts analysis for a park, or hot-swaps the stream if it is already running.
+        Returns False if the camera was queued or no model is available.
+        """
+        with self._lock:
+            self._ensure_thread()
+            analyzer = self.cameras.get(park_id)
+            if analyzer is not None:
+                if analyzer.source != source:
+                    analyzer.set_source(source)
+                return True
+            if park_id in self.queued or len(self.cameras) >= self.max_workers:
+                self.queued[park_id] = (source, rois)
+                print(f"Camera budget reached, Park {park_id} queued")
+                return False
+            return self._launch(park_id, source, rois)
+
+    def stop(self, park_id: int, timeout: float = 5.0):
+        with self._lock:
+            self.queued.pop(park_id, None)
+            self._restarts.pop(park_id, None)
+            self._restart_at.pop(park_id, None)
+            self._fps.pop(park_id, None)
+            analyzer = self.cameras.pop(park_id, None)
+        if analyzer is not None:
+            analyzer.stop()
+            analyzer.join(timeout)
+
+    def reload_rois(self, park_id: int, rois):
+        with self._lock:
+            analyzer = self.cameras.get(park_id)
+            if analyzer is not None:
+                analyzer.set_rois(rois)
+            elif park_id in self.queued:
+                self.queued[park_id] = (self.queued[park_id][0], rois)
+
+    def _restart(self, park_id: int, analyzer: CameraAnalyzer, reason: str):
+        restarts = self._restarts.get(park_id, 0) + 1
+        self._restarts[park_id] = restarts
+        print(f"Restarting analysis for Park {park_id} ({reason}), attempt {restarts}")
+        # A stalled thread may stay blocked in grab() for long, so it is fenced by stop()
+        # rather than joined while holding the lock
+        analyzer.stop()
+        del self.cameras[park_id]
+        if not self._launch(park_id, analyzer.source, analyzer._rois):
+            # Keep the slot reserved and retry later
+            self.cameras[park_id] = analyzer
+        delay = min(CAMERA_RECONNECT_MIN_SECONDS * 2 ** restarts, CAMERA_RECONNECT_MAX_SECONDS)
+        self._restart_at[park_id] = time.monotonic() + delay
+
+    def check(self):
+        """
+        One supervision pass: restart crashed or stalled analyzers and start queued ones.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for park_id, analyzer in list(self.cameras.items()):
+                # Processed frames per second since the previous pass
+                previous = self._fps.get(park_id)
+                fps = None
+                if previous and now > previous[0]:
+                    fps = (analyzer.frames_processed - previous[1]) / (now - previous[0])
+                self._fps[park_id] = (now, analyzer.frames_processed, fps)
+
+                if now < self._restart_at.get(park_id, 0):
+                    continue
+                if not analyzer.is_alive():
+                    self._restart(park_id, analyzer, analyzer.error or "thread exited")
+                elif (analyzer.state == "running" and analyzer.last_frame_at is not None
+                        and now - analyzer.last_frame_at > self.stall_seconds):
+                    self._restart(park_id, analyzer, "stalled")
+                elif analyzer.state == "running" and now - analyzer.started_at >= CAMERA_STABLE_SECONDS:
+                    self._restarts.pop(park_id, None)
+
+            while self.queued and len(self.cameras) < self.max_workers:
+                park_id, (source, rois) = self.queued.popitem(last=False)
+                if not self._launch(park_id, source, rois):
+                    # Back at the head of the queue, retried on the next pass
+                    self.queued[park_id] = (source, rois)
+                    self.queued.move_to_end(park_id, last=False)
+                    break
+
+    def _supervise(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Camera supervisor error: {e}")
+
+    def health(self, park_id: int = None):
+        """
+        Per-camera state, throughput and lag. RTSP URLs are left out since they carry credentials.
+        """
+        now = time.monotonic()
+        with self._lock:
+            report = {}
+            for pid, analyzer in self.cameras.items():
+                if park_id is not None and pid != park_id:
+                    continue
+                fps = self._fps.get(pid)
+                report[pid] = {
+                    "state": analyzer.state,
+                    "error": analyzer.error,
+                    "fps": fps[2] if fps else None,
+                    "lag_seconds": now - analyzer.last_frame_at if analyzer.last_frame_at else None,
+                    "restarts": self._restarts.get(pid, 0),
+                    "reconnects": analyzer.reconnects,
+                    **analyzer.stats(),
+                }
+            for pid in self.queued:
+                if park_id is None or pid == park_id:
+                    report[pid] = {"state": "queued"}
+            return report
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        Stops every analyzer, the shared inference worker and the snapshot encoders. Called on application shutdown.
+        """
+        self._stop_event.set()
+        with self._lock:
+            analyzers = list(self.cameras.values())
+            self.cameras.clear()
+            self.queued.clear()
+        for analyzer in analyzers:
+            analyzer.stop()
+        for analyzer in analyzers:
+            analyzer.join(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        stop_inference_worker(timeout)
+        snapshots.encoder.stop(timeout)
+
+
+supervisor = CameraSupervisor()
+# Running analyzers by park id
+active_cameras = supervisor.cameras
+
+
+def start_analysis(park_id: int, rtsp_url: str, rois=None):
+    if not rtsp_url:
+        stop_analysis(park_id)
+        return
+    supervisor.start(park_id, rtsp_url, rois=rois)
+
+def reload_rois(park_id: int, rois):
+    supervisor.reload_rois(park_id, rois)
 
 def stop_analysis(park_id: int):
-    if park_id in active_cameras:
-        active_cameras[park_id].stop()
-        del active_cameras[park_id]
+    supervisor.stop(park_id)
@@ -0,0 +1,115 @@
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+from . import events
+
+# "all" runs camera analysis inside the API process. "api" never loads the camera
+# pipeline and sends commands to separate "camera" processes (python -m app.worker)
+# over the event bus. Any role other than "all" needs REDIS_URL: without it the bus is
+# in-process and commands would never reach a worker.
+APP_ROLE = os.getenv("APP_ROLE", "all")
+APP_ROLES = ("all", "api", "camera")
+CONTROL_TOPIC = "camera:control"
+HEALTH_TOPIC = "camera:health"
+# How often camera workers publish their health; reports older than three intervals are dropped
+CAMERA_HEALTH_INTERVAL = float(os.getenv("CAMERA_HEALTH_INTERVAL", "10"))
+
+_health = {}
+_health_lock = threading.Lock()
+_unsubscribe_health = None
+
+
+def is_local() -> bool:
+    return APP_ROLE != "api"
+
+
+def _camera():
+    # Imported on first use so API processes that never touch a camera skip its dependencies
+    return importlib.import_module(f"{__package__}.camera")
+
+
+def _send(action: str, park_id: int):
+    # Only the park id goes over the bus; workers read the stream URL and ROIs from the
+    # database so credentials never leave it
+    events.publish(CONTROL_TOPIC, {"action": action, "park_id": park_id})
+
+
+def start_analysis(park_id: int, rtsp_url: str, rois=None):
+    if is_local():
+        _camera().start_analysis(park_id, rtsp_url, rois=rois)
+    else:
+        _send("start" if rtsp_url else "stop", park_id)
+
+
+def reload_rois(park_id: int, rois):
+    if is_local():
+        _camera().reload_rois(park_id, rois)
+    else:
+        _send("reload_rois", park_id)
+
+
+def stop_analysis(park_id: int):
+    if is_local():
+        _camera().stop_analysis(park_id)
+    else:
+        _send("stop", park_id)
+
+
+def _on_health(topic: str, payload: str):
+    report = json.loads(payload)
+    received = time.monotonic()
+    with _health_lock:
+        for park_id, state in report.get("cameras", {}).items():
+            _health[int(park_id)] = (received, state)
+
+
+def health(park_id: int):
+    """
+    Analyzer health of one park, or None if no camera is running for it.
+    """
+    if is_local():
+        if f"{__package__}.camera" not in sys.modules:
+            return None
+        return _camera().supervisor.health(park_id).get(park_id)
+
+    with _health_lock:
+        received, state = _health.get(park_id, (None, None))
+    if received is None or time.monotonic() - received > 3 * CAMERA_HEALTH_INTERVAL:
+        return None
+    return state
+
+
+def check_role():
+    """
+    Raises RuntimeError if APP_ROLE is unknown, or split across processes without REDIS_URL.
+    """
+    if APP_ROLE not in APP_ROLES:
+        raise RuntimeError(f"APP_ROLE must be one of {', '.join(APP_ROLES)}, not {APP_ROLE!r}")
+    if APP_ROLE != "all" and not events.REDIS_URL:
+        raise RuntimeError(f"APP_ROLE={APP_ROLE} needs REDIS_URL to reach the other processes")
+
+
+def start():
+    """
+    Called on application startup. API-only processes start collecting worker health reports.
+    """
+    global _unsubscribe_health
+    if not is_local() and _unsubscribe_health is None:
+        _unsubscribe_health = events.bus.subscribe(HEALTH_TOPIC, _on_health)
+
+
+def shutdown():
+    """
+    Stops the camera pipeline if this process ever started it.
+    """
+    global _unsubscribe_health
+    if _unsubscribe_health is not None:
+        _unsubscribe_health()
+        _unsubscribe_health = None
+    camera = sys.modules.get(f"{__package__}.camera")
+    if camera is not None:
+        camera.supervisor.shutdown()
@@ -1,7 +1,12 @@
-from sqlalchemy.orm import Session
-from . import models, schemas, auth
-from datetime import datetime
-from geopy.distance import geodesic
+from sqlalchemy import case, delete, func, insert, update, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from . import models, schemas, auth, geo, events, allocator, analytics, database, provisioning, scheduler
+from datetime import datetime, timezone
+from itertools import islice
+import base64
+import csv
+import io
+import numpy as np
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -14,52 +19,172 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
-def create_park(db: Session, park: schemas.ParkCreate, user_id: str):
+# Slot rows per INSERT statement when COPY is not available
+SLOT_INSERT_CHUNK_SIZE = 1000
+
+def insert_slots(db: Session, park_id: int, layout, start: int, count: int):
+    """
+    Adds `count` slots to a park, named from position `start` on, in the caller's
+    transaction. Postgres streams them with COPY; other databases use chunked executemany.
+    """
+    if count <= 0:
+        return
+    names = provisioning.slot_names(layout, start, count)
+    now = datetime.utcnow()
+    if db.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for name in names:
+            writer.writerow((park_id, name, "f", now.isoformat()))
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY slots (park_id, slot_number, is_occupied, last_updated) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+        return
+    while chunk := list(islice(names, SLOT_INSERT_CHUNK_SIZE)):
+        db.execute(insert(models.Slot), [
+            {"park_id": park_id, "slot_number": name, "is_occupied": False, "last_updated": now}
+            for name in chunk
+        ])
+
+def _new_park(park: schemas.ParkCreate, user_id: str):
     # Encrypt RTSP url here if needed (using Fernet)
     # For simplicity, we store it as is, but in prod use encryption
-    db_park = models.Park(**park.dict(exclude={"id"}), owner_id=user_id)
+    return models.Park(
+        **park.dict(exclude={"id", "camera_rtsp_url", "slot_layout"}),
+        camera_rtsp_url_encrypted=park.camera_rtsp_url,
+        slot_layout=park.slot_layout.dict(exclude_none=True) if park.slot_layout else None,
+        owner_id=user_id
+    )
+
+def create_park(db: Session, park: schemas.ParkCreate, user_id: str):
+    db_park = _new_park(park, user_id)
     db.add(db_park)
+    db.flush()
+    insert_slots(db, db_park.id, db_park.slot_layout, 0, park.total_slots)
     db.commit()
     db.refresh(db_park)
-    
-    # Create slots
-    for i in range(1, park.total_slots + 1):
-        slot = models.Slot(park_id=db_park.id, slot_number=f"A{i}")
-        db.add(slot)
-    db.commit()
-    
+
+    geo.park_index.upsert(db_park.id, db_park.latitude, db_park.longitude)
     return db_park
 
+def bulk_create_parks(db: Session, parks, user_id: str):
+    """
+    Creates a batch of parks and all their slots in one transaction. Parks are inserted
+    together (one multi-row INSERT where the database supports RETURNING), slots in bulk.
+    Returns the created parks.
+    """
+    db_parks = [_new_park(park, user_id) for park in parks]
+    db.add_all(db_parks)
+    db.flush()
+    for db_park in db_parks:
+        insert_slots(db, db_park.id, db_park.slot_layout, 0, db_park.total_slots)
+    db.commit()
+    for db_park in db_parks:
+        geo.park_index.upsert(db_park.id, db_park.latitude, db_park.longitude)
+    return db_parks
+
+def resize_slots(db: Session, park: models.Park, total_slots: int):
+    """
+    Adds or removes slots so the park has `total_slots`, in the caller's transaction.
+    New slots continue the park's naming scheme. Only the newest slots that are free and
+    have never been booked can be removed; returns False (changing nothing) otherwise.
+    """
+    current = db.query(func.count(models.Slot.id)).filter(models.Slot.park_id == park.id).scalar()
+    if total_slots > current:
+        insert_slots(db, park.id, park.slot_layout, current, total_slots - current)
+    elif total_slots < current:
+        excess = current - total_slots
+        newest = db.query(models.Slot.id, models.Slot.is_occupied).filter(
+            models.Slot.park_id == park.id
+        ).order_by(models.Slot.id.desc()).limit(excess).all()
+        ids = [slot_id for slot_id, _ in newest]
+        booked = db.query(models.Booking.id).filter(models.Booking.slot_id.in_(ids)).first()
+        if booked or any(occupied for _, occupied in newest):
+            return False
+        db.execute(update(models.Log).where(models.Log.slot_id.in_(ids)).values(slot_id=None))
+        db.execute(delete(models.SlotUsageStat).where(models.SlotUsageStat.slot_id.in_(ids)))
+        db.execute(delete(models.Slot).where(models.Slot.id.in_(ids)))
+        allocator.free_slots.discard(park.id)
+    park.total_slots = total_slots
+    return True
+
 def get_parks(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Park).offset(skip).limit(limit).all()
 
 def get_park(db: Session, park_id: int):
     return db.query(models.Park).filter(models.Park.id == park_id).first()
 
-def get_nearby_parks(db: Session, lat: float, lon: float, radius_km: float = 5.0):
-    parks = db.query(models.Park).all()
-    nearby = []
-    user_loc = (lat, lon)
+def _ensure_park_index(db: Session):
+    if not geo.park_index.is_fresh():
+        rows = db.query(models.Park.id, models.Park.latitude, models.Park.longitude).all()
+        geo.park_index.load(rows)
+
+# Index candidates rechecked beyond the requested page, so parks dropped by the
+# recheck (their stored coordinates moved since the index was built) do not shorten it
+NEARBY_RECHECK_MARGIN = 20
+
+def get_nearby_parks(db: Session, lat: float, lon: float, radius_km: float = 5.0, skip: int = 0, limit: int = 100):
+    # Grid lookup narrows the search to parks in cells around the user,
+    # then exact distances are computed in one vectorized pass
+    _ensure_park_index(db)
+    ids, lats, lons = geo.park_index.candidates(lat, lon, radius_km)
+    distances = geo.haversine_km(lat, lon, lats, lons)
+    within = distances <= radius_km
+    ordered = ids[within][np.argsort(distances[within], kind="stable")].tolist()
+
+    # Candidates are rechecked against their stored coordinates before paging; the bounding
+    # box drops rows that moved, and more candidates are read until the page is full
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_km)
+    wanted = skip + limit
+    found = {}
+    start = 0
+    while start < len(ordered) and len(found) < wanted:
+        chunk = ordered[start:start + wanted - len(found) + NEARBY_RECHECK_MARGIN]
+        start += len(chunk)
+        rows = db.query(models.Park.id, models.Park.latitude, models.Park.longitude).filter(
+            models.Park.id.in_(chunk),
+            models.Park.latitude.between(min_lat, max_lat),
+            models.Park.longitude.between(min_lon, max_lon),
+        ).all()
+        if not rows:
+            continue
+        exact = geo.haversine_km(
+            lat, lon,
+            np.array([row.latitude for row in rows], dtype=np.float64),
+            np.array([row.longitude for row in rows], dtype=np.float64),
+        )
+        found.update((row.id, distance) for row, distance in zip(rows, exact.tolist()) if distance <= radius_km)
+    page = sorted(found.items(), key=lambda item: item[1])[skip:skip + limit]
+    if not page:
+        return []
+
+    # Only the requested page is loaded, with the slots of all its parks in one more query
+    distance_of = dict(page)
+    parks = db.query(models.Park).options(selectinload(models.Park.slots)).filter(
+        models.Park.id.in_(list(distance_of))
+    ).all()
     for park in parks:
-        park_loc = (park.latitude, park.longitude)
-        if hasattr(park, 'latitude') and park.latitude:
-             distance = geodesic(user_loc, park_loc).km
-             if distance <= radius_km:
-                 park.distance = distance
-                 nearby.append(park)
-    return nearby
+        park.distance = distance_of[park.id]
+    parks.sort(key=lambda p: p.distance)
+    return parks
 
 def create_booking(db: Session, booking: schemas.BookingCreate, user_id: str):
-    # Use specific slot if provided, else find first free
-    if booking.slot_id:
-        slot = db.query(models.Slot).filter(models.Slot.id == booking.slot_id, models.Slot.is_occupied == False).first()
-    else:
-        slot = db.query(models.Slot).filter(models.Slot.park_id == booking.park_id, models.Slot.is_occupied == False).first()
-        
-    if not slot:
-        return None
-    
     park = get_park(db, booking.park_id)
+    if not park:
+        return None
+
+    # Atomically claim the requested slot, else any free one
+    slot_id = allocator.allocate_slot(db, booking.park_id, booking.slot_id)
+    if not slot_id:
+        db.rollback()
+        return None
+    slot = db.get(models.Slot, slot_id)
+
     # Use amount from request if provided (for flexibility), else calculate
     amount = booking.amount if booking.amount else (park.hourly_rate * booking.duration_hours)
 
@@ -75,17 +200,235 @@ def create_booking(db: Session, booking: schemas.BookingCreate, user_id: str):
         status="active"
     )
     db.add(db_booking)
-    
-    # Mark slot occupied
-    slot.is_occupied = True
+    analytics.record_booking(db, slot.park_id, slot.id, amount, db_booking.start_time)
     db.commit()
     db.refresh(db_booking)
+    scheduler.expiry_scheduler.schedule(db_booking.id, db_booking.end_time)
+
+    events.publish_park_event(slot.park_id, {
+        "type": "booking", "booking_id": db_booking.id, "slot_id": slot.id,
+        "slot_number": slot.slot_number, "amount": db_booking.amount, "timestamp": db_booking.start_time
+    })
+    events.publish_park_event(slot.park_id, {
+        "type": "slot", "slot_id": slot.id, "slot_number": slot.slot_number,
+        "is_occupied": True, "timestamp": db_booking.start_time
+    })
     return db_booking
 
+def get_camera_urls(db: Session, park_ids=None):
+    """
+    Returns {park_id: stream URL} for parks with a camera configured, optionally limited to `park_ids`.
+    """
+    query = db.query(models.Park.id, models.Park.camera_rtsp_url_encrypted).filter(
+        models.Park.camera_rtsp_url_encrypted.isnot(None),
+        models.Park.camera_rtsp_url_encrypted != ""
+    )
+    if park_ids is not None:
+        query = query.filter(models.Park.id.in_(park_ids))
+    return dict(query.all())
+
+def get_slot_rois(db: Session, park_id: int):
+    """
+    Returns {slot_id: polygon} for the park's slots that have an ROI configured.
+    """
+    rows = db.query(models.Slot.id, models.Slot.roi).filter(
+        models.Slot.park_id == park_id,
+        models.Slot.roi.isnot(None)
+    ).order_by(models.Slot.id).all()
+    return {slot_id: roi for slot_id, roi in rows if roi}
+
+def set_slot_rois(db: Session, park_id: int, rois):
+    """
+    Stores ROI polygons for slots of a park. `rois` maps slot_id -> polygon (None clears it).
+    Returns False if any slot does not belong to the park.
+    """
+    slots = db.query(models.Slot).filter(
+        models.Slot.park_id == park_id,
+        models.Slot.id.in_(list(rois.keys()))
+    ).all()
+    if len(slots) != len(rois):
+        return False
+    for slot in slots:
+        slot.roi = rois[slot.id]
+    db.commit()
+    return True
+
 def update_slot_status(db: Session, slot_id: int, is_occupied: bool):
     slot = db.query(models.Slot).filter(models.Slot.id == slot_id).first()
     if slot:
         slot.is_occupied = is_occupied
         slot.last_updated = datetime.utcnow()
         db.commit()
+        if not is_occupied:
+            allocator.free_slots.push(slot.park_id, slot.id)
+        events.publish_park_event(slot.park_id, {
+            "type": "slot", "slot_id": slot.id, "slot_number": slot.slot_number,
+            "is_occupied": is_occupied, "timestamp": slot.last_updated
+        })
     return slot
+
+def get_slot_states(db: Session, slot_ids):
+    """
+    Returns {slot_id: is_occupied} for the given slots.
+    """
+    if not slot_ids:
+        return {}
+    rows = db.query(models.Slot.id, models.Slot.is_occupied).filter(models.Slot.id.in_(slot_ids)).all()
+    return {slot_id: bool(occupied) for slot_id, occupied in rows}
+
+def apply_slot_changes(db: Session, park_id: int, changes):
+    """
+    Writes a batch of camera-detected slot changes ({slot_id: is_occupied}) in one
+    transaction: one bulk slot update plus one bulk insert of entry/exit logs.
+    Returns the ids of the inserted logs.
+    """
+    if not changes:
+        return []
+    now = datetime.utcnow()
+    numbers = dict(db.query(models.Slot.id, models.Slot.slot_number).filter(models.Slot.id.in_(list(changes))).all())
+
+    db.execute(update(models.Slot), [
+        {"id": slot_id, "is_occupied": occupied, "last_updated": now}
+        for slot_id, occupied in changes.items() if slot_id in numbers
+    ])
+    logs = [
+        {
+            "park_id": park_id,
+            "slot_id": slot_id,
+            "timestamp": now,
+            "event_type": "entry" if occupied else "exit",
+            "description": f"Vehicle {'detected in' if occupied else 'left'} slot {numbers[slot_id]}",
+        }
+        for slot_id, occupied in changes.items() if slot_id in numbers
+    ]
+    log_ids = []
+    if logs:
+        log_ids = db.execute(insert(models.Log).returning(models.Log.id), logs).scalars().all()
+        analytics.record_slot_events(db, park_id, logs, now)
+    db.commit()
+    for slot_id, occupied in changes.items():
+        if not occupied and slot_id in numbers:
+            allocator.free_slots.push(park_id, slot_id)
+
+    for log in logs:
+        events.publish_park_event(park_id, {
+            "type": "slot", "slot_id": log["slot_id"], "slot_number": numbers[log["slot_id"]],
+            "is_occupied": log["event_type"] == "entry", "event_type": log["event_type"],
+            "description": log["description"], "timestamp": now
+        })
+    return log_ids
+
+def _naive_utc(ts: datetime):
+    # Timestamps are stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    """
+    Returns (timestamp, id) from a cursor produced by encode_cursor. Raises ValueError if malformed.
+    """
+    try:
+        ts, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _log_rows(park_id: int, since: datetime = None, until: datetime = None):
+    # Slot numbers come from the same statement instead of a lazy load per row
+    stmt = select(
+        models.Log.id, models.Log.park_id, models.Log.slot_id, models.Log.event_type,
+        models.Log.description, models.Log.timestamp, models.Log.snapshot_url, models.Slot.slot_number
+    ).outerjoin(models.Slot, models.Slot.id == models.Log.slot_id).where(models.Log.park_id == park_id)
+    if since is not None:
+        stmt = stmt.where(models.Log.timestamp >= _naive_utc(since))
+    if until is not None:
+        stmt = stmt.where(models.Log.timestamp < _naive_utc(until))
+    return stmt
+
+def get_logs_page(db: Session, park_id: int, limit: int = 50, cursor: str = None,
+                  since: datetime = None, until: datetime = None):
+    """
+    Newest-first page of a park's logs using (timestamp, id) keyset pagination.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    stmt = _log_rows(park_id, since, until)
+    if cursor:
+        ts, log_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(models.Log.timestamp, models.Log.id) < tuple_(ts, log_id))
+    stmt = stmt.order_by(models.Log.timestamp.desc(), models.Log.id.desc()).limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in db.execute(stmt)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, next_cursor
+
+def get_bookings_page(db: Session, user_id: str, limit: int = 50, cursor: str = None,
+                      statuses=None, since: datetime = None, until: datetime = None):
+    """
+    Newest-first page of a user's bookings with park and slot names joined in, using
+    (start_time, id) keyset pagination. Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    stmt = select(
+        models.Booking.id, models.Park.name.label("park_name"), models.Park.location.label("address"),
+        models.Slot.slot_number, models.Booking.start_time, models.Booking.end_time,
+        models.Booking.status, models.Booking.amount
+    ).outerjoin(models.Slot, models.Slot.id == models.Booking.slot_id) \
+     .outerjoin(models.Park, models.Park.id == models.Slot.park_id) \
+     .where(models.Booking.user_id == user_id)
+    if statuses:
+        stmt = stmt.where(models.Booking.status.in_(statuses))
+    if since is not None:
+        stmt = stmt.where(models.Booking.start_time >= _naive_utc(since))
+    if until is not None:
+        stmt = stmt.where(models.Booking.start_time < _naive_utc(until))
+    if cursor:
+        ts, booking_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(models.Booking.start_time, models.Booking.id) < tuple_(ts, booking_id))
+    stmt = stmt.order_by(models.Booking.start_time.desc(), models.Booking.id.desc()).limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in db.execute(stmt)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["start_time"], rows[-1]["id"])
+    return rows, next_cursor
+
+def get_booking_counts(db: Session, user_id: str):
+    """
+    Returns (total bookings, upcoming or active bookings) of a user in one pass over their bookings.
+    """
+    total, upcoming = db.query(
+        func.count(models.Booking.id),
+        func.coalesce(func.sum(case((models.Booking.status.in_(["upcoming", "active"]), 1), else_=0)), 0)
+    ).filter(models.Booking.user_id == user_id).one()
+    return total, upcoming
+
+def iter_logs(park_id: int, since: datetime = None, until: datetime = None, batch_size: int = 5000):
+    """
+    Yields a park's logs oldest-first in keyset batches, each batch in its own short
+    session, so exporting any number of rows uses constant memory.
+    """
+    last = None
+    while True:
+        stmt = _log_rows(park_id, since, until)
+        if last is not None:
+            stmt = stmt.where(tuple_(models.Log.timestamp, models.Log.id) > tuple_(*last))
+        stmt = stmt.order_by(models.Log.timestamp, models.Log.id).limit(batch_size)
+
+        db = database.SessionLocal()
+        try:
+            rows = [dict(row._mapping) for row in db.execute(stmt)]
+        finally:
+            db.close()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1]["timestamp"], rows[-1]["id"])
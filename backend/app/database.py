@@ -1,15 +1,66 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi.concurrency import run_in_threadpool
 import os
 
 # Use SQLite for local development, PostgreSQL for production
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./smartpark.db")
+IS_SQLITE = "sqlite" in SQLALCHEMY_DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+# Connection pool for API requests
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", "true")
+
+# Separate, smaller pool for camera workers and background jobs so they never starve requests
+WORKER_DB_POOL_SIZE = int(os.getenv("WORKER_DB_POOL_SIZE", "4"))
+WORKER_DB_MAX_OVERFLOW = int(os.getenv("WORKER_DB_MAX_OVERFLOW", "4"))
+
+# Opt-in async engine for hot read endpoints (needs asyncpg / aiosqlite)
+DB_ASYNC = _env_flag("DB_ASYNC", "false")
+
+def _engine_options(pool_size: int, max_overflow: int) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if IS_SQLITE:
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite" + url[url.index(":"):]
+    if url.startswith("postgres"):
+        return "postgresql+asyncpg" + url[url.index(":"):]
+    return url
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(DB_POOL_SIZE, DB_MAX_OVERFLOW))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+worker_engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(WORKER_DB_POOL_SIZE, WORKER_DB_MAX_OVERFLOW))
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(SQLALCHEMY_DATABASE_URL)
+    async_options = _engine_options(DB_POOL_SIZE, DB_MAX_OVERFLOW)
+    async_options.pop("connect_args", None)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_options)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,3 +69,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _run_with_session(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def run_read(fn, *args, **kwargs):
+    """
+    Runs `fn(session, *args, **kwargs)` for an async endpoint. With DB_ASYNC the ORM code
+    runs on the async engine without a threadpool hop; otherwise on a pooled sync session
+    in the threadpool. `fn` must return plain data, not ORM objects bound to the session.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(_run_with_session, fn, *args, **kwargs)
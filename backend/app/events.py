@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from collections import defaultdict
+
+# When set, events are shared between uvicorn workers through Redis pub/sub;
+# otherwise they only reach subscribers in the publishing process.
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_CHANNEL_PREFIX = os.getenv("REDIS_CHANNEL_PREFIX", "smartpark:")
+
+
+def park_topic(park_id: int) -> str:
+    return f"park:{park_id}"
+
+
+class InMemoryBus:
+    """
+    Topic-based pub/sub within one process.
+
+    `publish` may be called from any thread (request threads, camera workers);
+    subscriber callbacks run on the publishing thread and must not block.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, callback):
+        """
+        Registers `callback(topic, payload)` for a topic. Returns a function that unsubscribes it.
+        """
+        with self._lock:
+            self._subscribers[topic].append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(topic)
+                if callbacks and callback in callbacks:
+                    callbacks.remove(callback)
+                    if not callbacks:
+                        del self._subscribers[topic]
+        return unsubscribe
+
+    def publish(self, topic: str, event: dict):
+        self._dispatch(topic, json.dumps(event, default=str))
+
+    def _dispatch(self, topic: str, payload: str):
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                print(f"Event subscriber for {topic} failed: {e}")
+
+    def close(self):
+        pass
+
+
+class RedisBus(InMemoryBus):
+    """
+    Publishes through Redis so every worker process sees every event. A listener
+    thread receives all channels under the prefix and dispatches them to local subscribers.
+    """
+
+    def __init__(self, url: str, prefix: str = REDIS_CHANNEL_PREFIX):
+        super().__init__()
+        import redis
+
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.psubscribe(**{self.prefix + "*": self._handle})
+            self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=self._on_error)
+
+    def _on_error(self, e, pubsub, thread):
+        print(f"Redis event listener error: {e}")
+
+    def subscribe(self, topic: str, callback):
+        self._ensure_listener()
+        return super().subscribe(topic, callback)
+
+    def publish(self, topic: str, event: dict):
+        try:
+            self.client.publish(self.prefix + topic, json.dumps(event, default=str))
+        except Exception as e:
+            print(f"Failed to publish event to Redis: {e}")
+
+    def _handle(self, message):
+        channel = message["channel"].decode() if isinstance(message["channel"], bytes) else message["channel"]
+        data = message["data"].decode() if isinstance(message["data"], bytes) else message["data"]
+        self._dispatch(channel[len(self.prefix):], data)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._pubsub.close()
+
+
+bus = RedisBus(REDIS_URL) if REDIS_URL else InMemoryBus()
+
+
+def publish(topic: str, event: dict):
+    bus.publish(topic, event)
+
+
+def publish_park_event(park_id: int, event: dict):
+    bus.publish(park_topic(park_id), {"park_id": park_id, **event})
@@ -0,0 +1,225 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+from . import database, models
+
+# Weeks of history folded into each hour-of-week profile
+FORECAST_HISTORY_WEEKS = int(os.getenv("FORECAST_HISTORY_WEEKS", "4"))
+FORECAST_HORIZON_MINUTES = int(os.getenv("FORECAST_HORIZON_MINUTES", "30"))
+FORECAST_INTERVAL_SECONDS = float(os.getenv("FORECAST_INTERVAL_SECONDS", "300"))
+# Parks whose history is loaded per query during a rebuild
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "200"))
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def week_start(ts: datetime) -> datetime:
+    """
+    Monday 00:00 of the week containing `ts`.
+    """
+    return datetime.combine((ts - timedelta(days=ts.weekday())).date(), datetime.min.time())
+
+
+def _hour_index(timestamps, since: datetime) -> np.ndarray:
+    ts = np.array(timestamps, dtype="datetime64[s]")
+    return ((ts - np.datetime64(since, "s")) // np.timedelta64(1, "h")).astype(np.int64)
+
+
+def _hourly_levels(row, start, end, delta, parks: int, hours: int) -> np.ndarray:
+    """
+    Per-hour level of each park row: every interval adds `delta` from hour `start` until
+    hour `end`. One difference array and one cumsum cover every park at once.
+    """
+    levels = np.zeros((parks, hours + 1), dtype=np.int32)
+    np.add.at(levels, (row, np.clip(start, 0, hours)), delta)
+    np.add.at(levels, (row, np.clip(end, 0, hours)), -delta)
+    return np.cumsum(levels, axis=1)[:, :hours]
+
+
+def build_profiles(db, parks, now: datetime = None):
+    """
+    Hour-of-week occupancy profiles for `parks` [(park_id, total_slots)]: the fraction of
+    slots occupied in each of the 168 hours of the week, averaged over the history window.
+    Hourly occupancy is the larger of booked slots and camera-observed slots. Returns
+    {park_id: float16 array of 168}; parks without capacity or without any booking or
+    camera event in the window are left out, so they get no forecast rather than a flat one.
+    """
+    now = now or datetime.utcnow()
+    since = week_start(now) - timedelta(weeks=FORECAST_HISTORY_WEEKS)
+    hours = int((now - since).total_seconds() // 3600) + 1
+    parks = [(park_id, total) for park_id, total in parks if total]
+    if not parks:
+        return {}
+    rows = {park_id: i for i, (park_id, _) in enumerate(parks)}
+    ids = list(rows)
+
+    booked = db.execute(
+        select(models.Slot.park_id, models.Booking.start_time, models.Booking.end_time)
+        .join(models.Slot, models.Slot.id == models.Booking.slot_id)
+        .where(models.Slot.park_id.in_(ids), models.Booking.status != "cancelled",
+               models.Booking.end_time >= since, models.Booking.start_time <= now)
+    ).all()
+    logged = db.execute(
+        select(models.Log.park_id, models.Log.timestamp, models.Log.event_type)
+        .where(models.Log.park_id.in_(ids), models.Log.timestamp >= since,
+               models.Log.event_type.in_(["entry", "exit"]))
+    ).all()
+
+    occupied = np.zeros((len(parks), hours), dtype=np.int32)
+    if booked:
+        occupied = _hourly_levels(
+            np.array([rows[r[0]] for r in booked]),
+            _hour_index([r[1] for r in booked], since), _hour_index([r[2] for r in booked], since),
+            np.ones(len(booked), dtype=np.int32), len(parks), hours,
+        )
+    if logged:
+        # Camera events never end; an exit is an interval of -1
+        level = _hourly_levels(
+            np.array([rows[r[0]] for r in logged]),
+            _hour_index([r[1] for r in logged], since), np.full(len(logged), hours),
+            np.where(np.array([r[2] for r in logged]) == "entry", 1, -1).astype(np.int32), len(parks), hours,
+        )
+        # Vehicles present before the window make the running count dip below zero; shift it up
+        level -= np.minimum(level.min(axis=1, keepdims=True), 0)
+        occupied = np.maximum(occupied, level)
+
+    seen = {r[0] for r in booked} | {r[0] for r in logged}
+
+    capacity = np.array([total for _, total in parks], dtype=np.float32)[:, None]
+    fraction = np.minimum(occupied / capacity, 1.0)
+
+    # Fold into whole weeks; hours after `now` are padding and not averaged in
+    weeks = -(-hours // HOURS_PER_WEEK)
+    padded = np.zeros((len(parks), weeks * HOURS_PER_WEEK), dtype=np.float32)
+    padded[:, :hours] = fraction
+    counts = np.zeros(weeks * HOURS_PER_WEEK, dtype=np.float32)
+    counts[:hours] = 1
+    profiles = padded.reshape(len(parks), weeks, HOURS_PER_WEEK).sum(axis=1) \
+        / counts.reshape(weeks, HOURS_PER_WEEK).sum(axis=0)
+    return {park_id: profiles[i].astype(np.float16) for park_id, i in rows.items() if park_id in seen}
+
+
+class ForecastStore:
+    """
+    Hour-of-week occupancy profile per park, kept in memory so endpoints attach a
+    forecast without touching the database.
+
+    `refresh` rebuilds only parks with log or booking rows newer than the ids seen on
+    the previous run; the first run builds every park.
+    """
+
+    def __init__(self, horizon_minutes: int = FORECAST_HORIZON_MINUTES):
+        self.horizon_minutes = horizon_minutes
+        self.profiles = {}
+        self.log_watermark = None
+        self.booking_watermark = None
+        self._lock = threading.Lock()
+
+    def _changed_parks(self, db):
+        if self.log_watermark is None:
+            return None
+        # Both read only rows past the watermark, by primary key
+        logs = db.execute(select(models.Log.park_id).where(models.Log.id > self.log_watermark)).scalars()
+        booked_slots = select(models.Booking.slot_id).where(models.Booking.id > self.booking_watermark)
+        bookings = db.execute(select(models.Slot.park_id).where(models.Slot.id.in_(booked_slots))).scalars()
+        return set(logs) | set(bookings)
+
+    def refresh(self, db, now: datetime = None) -> int:
+        """
+        Rebuilds the profiles of parks with new events. Returns the number of parks rebuilt.
+        """
+        # Read first, so events written during the rebuild are picked up by the next run
+        log_watermark = db.execute(select(func.coalesce(func.max(models.Log.id), 0))).scalar()
+        booking_watermark = db.execute(select(func.coalesce(func.max(models.Booking.id), 0))).scalar()
+        changed = self._changed_parks(db)
+
+        query = select(models.Park.id, models.Park.total_slots).order_by(models.Park.id)
+        if changed is not None:
+            if not changed:
+                return 0
+            query = query.where(models.Park.id.in_(changed))
+        parks = db.execute(query).all()
+        for i in range(0, len(parks), FORECAST_BATCH_SIZE):
+            batch = parks[i:i + FORECAST_BATCH_SIZE]
+            profiles = build_profiles(db, batch, now)
+            with self._lock:
+                for park_id, _ in batch:
+                    self.profiles.pop(park_id, None) # History may have aged out of the window
+                self.profiles.update(profiles)
+        self.log_watermark, self.booking_watermark = log_watermark, booking_watermark
+        return len(parks)
+
+    def occupancy_at(self, park_id: int, ts: datetime):
+        """
+        Profile occupancy fraction at `ts`, interpolated between hours. None without a profile.
+        """
+        profile = self.profiles.get(park_id)
+        if profile is None:
+            return None
+        # Each value stands for the middle of its hour
+        position = ((ts - week_start(ts)).total_seconds() / 3600 - 0.5) % HOURS_PER_WEEK
+        hour, frac = int(position), position % 1
+        return float(profile[hour]) * (1 - frac) + float(profile[(hour + 1) % HOURS_PER_WEEK]) * frac
+
+    def available_in(self, park_id: int, total_slots: int, available_now: int, now: datetime = None):
+        """
+        Expected free slots `horizon_minutes` from now: the current occupancy moved by the
+        change the park's profile shows over the same span. None if the park has no profile.
+        """
+        now = now or datetime.utcnow()
+        current = self.occupancy_at(park_id, now)
+        if current is None or not total_slots:
+            return None
+        later = self.occupancy_at(park_id, now + timedelta(minutes=self.horizon_minutes))
+        occupied = (total_slots - (available_now or 0)) + (later - current) * total_slots
+        return total_slots - int(round(min(max(occupied, 0), total_slots)))
+
+
+class ForecastJob:
+    """
+    Background thread refreshing `store` every `interval` seconds.
+    """
+
+    def __init__(self, store: ForecastStore, interval: float = FORECAST_INTERVAL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="forecast", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> int:
+        db = database.WorkerSessionLocal()
+        try:
+            return self.store.refresh(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        # First pass right away so forecasts are available soon after startup
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Forecast refresh failed: {e}")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+forecasts = ForecastStore()
+forecast_job = ForecastJob(forecasts)
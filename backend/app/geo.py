@@ -0,0 +1,131 @@
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+# Grid cell size in degrees (~5.5km at the equator) and how long an index may be
+# served before it is rebuilt, so parks created by other workers show up.
+PARK_INDEX_CELL_DEG = float(os.getenv("PARK_INDEX_CELL_DEG", "0.05"))
+PARK_INDEX_TTL_SECONDS = float(os.getenv("PARK_INDEX_TTL_SECONDS", "300"))
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance from one point to an array of points, in km.
+    """
+    lat1 = math.radians(lat)
+    lon1 = math.radians(lon)
+    lats_r = np.radians(lats)
+    lons_r = np.radians(lons)
+    a = np.sin((lats_r - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lats_r) * np.sin((lons_r - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """
+    Returns (min_lat, max_lat, min_lon, max_lon) enclosing the search circle.
+    """
+    dlat = radius_km / KM_PER_DEG_LAT
+    # Guard against the poles where a degree of longitude shrinks to zero
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    dlon = min(radius_km / (KM_PER_DEG_LAT * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class ParkIndex:
+    """
+    In-process grid index of park coordinates.
+
+    Parks are bucketed into fixed-size lat/lon cells so a radius search only
+    touches the cells overlapping the search bounding box instead of every park.
+    """
+
+    def __init__(self, cell_deg: float = PARK_INDEX_CELL_DEG, ttl_seconds: float = PARK_INDEX_TTL_SECONDS):
+        self.cell_deg = cell_deg
+        self.ttl_seconds = ttl_seconds
+        self._cells = defaultdict(set)
+        self._points = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _remove_locked(self, park_id: int):
+        point = self._points.pop(park_id, None)
+        if point is not None:
+            cell = self._cell(*point)
+            self._cells[cell].discard(park_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def upsert(self, park_id: int, lat, lon):
+        with self._lock:
+            self._remove_locked(park_id)
+            # Parks without coordinates, or left at the (0, 0) default, are never returned by a
+            # radius search; a real latitude or longitude of 0 is fine
+            if lat is None or lon is None or (lat, lon) == (0, 0):
+                return
+            self._points[park_id] = (lat, lon)
+            self._cells[self._cell(lat, lon)].add(park_id)
+
+    def remove(self, park_id: int):
+        with self._lock:
+            self._remove_locked(park_id)
+
+    def load(self, rows):
+        """
+        Rebuilds the index from (id, latitude, longitude) rows.
+        """
+        with self._lock:
+            self._cells = defaultdict(set)
+            self._points = {}
+            self._loaded_at = time.monotonic()
+        for park_id, lat, lon in rows:
+            self.upsert(park_id, lat, lon)
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def candidates(self, lat: float, lon: float, radius_km: float):
+        """
+        Returns (ids, lats, lons) arrays for parks in cells overlapping the search box.
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        lo = self._cell(min_lat, min_lon)
+        hi = self._cell(max_lat, max_lon)
+        n_cells = (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1)
+
+        with self._lock:
+            if n_cells > len(self._cells):
+                # Huge radius: walking the occupied cells is cheaper than the box
+                ids = [pid for cell, members in self._cells.items()
+                       if lo[0] <= cell[0] <= hi[0] and lo[1] <= cell[1] <= hi[1]
+                       for pid in members]
+            else:
+                ids = []
+                for i in range(lo[0], hi[0] + 1):
+                    for j in range(lo[1], hi[1] + 1):
+                        members = self._cells.get((i, j))
+                        if members:
+                            ids.extend(members)
+            coords = [self._points[pid] for pid in ids]
+
+        if not ids:
+            empty = np.empty(0)
+            return np.empty(0, dtype=np.int64), empty, empty
+        coords = np.asarray(coords, dtype=np.float64)
+        return np.asarray(ids, dtype=np.int64), coords[:, 0], coords[:, 1]
+
+
+park_index = ParkIndex()
@@ -1,15 +1,48 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
 from .database import engine, Base
 from .routers import auth, owner, user
+from . import analytics, camera_control, database, events, forecast, metrics, migrations, retention, scheduler
+from collections import OrderedDict, defaultdict
 import uvicorn
 import asyncio
-from typing import List
+import json
+import os
+from typing import Dict, Optional, Set
 
 # Create Tables (Managed via Supabase SQL Editor for RLS/Triggers)
 # Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Smart Park Companion API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail before migrating or starting any background job if the role is misconfigured
+    camera_control.check_role()
+    if migrations.AUTO_MIGRATE:
+        await asyncio.to_thread(migrations.migrate)
+    retention.compaction_job.start()
+    scheduler.expiry_scheduler.start()
+    forecast.forecast_job.start()
+    analytics.occupancy_sampler.start()
+    camera_control.start()
+    yield
+    retention.compaction_job.stop()
+    scheduler.expiry_scheduler.stop()
+    forecast.forecast_job.stop()
+    analytics.occupancy_sampler.stop()
+    metrics.profiler.stop()
+    # Stop camera threads and the inference worker before the process exits
+    await asyncio.to_thread(camera_control.shutdown)
+
+app = FastAPI(title="Smart Park Companion API", lifespan=lifespan)
+
+# SQL counts and timings, per engine and per request
+metrics.instrument_engine(database.engine)
+metrics.instrument_engine(database.worker_engine, "worker")
+if database.async_engine is not None:
+    metrics.instrument_engine(database.async_engine.sync_engine, "async")
+app.add_middleware(metrics.MetricsMiddleware)
 
 # CORS
 app.add_middleware(
@@ -18,6 +51,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth.router)
@@ -28,35 +62,146 @@ app.include_router(user.router)
 def read_root():
     return {"message": "Smart Park Companion API is running"}
 
-# WebSocket Connection Manager
+def check_metrics_token(authorization: Optional[str] = Header(None)):
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    # Profiling costs CPU and disk, so it is never open to anonymous callers
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to control the profiler")
+    check_metrics_token(authorization)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(check_metrics_token)])
+def get_metrics():
+    """
+    Prometheus text exposition of request, SQL, auth and camera metrics.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.put("/metrics/profiler", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def toggle_profiler(enabled: bool, slow_ms: Optional[float] = Query(None, gt=0)):
+    """
+    Starts or stops the sampling profiler that writes folded stacks of slow requests to PROFILE_DIR.
+    """
+    if slow_ms is not None:
+        metrics.profiler.slow_ms = slow_ms
+    if enabled:
+        metrics.profiler.start()
+    else:
+        metrics.profiler.stop()
+    return {"enabled": metrics.profiler.enabled, "slow_ms": metrics.profiler.slow_ms, "directory": metrics.profiler.directory}
+
+# Per-client send buffer; when a client falls behind, updates for the same slot are
+# coalesced and the oldest remaining message is dropped
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, max_queue: int = WS_SEND_QUEUE_SIZE, on_close=None):
+        self.websocket = websocket
+        self.on_close = on_close
+        self.max_queue = max_queue
+        self.pending = OrderedDict()
+        self.dropped = 0
+        self.coalesced = 0
+        self._seq = 0
+        self._ready = asyncio.Event()
+        self.task = None
+
+    def offer(self, message: str, key: str = None):
+        """
+        Queues a message without blocking. Messages sharing a key replace each other.
+        """
+        if key is not None and key in self.pending:
+            self.pending[key] = message
+            self.coalesced += 1
+        else:
+            if len(self.pending) >= self.max_queue:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            if key is None:
+                self._seq += 1
+                key = self._seq
+            self.pending[key] = message
+        self._ready.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.pending:
+                    _, message = self.pending.popitem(last=False)
+                    await self.websocket.send_text(message)
+        except (WebSocketDisconnect, RuntimeError) as e:
+            # The socket went away mid-send; stop fanning events out to it
+            print(f"WebSocket send failed, dropping client: {e}")
+            self.pending.clear()
+            if self.on_close is not None:
+                self.on_close(self)
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Groups sockets by topic and fans bus events out to them. Each client drains
+    its own queue, so a slow socket never delays the others.
+    """
+
+    def __init__(self, bus=events.bus):
+        self.bus = bus
+        self.topics: Dict[str, Set[ClientConnection]] = defaultdict(set)
+        self._unsubscribe = {}
+        self.loop = None
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, topic: str) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.loop = asyncio.get_running_loop()
+        client = ClientConnection(websocket, on_close=lambda c: self.disconnect(c, topic))
+        client.task = asyncio.create_task(client.run())
+        if topic not in self._unsubscribe:
+            self._unsubscribe[topic] = self.bus.subscribe(topic, self._on_event)
+        self.topics[topic].add(client)
+        return client
+
+    def disconnect(self, client: ClientConnection, topic: str):
+        # Also called by the client's own task when a send fails, then again by the endpoint
+        if client.task is not asyncio.current_task():
+            client.task.cancel()
+        clients = self.topics.get(topic)
+        if clients is not None and client in clients:
+            clients.discard(client)
+            if not clients:
+                del self.topics[topic]
+                self._unsubscribe.pop(topic)()
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    def _on_event(self, topic: str, payload: str):
+        # Called on the publisher's thread; hop onto the event loop
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.broadcast, topic, payload)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    def broadcast(self, topic: str, message: str):
+        key = None
+        try:
+            event = json.loads(message)
+            if event.get("slot_id") is not None and event.get("type") == "slot":
+                key = f"slot:{event['slot_id']}"
+        except ValueError:
+            pass
+        for client in list(self.topics.get(topic, ())):
+            client.offer(message, key)
 
 manager = ConnectionManager()
 
 @app.websocket("/ws/logs/{park_id}")
 async def websocket_endpoint(websocket: WebSocket, park_id: int):
-    await manager.connect(websocket)
+    topic = events.park_topic(park_id)
+    client = await manager.connect(websocket, topic)
     try:
         while True:
-            # Simple mock of pushing data every few seconds
-            # In a real app, this would be triggered by DB events or Redis Pub/Sub
             await websocket.receive_text() # Keep alive
-            # await manager.broadcast(f"Update for park {park_id}")
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(client, topic)
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,364 @@
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally, deque
+
+# Requests slower than this have their sampled stacks written out while the profiler runs
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "500"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+# When set, /metrics and the profiler toggle require "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SQL_STATEMENTS = {"select", "insert", "update", "delete"}
+
+
+registry = []
+# Callables returning extra exposition lines at scrape time (gauges read from live objects)
+collectors = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.label_names, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values = {} # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+        names = self.label_names + ("le",)
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}"
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    for collect in collectors:
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+def gauge(name: str, help: str, samples):
+    """
+    Exposition lines for a gauge from [(labels dict, value)], skipping missing values.
+    """
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} gauge"
+    for labels, value in samples:
+        if value is not None:
+            yield f"{name}{_labels(tuple(labels), tuple(labels.values()))} {float(value)}"
+
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+sql_queries = Counter("db_queries_total", "SQL statements executed", ("engine", "statement"))
+sql_latency = Histogram("db_query_duration_seconds", "SQL statement execution time", ("engine", "statement"), SQL_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "SQL statements per HTTP request", ("route",), COUNT_BUCKETS)
+request_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",))
+auth_latency = Histogram("auth_verify_duration_seconds", "Access token verification time", ("result",), SQL_BUCKETS)
+auth_user_cache = Counter("auth_user_cache_total", "Authenticated user lookups by cache result", ("result",))
+slow_request_profiles = Counter("profiler_slow_requests_total", "Slow requests whose stacks were written", ("route",))
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware; the object is shared with threadpool workers running the handler
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def instrument_engine(engine, name: str = "default"):
+    """
+    Counts and times every SQL statement run on `engine`, and attributes it to the current request.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        kind = statement.lstrip()[:6].lower()
+        if kind not in SQL_STATEMENTS:
+            kind = "other"
+        sql_queries.inc(engine=name, statement=kind)
+        sql_latency.observe(elapsed, engine=name, statement=kind)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+# Leaf functions of threads that are parked, not working
+IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+    ("queue.py", "get"), ("thread.py", "_worker"), ("base_events.py", "_run_once"),
+}
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all busy threads every `interval` seconds into a ring buffer.
+    When a request takes longer than `slow_ms`, the samples taken while it ran are written
+    as folded stacks ("frame;frame;frame count"), ready for flamegraph.pl or speedscope.
+    Samples come from every thread, so concurrent requests show up in each other's dumps.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, slow_ms: float = PROFILE_SLOW_REQUEST_MS,
+                 directory: str = PROFILE_DIR, max_samples: int = 50000):
+        self.interval = interval_ms / 1000
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.samples = deque(maxlen=max_samples)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join()
+        self.samples.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            now = time.monotonic()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.samples.append((now, ";".join(reversed(stack))))
+
+    def dump(self, started: float, finished: float, label: str) -> str:
+        """
+        Writes the samples taken between two monotonic times. Returns the file path, or None.
+        """
+        folded = _Tally(stack for ts, stack in list(self.samples) if started <= ts <= finished)
+        if not folded:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}-{int((finished - started) * 1000)}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in folded.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+profiler = SamplingProfiler()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and SQL usage per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.monotonic() - started
+            current_request.reset(token)
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded
+            label = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(method=scope["method"], route=label, status=status[0])
+            http_latency.observe(elapsed, method=scope["method"], route=label)
+            request_queries.observe(stats.queries, route=label)
+            request_db_time.observe(stats.db_seconds, route=label)
+            if profiler.enabled and elapsed * 1000 >= profiler.slow_ms:
+                path = profiler.dump(started, started + elapsed, f"{scope['method']} {label}")
+                if path:
+                    slow_request_profiles.inc(route=label)
+                    print(f"Slow request {scope['method']} {scope['path']} took {elapsed * 1000:.0f}ms, stacks in {path}")
+
+
+def _collect_pools():
+    from . import database
+    samples = []
+    for name, engine in (("default", database.engine), ("worker", database.worker_engine)):
+        checkedout = getattr(engine.pool, "checkedout", None)
+        if checkedout is not None:
+            samples.append(({"engine": name}, checkedout()))
+    return gauge("db_pool_checked_out", "Connections currently checked out of the pool", samples)
+
+
+def _collect_cameras():
+    # Only reported when the camera pipeline is loaded in this process
+    camera = sys.modules.get(f"{__package__}.camera")
+    if camera is None:
+        return []
+    health = camera.supervisor.health()
+    running = {pid: h for pid, h in health.items() if h.get("state") != "queued"}
+    worker = camera._worker
+    lines = []
+    lines.extend(gauge("camera_active_analyzers", "Analyzers in active_cameras", [({}, len(camera.active_cameras))]))
+    lines.extend(gauge("camera_queued_analyzers", "Cameras waiting for a worker slot", [({}, len(health) - len(running))]))
+    for key, name, help in (
+        ("frames_processed", "camera_frames_processed", "Frames analysed per camera since it started"),
+        ("frames_dropped", "camera_frames_dropped", "Frames replaced before inference per camera"),
+        ("fps", "camera_fps", "Analysed frames per second per camera"),
+        ("lag_seconds", "camera_lag_seconds", "Seconds since the last frame per camera"),
+        ("last_latency", "camera_detection_latency_seconds", "Capture to detection latency of the last frame"),
+        ("last_write_latency", "camera_write_latency_seconds", "Capture to committed slot update of the last change"),
+        ("reconnects", "camera_reconnects", "Stream reconnects per camera"),
+        ("motion_skip_ratio", "camera_motion_skip_ratio", "Fraction of frames the motion gate kept from the model"),
+        ("motion_saved_seconds", "camera_motion_saved_seconds", "Estimated inference seconds saved by the motion gate"),
+    ):
+        lines.extend(gauge(name, help, [({"park_id": pid}, h.get(key)) for pid, h in running.items()]))
+    if worker is not None:
+        lines.extend(gauge("inference_batches", "Inference batches run", [({}, worker.batches)]))
+        lines.extend(gauge("inference_frames", "Frames run through the model", [({}, worker.frames)]))
+    snapshot_stats = camera.snapshots.encoder.stats()
+    for key, help in (
+        ("queued", "Frames waiting for a snapshot encoder"),
+        ("encoded", "Snapshots encoded and linked to their logs"),
+        ("dropped", "Snapshots dropped because the encoder queue was full"),
+        ("deduplicated", "Snapshots identical to one already stored"),
+        ("evicted", "Snapshots deleted to stay within SNAPSHOT_MAX_BYTES"),
+        ("bytes", "Bytes in the snapshot store"),
+    ):
+        lines.extend(gauge(f"snapshot_{key}", help, [({}, snapshot_stats[key])]))
+    return lines
+
+
+collectors.extend([_collect_pools, _collect_cameras])
+
+if PROFILER_ENABLED:
+    profiler.start()
@@ -0,0 +1,194 @@
+"""
+Versioned schema changes for databases created from supabase_schema.sql or create_all.
+
+Each migration is a list of steps per dialect; a step is a SQL string or a callable
+taking the connection. A migration runs in one transaction together with its row in
+schema_migrations, so it is applied exactly once. Run with `python -m app.migrations`,
+or set AUTO_MIGRATE=1 to apply pending migrations on startup.
+"""
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from . import database
+
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() in ("1", "true", "yes", "on")
+
+# Arbitrary constant for pg_advisory_xact_lock, so concurrent workers migrate one at a time
+MIGRATION_LOCK_ID = 72616
+
+
+def _add_column(table: str, column: str, ddl: str):
+    def step(conn):
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+_ROLLUP_TABLES = """
+CREATE TABLE IF NOT EXISTS park_hourly_stats (
+  park_id {id_type} NOT NULL REFERENCES parks(id) ON DELETE CASCADE,
+  bucket TIMESTAMP NOT NULL,
+  revenue DOUBLE PRECISION DEFAULT 0.0,
+  bookings INTEGER DEFAULT 0,
+  entries INTEGER DEFAULT 0,
+  exits INTEGER DEFAULT 0,
+  occupied_sum INTEGER DEFAULT 0,
+  samples INTEGER DEFAULT 0,
+  PRIMARY KEY (park_id, bucket)
+);
+CREATE TABLE IF NOT EXISTS slot_usage_stats (
+  slot_id {id_type} PRIMARY KEY REFERENCES slots(id) ON DELETE CASCADE,
+  park_id {id_type} REFERENCES parks(id) ON DELETE CASCADE,
+  bookings INTEGER DEFAULT 0,
+  entries INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_slot_usage_stats_park_id ON slot_usage_stats (park_id);
+CREATE INDEX IF NOT EXISTS ix_logs_park_id_timestamp ON logs (park_id, "timestamp" DESC, id DESC);
+"""
+
+
+# Rebuilds the booking columns of the hourly rollups from the bookings table, so bookings
+# made before the rollups existed are counted. Sets rather than adds, so it can be re-run.
+_ROLLUP_BOOKINGS_BACKFILL = """
+INSERT INTO park_hourly_stats (park_id, bucket, revenue, bookings, entries, exits, occupied_sum, samples)
+SELECT slots.park_id, {hour}, SUM(COALESCE(bookings.amount, 0)), COUNT(*), 0, 0, 0, 0
+FROM bookings JOIN slots ON slots.id = bookings.slot_id
+WHERE bookings.start_time IS NOT NULL
+GROUP BY slots.park_id, {hour}
+ON CONFLICT (park_id, bucket) DO UPDATE SET revenue = excluded.revenue, bookings = excluded.bookings
+"""
+
+
+def _statements(sql: str):
+    return [s.strip() for s in sql.split(";") if s.strip()]
+
+
+# (version, description, {dialect: [steps]})
+MIGRATIONS = [
+    (1, "slot ROIs, analytics rollups, log keyset index, log retention", {
+        "sqlite": [
+            _add_column("slots", "roi", "JSON"),
+            _add_column("parks", "log_retention_days", "INTEGER"),
+            *_statements(_ROLLUP_TABLES.format(id_type="INTEGER")),
+        ],
+        "postgresql": [
+            "ALTER TABLE slots ADD COLUMN IF NOT EXISTS roi JSONB",
+            "ALTER TABLE parks ADD COLUMN IF NOT EXISTS log_retention_days INTEGER",
+            *_statements(_ROLLUP_TABLES.format(id_type="BIGINT")),
+            "ALTER TABLE park_hourly_stats ENABLE ROW LEVEL SECURITY",
+            "ALTER TABLE slot_usage_stats ENABLE ROW LEVEL SECURITY",
+        ],
+    }),
+    (2, "indexes for hot filters", {
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_slots_park_id_is_occupied ON slots (park_id, is_occupied)",
+            "CREATE INDEX IF NOT EXISTS ix_slots_park_id_free ON slots (park_id, id) WHERE is_occupied = 0",
+            "CREATE INDEX IF NOT EXISTS ix_bookings_user_id_status ON bookings (user_id, status)",
+            "CREATE INDEX IF NOT EXISTS ix_bookings_slot_id ON bookings (slot_id)",
+            "CREATE INDEX IF NOT EXISTS ix_parks_owner_id ON parks (owner_id)",
+            "CREATE INDEX IF NOT EXISTS ix_parks_latitude_longitude ON parks (latitude, longitude)",
+        ],
+        "postgresql": [
+            "CREATE INDEX IF NOT EXISTS ix_slots_park_id_is_occupied ON slots (park_id, is_occupied)",
+            "CREATE INDEX IF NOT EXISTS ix_slots_park_id_free ON slots (park_id, id) WHERE is_occupied = false",
+            "CREATE INDEX IF NOT EXISTS ix_bookings_user_id_status ON bookings (user_id, status)",
+            "CREATE INDEX IF NOT EXISTS ix_bookings_slot_id ON bookings (slot_id)",
+            "CREATE INDEX IF NOT EXISTS ix_parks_owner_id ON parks (owner_id)",
+            "CREATE INDEX IF NOT EXISTS ix_parks_latitude_longitude ON parks (latitude, longitude)",
+        ],
+    }),
+    (3, "park slot naming layout", {
+        "sqlite": [_add_column("parks", "slot_layout", "JSON")],
+        "postgresql": ["ALTER TABLE parks ADD COLUMN IF NOT EXISTS slot_layout JSONB"],
+    }),
+    (4, "booking history index", {
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_bookings_user_id_start_time ON bookings (user_id, start_time DESC, id DESC)",
+        ],
+        "postgresql": [
+            "CREATE INDEX IF NOT EXISTS ix_bookings_user_id_start_time ON bookings (user_id, start_time DESC, id DESC) "
+            "INCLUDE (slot_id, status, amount, end_time)",
+        ],
+    }),
+    (5, "active booking expiry index", {
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_bookings_active_end_time ON bookings (end_time) WHERE status = 'active'",
+        ],
+        "postgresql": [
+            "CREATE INDEX IF NOT EXISTS ix_bookings_active_end_time ON bookings (end_time) WHERE status = 'active'",
+        ],
+    }),
+    (6, "log snapshot index", {
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_logs_snapshot_url ON logs (snapshot_url) WHERE snapshot_url IS NOT NULL",
+        ],
+        "postgresql": [
+            "CREATE INDEX IF NOT EXISTS ix_logs_snapshot_url ON logs (snapshot_url) WHERE snapshot_url IS NOT NULL",
+        ],
+    }),
+    (7, "backfill booking revenue into hourly rollups", {
+        "sqlite": [_ROLLUP_BOOKINGS_BACKFILL.format(hour="strftime('%Y-%m-%d %H:00:00.000000', bookings.start_time)")],
+        "postgresql": [_ROLLUP_BOOKINGS_BACKFILL.format(hour="date_trunc('hour', bookings.start_time)")],
+    }),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+    ))
+
+
+def applied_versions(conn) -> set:
+    _ensure_version_table(conn)
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def migrate(engine=None) -> list:
+    """
+    Applies pending migrations in version order. Returns the versions applied.
+    """
+    engine = engine or database.engine
+    dialect = engine.dialect.name
+
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("slots"):
+            print("Base schema not found, create it from supabase_schema.sql first")
+            return []
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if dialect not in steps:
+            raise RuntimeError(f"Migration {version} has no steps for {dialect}")
+        with engine.begin() as conn:
+            if dialect == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            # Checked under the lock: another process may have just applied it
+            if version in applied_versions(conn):
+                continue
+            for step in steps[dialect]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()},
+            )
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        with database.engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':8} {description}")
+    else:
+        migrate()
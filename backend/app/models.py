@@ -1,5 +1,5 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -27,10 +27,17 @@ class Park(Base):
     hourly_rate = Column(Float)
     camera_rtsp_url_encrypted = Column(String) # Store encrypted
     payment_link = Column(String)
+    log_retention_days = Column(Integer, nullable=True) # Overrides LOG_RETENTION_DAYS; 0 keeps logs forever
+    slot_layout = Column(JSON, nullable=True) # Slot naming scheme, see provisioning.slot_name
     
     owner = relationship("User", back_populates="parks")
     slots = relationship("Slot", back_populates="park")
 
+    __table_args__ = (
+        Index("ix_parks_owner_id", "owner_id"),
+        Index("ix_parks_latitude_longitude", "latitude", "longitude"),
+    )
+
 class Slot(Base):
     __tablename__ = "slots"
 
@@ -39,10 +46,18 @@ class Slot(Base):
     slot_number = Column(String)
     is_occupied = Column(Boolean, default=False)
     last_updated = Column(DateTime, default=datetime.utcnow)
+    roi = Column(JSON, nullable=True) # Polygon [[x, y], ...] in camera frame pixels
 
     park = relationship("Park", back_populates="slots")
     current_booking = relationship("Booking", back_populates="slot", uselist=False)
 
+    __table_args__ = (
+        Index("ix_slots_park_id_is_occupied", "park_id", "is_occupied"),
+        # Free slots per park, for the booking allocator
+        Index("ix_slots_park_id_free", "park_id", "id",
+              sqlite_where=is_occupied == False, postgresql_where=is_occupied == False),
+    )
+
 class Booking(Base):
     __tablename__ = "bookings"
 
@@ -58,6 +73,17 @@ class Booking(Base):
     user = relationship("User", back_populates="bookings")
     slot = relationship("Slot", back_populates="current_booking")
 
+    __table_args__ = (
+        Index("ix_bookings_user_id_status", "user_id", "status"),
+        Index("ix_bookings_slot_id", "slot_id"),
+        # Booking history pages; on Postgres the included columns make it index-only
+        Index("ix_bookings_user_id_start_time", "user_id", start_time.desc(), id.desc(),
+              postgresql_include=["slot_id", "status", "amount", "end_time"]),
+        # Active bookings by end time, for the expiry scheduler
+        Index("ix_bookings_active_end_time", "end_time",
+              sqlite_where=status == "active", postgresql_where=status == "active"),
+    )
+
 class Log(Base):
     __tablename__ = "logs"
 
@@ -71,3 +97,32 @@ class Log(Base):
 
     park = relationship("Park")
     slot = relationship("Slot")
+
+    __table_args__ = (
+        # Keyset pagination of a park's logs, newest first
+        Index("ix_logs_park_id_timestamp", "park_id", timestamp.desc(), id.desc()),
+        # Snapshot lookups, to check a snapshot belongs to the park it is requested through
+        Index("ix_logs_snapshot_url", "snapshot_url",
+              sqlite_where=snapshot_url.isnot(None), postgresql_where=snapshot_url.isnot(None)),
+    )
+
+class ParkHourlyStat(Base):
+    __tablename__ = "park_hourly_stats"
+
+    # Rollup of bookings and camera events per park per hour (UTC), maintained on write
+    park_id = Column(Integer, ForeignKey("parks.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    revenue = Column(Float, default=0.0)
+    bookings = Column(Integer, default=0)
+    entries = Column(Integer, default=0)
+    exits = Column(Integer, default=0)
+    occupied_sum = Column(Integer, default=0) # Sum of occupied-slot counts, sampled every OCCUPANCY_SAMPLE_SECONDS
+    samples = Column(Integer, default=0)
+
+class SlotUsageStat(Base):
+    __tablename__ = "slot_usage_stats"
+
+    slot_id = Column(Integer, ForeignKey("slots.id"), primary_key=True)
+    park_id = Column(Integer, ForeignKey("parks.id"), index=True)
+    bookings = Column(Integer, default=0)
+    entries = Column(Integer, default=0)
@@ -0,0 +1,150 @@
+import csv
+import json
+import os
+import string
+from functools import lru_cache
+from itertools import islice
+
+from pydantic import ValidationError
+
+from . import schemas
+
+# Parks created per transaction during an import
+PARK_IMPORT_BATCH_SIZE = int(os.getenv("PARK_IMPORT_BATCH_SIZE", "200"))
+# Invalid rows reported back per import; the rest are only counted
+PARK_IMPORT_MAX_ERRORS = int(os.getenv("PARK_IMPORT_MAX_ERRORS", "100"))
+# Largest single JSON record accepted, so a malformed upload cannot fill memory
+PARK_IMPORT_MAX_RECORD_BYTES = 1024 * 1024
+
+LAYOUT_FIELDS = ("slot_pattern", "rows_per_level", "slots_per_row")
+SLOT_PATTERN_FIELDS = ("n", "level", "row", "index")
+SLOT_PATTERN_MAX_LENGTH = 32
+
+
+def row_label(index: int) -> str:
+    """
+    0 -> "A", 25 -> "Z", 26 -> "AA", like spreadsheet columns.
+    """
+    label = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        label = chr(ord("A") + rem) + label
+    return label
+
+
+@lru_cache(maxsize=256)
+def parse_slot_pattern(pattern: str):
+    """
+    Splits a slot pattern into (literal, placeholder) pairs. Raises ValueError unless every
+    placeholder is a bare {n}, {level}, {row} or {index}; format specs, conversions and
+    attribute or index access are refused since the pattern comes from owners.
+    """
+    if len(pattern) > SLOT_PATTERN_MAX_LENGTH:
+        raise ValueError(f"slot_pattern may be at most {SLOT_PATTERN_MAX_LENGTH} characters")
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(pattern):
+        if field is not None and (field not in SLOT_PATTERN_FIELDS or spec or conversion):
+            raise ValueError("slot_pattern may only use {n}, {level}, {row} and {index}")
+        parts.append((literal, field))
+    return tuple(parts)
+
+
+def slot_name(layout: dict, position: int) -> str:
+    """
+    Name of the slot at 0-based `position` of a park. Without a layout slots are A1, A2, ...
+    """
+    if not layout:
+        return f"A{position + 1}"
+    per_row = layout.get("slots_per_row") or 0
+    per_level = (layout.get("rows_per_level") or 0) * per_row
+    level, in_level = divmod(position, per_level) if per_level else (0, position)
+    row, index = divmod(in_level, per_row) if per_row else (0, in_level)
+    values = {"n": position + 1, "level": level + 1, "row": row_label(row), "index": index + 1}
+    return "".join(
+        literal + (str(values[field]) if field is not None else "")
+        for literal, field in parse_slot_pattern(layout["slot_pattern"])
+    )
+
+
+def slot_names(layout: dict, start: int, count: int):
+    return (slot_name(layout, position) for position in range(start, start + count))
+
+
+def _iter_json(stream, chunk_size: int = 64 * 1024):
+    # Objects of a top-level JSON array, or of newline-delimited JSON, decoded
+    # incrementally so only the current chunk is held in memory
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,[")
+        if buffer.startswith("]"):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                if buffer.strip():
+                    raise ValueError("Truncated or malformed JSON")
+                return
+            if len(buffer) > PARK_IMPORT_MAX_RECORD_BYTES:
+                raise ValueError("JSON record too large or malformed")
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        # A value ending exactly at the chunk boundary may be cut short (e.g. a number)
+        if end == len(buffer) and not eof:
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buffer += chunk
+                continue
+            eof = True
+        yield obj
+        buffer = buffer[end:]
+
+
+def _csv_record(row: dict) -> dict:
+    record = {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+    record = {k: v for k, v in record.items() if v not in ("", None)}
+    layout = {k: record.pop(k) for k in LAYOUT_FIELDS if k in record}
+    if layout:
+        record["slot_layout"] = layout
+    return record
+
+
+def iter_park_rows(stream, format: str):
+    """
+    Yields (row number, ParkCreate or error message) from a CSV or JSON text stream.
+    A malformed file yields one error for the point where parsing failed and ends there.
+    CSV columns are the ParkCreate fields plus slot_pattern, rows_per_level and slots_per_row.
+    """
+    if format == "csv":
+        records = (_csv_record(row) for row in csv.DictReader(stream))
+    else:
+        records = _iter_json(stream)
+    number = 0
+    while True:
+        number += 1
+        try:
+            record = next(records, None)
+        except (ValueError, csv.Error) as e:
+            # Rows read so far are still imported; nothing after this point can be trusted
+            yield number, str(e)
+            return
+        if record is None:
+            return
+        if not isinstance(record, dict):
+            yield number, "Expected an object"
+            continue
+        try:
+            yield number, schemas.ParkCreate(**record)
+        except ValidationError as e:
+            yield number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def batches(rows, size: int = PARK_IMPORT_BATCH_SIZE):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
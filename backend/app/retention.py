@@ -0,0 +1,202 @@
+import glob
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import delete, func, select
+
+from . import database, models
+
+# Raw logs older than this many days are moved out of the logs table,
+# unless the park sets its own log_retention_days
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./archive/logs")
+LOG_COMPACTION_INTERVAL_SECONDS = float(os.getenv("LOG_COMPACTION_INTERVAL_SECONDS", "3600"))
+LOG_COMPACTION_BATCH_SIZE = int(os.getenv("LOG_COMPACTION_BATCH_SIZE", "5000"))
+
+ARCHIVE_FIELDS = ["id", "park_id", "slot_id", "timestamp", "event_type", "description", "snapshot_url"]
+
+
+def archive_path(park_id: int, day, first_id: int, root: str = LOG_ARCHIVE_DIR) -> str:
+    # One file per batch and day, named after its first log id
+    return os.path.join(root, f"park_{park_id}", f"{day:%Y-%m}", f"{day:%Y-%m-%d}.{first_id}.ndjson.gz")
+
+
+def _write_parts(rows, root: str, parts: list):
+    """
+    Writes a batch to `.part` files, one per park and day, synced to disk. Adds their paths to `parts`.
+    """
+    for (park_id, day), group in groupby(rows, key=lambda r: (r["park_id"], r["timestamp"].date())):
+        group = list(group)
+        part = archive_path(park_id, day, group[0]["id"], root) + ".part"
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        parts.append(part)
+        with open(part, "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                for row in group:
+                    f.write(json.dumps(row, default=str) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def _publish(part: str):
+    try:
+        os.replace(part, part[:-len(".part")])
+    except FileNotFoundError:
+        pass # Already published by a process recovering it
+
+
+def _discard(parts):
+    for part in parts:
+        try:
+            os.remove(part)
+        except FileNotFoundError:
+            pass
+
+
+def _recover_parts(db, park_id: int, root: str, claimed):
+    """
+    Settles part files a crashed batch left behind. Their rows are gone from the logs table
+    if the batch committed, so the part is published; otherwise the rows will be archived
+    again and the part is dropped. Must run while this process holds the park's batch lock.
+    """
+    for part in glob.glob(os.path.join(root, f"park_{park_id}", "*", "*.part")):
+        first_id = int(os.path.basename(part).split(".")[1])
+        present = first_id in claimed or db.execute(
+            select(models.Log.id).where(models.Log.id == first_id)
+        ).first() is not None
+        if present:
+            _discard([part])
+        else:
+            _publish(part)
+
+
+# First key of the per-park advisory lock held while a batch is archived (Postgres)
+LOG_COMPACTION_LOCK_KEY = 0x4c4f47
+
+
+def _claim_park(db, park_id: int) -> bool:
+    """
+    Takes the park's compaction lock for the current transaction. False if another
+    process holds it. Only Postgres needs it; SQLite serializes the DELETE anyway.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return db.execute(select(func.pg_try_advisory_xact_lock(LOG_COMPACTION_LOCK_KEY, park_id))).scalar()
+
+
+def compact_park_logs(park_id: int, cutoff: datetime, root: str = LOG_ARCHIVE_DIR,
+                      batch_size: int = LOG_COMPACTION_BATCH_SIZE) -> int:
+    """
+    Moves a park's logs older than `cutoff` into archive files, one short transaction per batch.
+
+    Each batch is claimed by deleting it with RETURNING and written from what the delete
+    returned, so processes running compaction at the same time never archive the same row.
+    The batch goes to synced part files first, which are renamed into place only after
+    the delete commits, so a failed commit leaves no archived copy of rows still in the
+    table. Returns rows archived.
+    """
+    columns = [getattr(models.Log, f) for f in ARCHIVE_FIELDS]
+    archived = 0
+    recovered = False
+    while True:
+        db = database.WorkerSessionLocal()
+        parts, committing = [], False
+        try:
+            if not _claim_park(db, park_id):
+                return archived # Another process is compacting this park
+            batch = (
+                select(models.Log.id)
+                .where(models.Log.park_id == park_id, models.Log.timestamp < cutoff)
+                .order_by(models.Log.timestamp, models.Log.id)
+                .limit(batch_size)
+            )
+            rows = [dict(row._mapping) for row in db.execute(
+                delete(models.Log).where(models.Log.id.in_(batch))
+                .returning(*columns)
+                .execution_options(synchronize_session=False)
+            )]
+            if not recovered:
+                # The delete holds the write lock, so no other batch of this park is in flight
+                _recover_parts(db, park_id, root, {row["id"] for row in rows})
+                recovered = True
+            if not rows:
+                db.rollback()
+                return archived
+            rows.sort(key=lambda r: (r["timestamp"], r["id"]))
+            _write_parts(rows, root, parts)
+            committing = True
+            db.commit()
+        except BaseException:
+            # A failed commit may still have gone through, so its parts are left for recovery
+            if not committing:
+                _discard(parts)
+            raise
+        finally:
+            db.close()
+        for part in parts:
+            _publish(part)
+        archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
+
+
+def compact_logs(now: datetime = None, root: str = LOG_ARCHIVE_DIR) -> dict:
+    """
+    One retention pass over every park. Returns {park_id: rows archived} for parks that had old rows.
+    """
+    now = now or datetime.utcnow()
+    db = database.WorkerSessionLocal()
+    try:
+        parks = db.execute(select(models.Park.id, models.Park.log_retention_days)).all()
+    finally:
+        db.close()
+
+    results = {}
+    for park_id, retention_days in parks:
+        days = retention_days if retention_days is not None else LOG_RETENTION_DAYS
+        if days <= 0:
+            continue # Retention disabled for this park
+        archived = compact_park_logs(park_id, now - timedelta(days=days), root)
+        if archived:
+            results[park_id] = archived
+    return results
+
+
+class CompactionJob:
+    """
+    Background thread running `compact_logs` every `interval` seconds.
+    """
+
+    def __init__(self, interval: float = LOG_COMPACTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-compaction", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                archived = compact_logs()
+                if archived:
+                    print(f"Archived old logs: {archived}")
+            except Exception as e:
+                print(f"Log compaction failed: {e}")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+compaction_job = CompactionJob()
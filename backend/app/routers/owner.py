@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile, WebSocket
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from .. import database, schemas, crud, auth, models, camera
-from typing import List
+from .. import database, schemas, crud, auth, models, camera_control, geo, analytics, provisioning, snapshots
+from ..cache import dashboard_cache
+from typing import List, Optional
+from datetime import datetime
+import codecs
+import csv
+import io
+import json
+import os
 
 router = APIRouter(prefix="/owner", tags=["Owner"])
 
@@ -13,9 +21,47 @@ def create_park(
 ):
     created_park = crud.create_park(db=db, park=park, user_id=current_user.id)
     if park.camera_rtsp_url:
-        camera.start_analysis(created_park.id, park.camera_rtsp_url)
+        camera_control.start_analysis(created_park.id, park.camera_rtsp_url)
     return created_park
 
+@router.post("/parks/import", response_model=schemas.ParkImportResult)
+def import_parks(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|json)$"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    """
+    Creates parks from a CSV or JSON (array or one object per line) upload. The file is
+    read row by row and parks are committed in batches; invalid rows are skipped and reported.
+    """
+    if format is None:
+        format = "csv" if (file.filename or "").lower().endswith(".csv") or file.content_type == "text/csv" else "json"
+    # UploadFile wraps a SpooledTemporaryFile, which TextIOWrapper rejects before Python 3.11
+    stream = codecs.getreader("utf-8-sig")(file.file)
+
+    created, slots, park_ids, errors, failed = 0, 0, [], [], 0
+    def valid_rows():
+        nonlocal failed
+        for number, row in provisioning.iter_park_rows(stream, format):
+            if isinstance(row, str):
+                failed += 1
+                if len(errors) < provisioning.PARK_IMPORT_MAX_ERRORS:
+                    errors.append({"row": number, "error": row})
+            else:
+                yield row
+
+    for batch in provisioning.batches(valid_rows()):
+        db_parks = crud.bulk_create_parks(db, batch, current_user.id)
+        for park, db_park in zip(batch, db_parks):
+            if park.camera_rtsp_url:
+                camera_control.start_analysis(db_park.id, park.camera_rtsp_url)
+        created += len(db_parks)
+        slots += sum(p.total_slots for p in batch)
+        park_ids.extend(p.id for p in db_parks)
+
+    return {"created": created, "slots": slots, "failed": failed, "park_ids": park_ids, "errors": errors}
+
 @router.get("/parks", response_model=List[schemas.ParkResponse])
 def get_my_parks(
     db: Session = Depends(database.get_db),
@@ -24,33 +70,22 @@ def get_my_parks(
     return db.query(models.Park).filter(models.Park.owner_id == current_user.id).all()
 
 @router.get("/dashboard/{park_id}")
-def get_dashboard(
+async def get_dashboard(
     park_id: int,
-    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_active_owner)
 ):
-    park = crud.get_park(db, park_id)
-    if not park:
+    # Served from a per-park cache kept current by slot and booking events;
+    # only a miss touches the database
+    cached = dashboard_cache.peek(park_id)
+    if cached is None:
+        cached = await database.run_read(dashboard_cache.get, park_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Park not found")
-    if park.owner_id != current_user.id:
+    owner_id, dashboard = cached
+    if owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
-    total_slots = park.total_slots
-    occupied_slots = db.query(models.Slot).filter(models.Slot.park_id == park_id, models.Slot.is_occupied == True).count()
-    revenue = db.query(models.Booking).filter(models.Booking.slot.has(park_id=park_id)).with_entities(models.Booking.amount).all()
-    total_revenue = sum([r[0] for r in revenue if r[0]])
-
-    slots = db.query(models.Slot).filter(models.Slot.park_id == park_id).all()
-    slots_data = [{"id": s.id, "slot_number": s.slot_number, "is_occupied": s.is_occupied} for s in slots]
-
-    return {
-        "park_name": park.name,
-        "total_slots": total_slots,
-        "occupied_slots": occupied_slots,
-        "available_slots": total_slots - occupied_slots,
-        "total_revenue": total_revenue,
-        "slots": slots_data
-    }
+
+    return dashboard
 
 @router.get("/analytics/{park_id}")
 def get_analytics(
@@ -63,52 +98,133 @@ def get_analytics(
     if not park:
         raise HTTPException(status_code=404, detail="Park not found")
     
-    # Mock some trend data for the chart
-    # In real app, we would query bookings grouped by day
-    trend_data = [
-        {"name": "Mon", "revenue": 1200, "occupancy": 65},
-        {"name": "Tue", "revenue": 1900, "occupancy": 80},
-        {"name": "Wed", "revenue": 1500, "occupancy": 70},
-        {"name": "Thu", "revenue": 2200, "occupancy": 85},
-        {"name": "Fri", "revenue": 3000, "occupancy": 95},
-        {"name": "Sat", "revenue": 2800, "occupancy": 90},
-        {"name": "Sun", "revenue": 1800, "occupancy": 75},
-    ]
-    
-    return {
-        "trend": trend_data,
-        "top_slots": [
-            {"slot": "A1", "count": 145},
-            {"slot": "A5", "count": 132},
-            {"slot": "B2", "count": 128},
-        ]
-    }
+    return analytics.get_park_analytics(db, park)
 
 @router.get("/logs/{park_id}", response_model=List[schemas.LogResponse])
 def get_logs(
     park_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_active_owner)
 ):
+    """
+    Newest logs first. Pass the X-Next-Cursor response header back as `cursor` to page further back.
+    """
     # Security check
     park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
     if not park:
         raise HTTPException(status_code=404, detail="Park not found")
     
-    logs = db.query(models.Log).filter(models.Log.park_id == park_id).order_by(models.Log.timestamp.desc()).limit(50).all()
-    
-    results = []
-    for log in logs:
-        results.append({
-            "id": log.id,
-            "park_id": log.park_id,
-            "slot_id": log.slot_id,
-            "event_type": log.event_type,
-            "description": log.description,
-            "timestamp": log.timestamp,
-            "slot_number": log.slot.slot_number if log.slot else "N/A"
-        })
-    return results
+    try:
+        rows, next_cursor = crud.get_logs_page(db, park_id, limit, cursor, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    for row in rows:
+        row["slot_number"] = row["slot_number"] or "N/A"
+    return rows
+
+@router.get("/logs/{park_id}/export")
+def export_logs(
+    park_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    """
+    Streams all of a park's logs (oldest first) as NDJSON or CSV.
+    """
+    park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+
+    fields = ["id", "park_id", "slot_id", "slot_number", "event_type", "description", "timestamp", "snapshot_url"]
+
+    def ndjson():
+        for row in crud.iter_logs(park_id, since, until):
+            yield json.dumps({f: row[f] for f in fields}, default=str) + "\n"
+
+    def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in crud.iter_logs(park_id, since, until):
+            writer.writerow([row[f] for f in fields])
+            if buffer.tell() > 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if format == "csv":
+        body, media_type = csv_rows(), "text/csv"
+    else:
+        body, media_type = ndjson(), "application/x-ndjson"
+    filename = f"park-{park_id}-logs.{format}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/logs/{park_id}/snapshots/{digest}.jpg")
+def get_snapshot(
+    park_id: int,
+    digest: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    """
+    Evidence frame of a camera log, as linked from its snapshot_url. Snapshots never
+    change, so they can be cached indefinitely; single byte ranges are supported.
+    """
+    park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+    if not snapshots.DIGEST_PATTERN.match(digest):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    # The store is shared by all parks; only serve snapshots linked from this park's logs
+    linked = db.query(models.Log.id).filter(
+        models.Log.snapshot_url == snapshots.snapshot_url(park_id, digest),
+        models.Log.park_id == park_id,
+    ).first()
+    if not linked:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable", "Accept-Ranges": "bytes"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    path = snapshots.store.path(digest)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                span = snapshots.parse_range(range_header, size) if range_header else None
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            if span is None:
+                data = f.read()
+            else:
+                f.seek(span[0])
+                data = f.read(span[1] - span[0] + 1)
+    except FileNotFoundError:
+        # Evicted to stay within SNAPSHOT_MAX_BYTES
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    snapshots.store.touch(digest)
+
+    if span is None:
+        return Response(content=data, media_type="image/jpeg", headers=headers)
+    headers["Content-Range"] = f"bytes {span[0]}-{span[1]}/{size}"
+    return Response(content=data, status_code=206, media_type="image/jpeg", headers=headers)
 
 # WebSockets would be handled in main or a dedicated ws router usually, but can be here.
 @router.patch("/parks/{park_id}", response_model=schemas.ParkResponse)
@@ -127,10 +243,75 @@ def update_park(
     for key, value in update_data.items():
         if key == "camera_rtsp_url":
             db_park.camera_rtsp_url_encrypted = value
-            camera.start_analysis(db_park.id, value)
+        elif key == "total_slots":
+            continue # Applied below, after the naming scheme
         else:
             setattr(db_park, key, value)
+
+    resized = update_data.get("total_slots") is not None and update_data["total_slots"] != db_park.total_slots
+    if resized and not crud.resize_slots(db, db_park, update_data["total_slots"]):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Only free slots that were never booked can be removed")
     
     db.commit()
     db.refresh(db_park)
+
+    if "camera_rtsp_url" in update_data:
+        # Hot-swaps the stream of a running analyzer, stops it if the URL was cleared
+        camera_control.start_analysis(db_park.id, update_data["camera_rtsp_url"])
+    elif resized:
+        camera_control.reload_rois(db_park.id, crud.get_slot_rois(db, db_park.id))
+
+    dashboard_cache.invalidate(db_park.id)
+    if "latitude" in update_data or "longitude" in update_data:
+        geo.park_index.upsert(db_park.id, db_park.latitude, db_park.longitude)
     return db_park
+
+@router.get("/parks/{park_id}/rois", response_model=List[schemas.SlotRoiResponse])
+def get_slot_rois(
+    park_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+
+    slots = db.query(models.Slot).filter(models.Slot.park_id == park_id).order_by(models.Slot.id).all()
+    return [{"slot_id": s.id, "slot_number": s.slot_number, "polygon": s.roi} for s in slots]
+
+@router.put("/parks/{park_id}/rois", response_model=List[schemas.SlotRoiResponse])
+def set_slot_rois(
+    park_id: int,
+    rois: List[schemas.SlotRoi],
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    """
+    Uploads or edits slot ROI polygons for a park. Slots not listed keep their current ROI.
+    """
+    park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+
+    if not crud.set_slot_rois(db, park_id, {r.slot_id: r.polygon for r in rois}):
+        raise HTTPException(status_code=400, detail="Unknown slot for this park")
+
+    # Running analyzers pick up the new polygons on their next frame
+    camera_control.reload_rois(park_id, crud.get_slot_rois(db, park_id))
+    return get_slot_rois(park_id, db, current_user)
+
+@router.get("/parks/{park_id}/camera")
+def get_camera_health(
+    park_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_owner)
+):
+    """
+    Reports the analyzer state, throughput and lag for the park's camera.
+    """
+    park = db.query(models.Park).filter(models.Park.id == park_id, models.Park.owner_id == current_user.id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+
+    return camera_control.health(park_id) or {"state": "stopped"}
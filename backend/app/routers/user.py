@@ -1,24 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, selectinload
 from .. import database, schemas, crud, auth, models
-from typing import List
+from ..forecast import forecasts
+from typing import List, Optional
+from datetime import datetime
 
 router = APIRouter(prefix="/user", tags=["User"])
 
+def _nearby_parks(db: Session, lat: float, lon: float, radius: float, skip: int, limit: int):
+    parks = crud.get_nearby_parks(db, lat, lon, radius, skip=skip, limit=limit)
+    # Availability is derived from the slots loaded with the page
+    for park in parks:
+        park.available_slots = park.total_slots - sum(1 for slot in park.slots if slot.is_occupied)
+        park.forecast_available_slots = forecasts.available_in(park.id, park.total_slots, park.available_slots)
+    # Serialized before the session closes
+    return [schemas.ParkResponse.model_validate(park) for park in parks]
+
 @router.get("/parks/nearby", response_model=List[schemas.ParkResponse])
-def get_nearby_parks(
+async def get_nearby_parks(
     lat: float,
     lon: float,
     radius: float = 5.0,
-    db: Session = Depends(database.get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    parks = crud.get_nearby_parks(db, lat, lon, radius)
-    # Enrich with availability
-    for park in parks:
-        occupied = db.query(models.Slot).filter(models.Slot.park_id == park.id, models.Slot.is_occupied == True).count()
-        park.available_slots = park.total_slots - occupied
-    return parks
+    return await database.run_read(_nearby_parks, lat, lon, radius, skip, limit)
 
 @router.get("/parks/{park_id}", response_model=schemas.ParkResponse)
 def get_park_detail(
@@ -26,17 +33,14 @@ def get_park_detail(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    park = db.query(models.Park).filter(models.Park.id == park_id).first()
+    # Slots are loaded alongside the park for the grid; availability is derived from them
+    park = db.query(models.Park).options(selectinload(models.Park.slots)).filter(models.Park.id == park_id).first()
     if not park:
         raise HTTPException(status_code=404, detail="Park not found")
     
-    # Enrich with availability and slots
-    occupied = db.query(models.Slot).filter(models.Slot.park_id == park.id, models.Slot.is_occupied == True).count()
+    occupied = sum(1 for slot in park.slots if slot.is_occupied)
     park.available_slots = park.total_slots - occupied
-    
-    # We also need slots for the grid
-    slots = db.query(models.Slot).filter(models.Slot.park_id == park_id).all()
-    park.slots = slots 
+    park.forecast_available_slots = forecasts.available_in(park.id, park.total_slots, park.available_slots)
     
     return park
 
@@ -53,34 +57,35 @@ def create_booking(
 
 @router.get("/bookings")
 def get_my_bookings(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    bookings = db.query(models.Booking).filter(models.Booking.user_id == current_user.id).all()
-    results = []
-    for b in bookings:
-        results.append({
-            "id": b.id,
-            "park_name": b.slot.park.name,
-            "address": b.slot.park.location,
-            "slot_number": b.slot.slot_number,
-            "start_time": b.start_time,
-            "status": b.status,
-            "amount": b.amount
-        })
-    return results
+    """
+    Newest bookings first, optionally filtered by status (repeatable) and start time.
+    Pass the X-Next-Cursor response header back as `cursor` to page further back.
+    """
+    try:
+        rows, next_cursor = crud.get_bookings_page(db, current_user.id, limit, cursor, status, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 @router.get("/stats")
 def get_user_stats(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    total_parkings = db.query(models.Booking).filter(models.Booking.user_id == current_user.id).count()
-    upcoming = db.query(models.Booking).filter(
-        models.Booking.user_id == current_user.id, 
-        models.Booking.status.in_(["upcoming", "active"])
-    ).count()
-    
+    total_parkings, upcoming = crud.get_booking_counts(db, current_user.id)
+
     return {
         "total_parkings": total_parkings,
         "upcoming": upcoming,
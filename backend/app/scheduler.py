@@ -0,0 +1,204 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, select, update
+
+from . import allocator, database, events, models
+
+# Bookings completed per transaction
+BOOKING_EXPIRY_BATCH_SIZE = int(os.getenv("BOOKING_EXPIRY_BATCH_SIZE", "500"))
+# How often active bookings ending soon are re-read, which picks up bookings made by other
+# processes and anything missed while this one was down
+BOOKING_EXPIRY_RELOAD_SECONDS = float(os.getenv("BOOKING_EXPIRY_RELOAD_SECONDS", "60"))
+
+
+def due_bookings(db, until: datetime):
+    """
+    Returns [(booking_id, end_time)] of active bookings ending before `until`.
+    """
+    return db.execute(
+        select(models.Booking.id, models.Booking.end_time)
+        .where(models.Booking.status == "active", models.Booking.end_time <= until)
+    ).all()
+
+
+def complete_bookings(db, booking_ids, now: datetime = None):
+    """
+    Marks the given bookings completed if they are still active and past their end time,
+    and frees their slots unless another active booking holds them. The conditional update
+    is the claim: with several processes expiring the same bookings, each booking is
+    completed and its slot released exactly once.
+    Returns [(booking_id, slot_id, park_id, slot_number)] for the bookings this call completed.
+    """
+    now = now or datetime.utcnow()
+    due = (models.Booking.id.in_(booking_ids), models.Booking.status == "active", models.Booking.end_time <= now)
+    if db.get_bind().dialect.name == "postgresql":
+        # Rows another process is completing right now are skipped instead of waited on
+        claimable = select(models.Booking.id).where(*due).with_for_update(skip_locked=True)
+        claim = update(models.Booking).where(models.Booking.id.in_(claimable))
+    else:
+        claim = update(models.Booking).where(*due)
+    completed = db.execute(
+        claim.values(status="completed")
+        .returning(models.Booking.id, models.Booking.slot_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not completed:
+        db.rollback()
+        return []
+
+    slot_ids = [slot_id for _, slot_id in completed if slot_id is not None]
+    slots = {
+        slot_id: (park_id, number) for slot_id, park_id, number in db.execute(
+            update(models.Slot)
+            .where(
+                models.Slot.id.in_(slot_ids), models.Slot.is_occupied == True,
+                # The slot may have been freed and booked again while this booking was active
+                ~exists(select(models.Booking.id).where(
+                    models.Booking.slot_id == models.Slot.id, models.Booking.status == "active"
+                )),
+            )
+            .values(is_occupied=False, last_updated=now)
+            .returning(models.Slot.id, models.Slot.park_id, models.Slot.slot_number)
+            .execution_options(synchronize_session=False)
+        )
+    } if slot_ids else {}
+    db.commit()
+
+    released = []
+    for booking_id, slot_id in completed:
+        park_id, number = slots.get(slot_id, (None, None))
+        released.append((booking_id, slot_id, park_id, number))
+        if park_id is None:
+            continue # Slot already freed, or held by another active booking
+        allocator.free_slots.push(park_id, slot_id)
+        events.publish_park_event(park_id, {
+            "type": "booking_completed", "booking_id": booking_id, "slot_id": slot_id, "timestamp": now
+        })
+        events.publish_park_event(park_id, {
+            "type": "slot", "slot_id": slot_id, "slot_number": number, "is_occupied": False, "timestamp": now
+        })
+    return released
+
+
+class ExpiryScheduler:
+    """
+    Completes active bookings at their end_time.
+
+    Bookings ending within the next two reload intervals are kept in a min-heap keyed on
+    end_time; the thread sleeps until the earliest one is due and completes everything
+    due in batches. The heap is refilled from the partial index on active bookings, never
+    from a scan of the whole table, and new bookings in this process are added directly.
+    """
+
+    def __init__(self, batch_size: int = BOOKING_EXPIRY_BATCH_SIZE, reload_interval: float = BOOKING_EXPIRY_RELOAD_SECONDS):
+        self.batch_size = batch_size
+        self.reload_interval = reload_interval
+        self.completed = 0
+        self._heap = [] # (end_time, booking_id)
+        self._scheduled = set()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    @property
+    def horizon(self) -> timedelta:
+        return timedelta(seconds=2 * self.reload_interval)
+
+    def schedule(self, booking_id: int, end_time: datetime):
+        if end_time is None or end_time - datetime.utcnow() > self.horizon:
+            return # Picked up by a later reload
+        with self._cond:
+            if booking_id in self._scheduled:
+                return
+            self._scheduled.add(booking_id)
+            heapq.heappush(self._heap, (end_time, booking_id))
+            if self._heap[0][1] == booking_id:
+                self._cond.notify()
+
+    def reload(self, now: datetime = None) -> int:
+        """
+        Schedules active bookings ending before now + horizon, including overdue ones.
+        """
+        now = now or datetime.utcnow()
+        db = database.WorkerSessionLocal()
+        try:
+            rows = due_bookings(db, now + self.horizon)
+        finally:
+            db.close()
+        for booking_id, end_time in rows:
+            self.schedule(booking_id, end_time)
+        return len(rows)
+
+    def pop_due(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                _, booking_id = heapq.heappop(self._heap)
+                self._scheduled.discard(booking_id)
+                due.append(booking_id)
+        return due
+
+    def expire_due(self, now: datetime = None) -> int:
+        """
+        Completes every scheduled booking that is due. Returns the number completed here.
+        """
+        now = now or datetime.utcnow()
+        count = 0
+        while due := self.pop_due(now):
+            db = database.WorkerSessionLocal()
+            try:
+                count += len(complete_bookings(db, due, now))
+            finally:
+                db.close()
+        self.completed += count
+        return count
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="booking-expiry", daemon=True)
+        self._thread.start()
+
+    def _wait(self, next_reload: float):
+        with self._cond:
+            if not self._running:
+                return
+            timeout = next_reload - time.monotonic()
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            if timeout > 0:
+                self._cond.wait(timeout)
+
+    def _run(self):
+        next_reload = 0.0
+        while self._running:
+            try:
+                if time.monotonic() >= next_reload:
+                    self.reload()
+                    next_reload = time.monotonic() + self.reload_interval
+                completed = self.expire_due()
+                if completed:
+                    print(f"Completed {completed} expired booking(s)")
+            except Exception as e:
+                # Failed batches are due again on the next reload
+                print(f"Booking expiry failed: {e}")
+                next_reload = time.monotonic() + self.reload_interval
+            self._wait(next_reload)
+
+    def stop(self, timeout: float = None):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+expiry_scheduler = ExpiryScheduler()
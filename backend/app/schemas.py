@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -36,6 +36,42 @@ class SlotResponse(SlotBase):
     class Config:
         from_attributes = True
 
+class SlotRoi(BaseModel):
+    slot_id: int
+    polygon: Optional[List[List[float]]] = None # [[x, y], ...] in frame pixels, null clears
+
+    @field_validator("polygon")
+    @classmethod
+    def check_polygon(cls, v):
+        if v is not None and (len(v) < 3 or any(len(p) != 2 for p in v)):
+            raise ValueError("polygon needs at least 3 [x, y] points")
+        return v
+
+class SlotRoiResponse(BaseModel):
+    slot_id: int
+    slot_number: str
+    polygon: Optional[List[List[float]]] = None
+
+class SlotLayout(BaseModel):
+    # Placeholders: {n} running number, {level}, {row} (A, B, ... AA), {index} within the row
+    slot_pattern: str = "A{n}"
+    rows_per_level: Optional[int] = None
+    slots_per_row: Optional[int] = None
+
+    @field_validator("slot_pattern")
+    @classmethod
+    def check_pattern(cls, v):
+        from .provisioning import parse_slot_pattern
+        parse_slot_pattern(v) # Raises ValueError
+        return v
+
+    @field_validator("rows_per_level", "slots_per_row")
+    @classmethod
+    def check_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError("must be at least 1")
+        return v
+
 class ParkBase(BaseModel):
     name: str
     location: str
@@ -48,6 +84,15 @@ class ParkCreate(ParkBase):
     latitude: float
     longitude: float
     camera_rtsp_url: Optional[str] = None # Will be encrypted
+    log_retention_days: Optional[int] = None
+    slot_layout: Optional[SlotLayout] = None
+
+    @field_validator("total_slots")
+    @classmethod
+    def check_total_slots(cls, v):
+        if v < 0:
+            raise ValueError("must not be negative")
+        return v
 
 class ParkUpdate(BaseModel):
     name: Optional[str] = None
@@ -58,18 +103,41 @@ class ParkUpdate(BaseModel):
     longitude: Optional[float] = None
     camera_rtsp_url: Optional[str] = None
     payment_link: Optional[str] = None
+    log_retention_days: Optional[int] = None
+    slot_layout: Optional[SlotLayout] = None # Applies to slots added from now on
+
+    @field_validator("total_slots")
+    @classmethod
+    def check_total_slots(cls, v):
+        if v is not None and v < 0:
+            raise ValueError("must not be negative")
+        return v
 
 class ParkResponse(ParkBase):
     id: int
     owner_id: str
     latitude: float
     longitude: float
+    log_retention_days: Optional[int] = None
+    slot_layout: Optional[SlotLayout] = None
     available_slots: Optional[int] = 0
+    forecast_available_slots: Optional[int] = None # Expected in FORECAST_HORIZON_MINUTES, if the park has history
     distance: Optional[float] = None
     slots: Optional[List[SlotResponse]] = []
     class Config:
         from_attributes = True
 
+class ParkImportError(BaseModel):
+    row: int
+    error: str
+
+class ParkImportResult(BaseModel):
+    created: int
+    slots: int
+    failed: int
+    park_ids: List[int]
+    errors: List[ParkImportError]
+
 class BookingCreate(BaseModel):
     park_id: int
     slot_id: Optional[int] = None
@@ -97,5 +165,6 @@ class LogResponse(BaseModel):
     timestamp: datetime
     # We can also add slot_number here by using a property or resolving it in router
     slot_number: Optional[str] = None 
+    snapshot_url: Optional[str] = None # Evidence frame, served by GET /owner/logs/{park_id}/snapshots/...
     class Config:
         from_attributes = True
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import update
+
+from . import database, models
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+# Oldest snapshots are evicted once the directory grows past this
+SNAPSHOT_MAX_BYTES = int(os.getenv("SNAPSHOT_MAX_BYTES", str(1024 ** 3)))
+SNAPSHOT_MAX_WIDTH = int(os.getenv("SNAPSHOT_MAX_WIDTH", "640"))
+SNAPSHOT_JPEG_QUALITY = int(os.getenv("SNAPSHOT_JPEG_QUALITY", "70"))
+SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "2"))
+# Frames waiting for an encoder; further frames are dropped rather than queued
+SNAPSHOT_QUEUE_SIZE = int(os.getenv("SNAPSHOT_QUEUE_SIZE", "32"))
+# The directory may be shared by several camera workers, each of which only sees its own
+# writes; the file list is re-read from disk this often so eviction covers all of them
+SNAPSHOT_RESCAN_SECONDS = float(os.getenv("SNAPSHOT_RESCAN_SECONDS", "60"))
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def snapshot_url(park_id: int, digest: str) -> str:
+    return f"/owner/logs/{park_id}/snapshots/{digest}.jpg"
+
+
+def encode_jpeg(frame, max_width: int = SNAPSHOT_MAX_WIDTH, quality: int = SNAPSHOT_JPEG_QUALITY) -> bytes:
+    import cv2
+
+    height, width = frame.shape[:2]
+    if width > max_width:
+        frame = cv2.resize(frame, (max_width, max(1, round(height * max_width / width))), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return data.tobytes()
+
+
+class SnapshotStore:
+    """
+    Content-addressed JPEG files under `root`, named by their SHA-256.
+
+    Writing the same bytes twice stores them once. Files are tracked in least recently
+    used order and the oldest are deleted once the total passes `max_bytes`. Use is
+    recorded in file mtimes and the list is rebuilt from disk every `rescan_seconds`,
+    so processes sharing the directory evict from one common total.
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, max_bytes: int = SNAPSHOT_MAX_BYTES,
+                 rescan_seconds: float = SNAPSHOT_RESCAN_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self._loaded_at = 0.0
+        self.total_bytes = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self._files = None # OrderedDict digest -> size, least recently used first
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.jpg")
+
+    def _load(self):
+        # Rebuilds the LRU order from file mtimes left by a previous run
+        found = []
+        if os.path.isdir(self.root):
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    digest, ext = os.path.splitext(name)
+                    if ext == ".jpg" and DIGEST_PATTERN.match(digest):
+                        try:
+                            stat = os.stat(os.path.join(directory, name))
+                        except FileNotFoundError:
+                            continue # Evicted by another process meanwhile
+                        found.append((stat.st_mtime, digest, stat.st_size))
+        found.sort()
+        self._files = OrderedDict((digest, size) for _, digest, size in found)
+        self.total_bytes = sum(self._files.values())
+        self._loaded_at = time.monotonic()
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores `data` and returns its digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        with self._lock:
+            if self._files is None or time.monotonic() - self._loaded_at >= self.rescan_seconds:
+                self._load()
+            if digest in self._files:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    # Removed behind our back; write it again
+                    self.total_bytes -= self._files.pop(digest)
+                else:
+                    self._files.move_to_end(digest)
+                    self.deduplicated += 1
+                    return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if digest not in self._files:
+                self.total_bytes += len(data)
+            self._files[digest] = len(data)
+            self._evict()
+        return digest
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._files) > 1:
+            digest, size = self._files.popitem(last=False)
+            self.total_bytes -= size
+            self.evicted += 1
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+
+    def touch(self, digest: str):
+        # The mtime carries the use over to other processes and the next rescan
+        try:
+            os.utime(self.path(digest))
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._files is not None and digest in self._files:
+                self._files.move_to_end(digest)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files or ()),
+                "bytes": self.total_bytes,
+                "deduplicated": self.deduplicated,
+                "evicted": self.evicted,
+            }
+
+
+class SnapshotEncoder:
+    """
+    Bounded pool of threads that encode evidence frames for camera logs off the analysis path.
+
+    `submit` never blocks: when every encoder is busy and the queue is full the frame is
+    dropped. Each job downscales and JPEG-encodes the frame, stores it, and then sets
+    `snapshot_url` on the logs it belongs to.
+    """
+
+    def __init__(self, store: SnapshotStore, workers: int = SNAPSHOT_WORKERS, queue_size: int = SNAPSHOT_QUEUE_SIZE):
+        self.store = store
+        self.workers = max(1, workers)
+        self.encoded = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _ensure_threads(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run, name=f"snapshot-encoder-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, park_id: int, frame, log_ids) -> bool:
+        """
+        Queues a frame as the snapshot of `log_ids`. Returns False if it was dropped.
+        """
+        if not log_ids:
+            return False
+        self._ensure_threads()
+        try:
+            self._queue.put_nowait((park_id, frame, list(log_ids)))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self.process(*job)
+            except Exception as e:
+                self.failed += 1
+                print(f"Snapshot for Park {job[0]} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def process(self, park_id: int, frame, log_ids) -> str:
+        digest = self.store.put(encode_jpeg(frame))
+        db = database.WorkerSessionLocal()
+        try:
+            db.execute(
+                update(models.Log).where(models.Log.id.in_(log_ids))
+                .values(snapshot_url=snapshot_url(park_id, digest))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.encoded += 1
+        return digest
+
+    def stop(self, timeout: float = None):
+        """
+        Lets queued frames finish, then stops the threads.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "encoded": self.encoded,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            **self.store.stats(),
+        }
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, None if the header should be
+    ignored. Raises ValueError if the range cannot be satisfied.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+store = SnapshotStore()
+encoder = SnapshotEncoder(store)
@@ -0,0 +1,144 @@
+import numpy as np
+
+# Slot masks are rasterized at a fraction of the frame resolution; occupancy
+# only needs coarse overlap so this keeps the label array small.
+MASK_SCALE = 0.25
+
+
+def roi_polygon(roi) -> np.ndarray:
+    """
+    Normalizes a stored ROI to a (K, 2) polygon. A bare x1,y1,x2,y2 box is expanded to a rectangle.
+    """
+    pts = np.asarray(roi, dtype=np.float32)
+    if pts.ndim == 1 and pts.shape[0] == 4:
+        x1, y1, x2, y2 = pts
+        pts = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+    return pts.reshape(-1, 2)
+
+
+class SlotMask:
+    """
+    Label image of a camera's slot ROIs: pixel value i + 1 means slot i, 0 is background.
+
+    Matching a detection box against every slot is then one bincount over the
+    box's region of the mask, so the cost does not depend on the number of slots.
+    """
+
+    def __init__(self, rois, frame_shape, scale: float = MASK_SCALE):
+        import cv2
+        self.frame_shape = tuple(frame_shape[:2])
+        self.scale = scale
+        height = max(1, int(round(self.frame_shape[0] * scale)))
+        width = max(1, int(round(self.frame_shape[1] * scale)))
+        self.slot_ids = np.array(list(rois.keys()), dtype=np.int64)
+
+        self.labels = np.zeros((height, width), dtype=np.uint16)
+        self.boxes = np.zeros((len(self.slot_ids), 4), dtype=np.float32) # Polygon bounds in frame pixels
+        for i, roi in enumerate(rois.values()):
+            polygon = roi_polygon(roi)
+            self.boxes[i] = (*polygon.min(axis=0), *polygon.max(axis=0))
+            cv2.fillPoly(self.labels, [np.round(polygon * scale).astype(np.int32)], i + 1)
+        self.areas = np.bincount(self.labels.ravel(), minlength=len(self.slot_ids) + 1)
+
+    def __len__(self):
+        return len(self.slot_ids)
+
+    def iou(self, boxes) -> np.ndarray:
+        """
+        IoU of each detection box (N, 4) with each slot polygon. Returns (N, M).
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        n_slots = len(self.slot_ids)
+        out = np.zeros((len(boxes), n_slots), dtype=np.float32)
+        if not len(boxes) or not n_slots:
+            return out
+
+        height, width = self.labels.shape
+        scaled = np.round(boxes * self.scale).astype(np.int64)
+        scaled[:, [0, 2]] = np.clip(scaled[:, [0, 2]], 0, width)
+        scaled[:, [1, 3]] = np.clip(scaled[:, [1, 3]], 0, height)
+        slot_areas = self.areas[1:]
+        for i, (x1, y1, x2, y2) in enumerate(scaled):
+            if x2 <= x1 or y2 <= y1:
+                continue
+            inter = np.bincount(self.labels[y1:y2, x1:x2].ravel(), minlength=n_slots + 1)[1:]
+            union = (x2 - x1) * (y2 - y1) + slot_areas - inter
+            out[i] = inter / np.maximum(union, 1)
+        return out
+
+    def occupancy(self, boxes, threshold: float) -> np.ndarray:
+        """
+        Boolean vector over slots: True where any detection overlaps the slot by at least `threshold` IoU.
+        """
+        iou = self.iou(boxes)
+        if not iou.shape[0]:
+            return np.zeros(iou.shape[1], dtype=bool)
+        return iou.max(axis=0) >= threshold
+
+
+class MotionGate:
+    """
+    Cheap per-slot change detector run before inference.
+
+    Each frame is shrunk to the slot mask's resolution in grayscale and compared with
+    the reference, the last frame whose detections were applied. A slot has changed when
+    more than `threshold` of its pixels differ by over `pixel_delta`. Detection then only
+    needs to run on `crop` of the changed slots.
+    """
+
+    def __init__(self, mask: SlotMask, threshold: float, pixel_delta: int, margin: float, max_crop_fraction: float):
+        self.mask = mask
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.margin = margin
+        self.max_crop_fraction = max_crop_fraction
+        self.reference = None
+
+    def shrink(self, frame) -> np.ndarray:
+        import cv2
+        height, width = self.mask.labels.shape
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+    def changed(self, small) -> np.ndarray:
+        """
+        Boolean vector over slots: True where the shrunk frame differs from the reference.
+        Every slot has changed while there is no reference yet.
+        """
+        n_slots = len(self.mask)
+        if self.reference is None:
+            return np.ones(n_slots, dtype=bool)
+        import cv2
+        moved = cv2.absdiff(small, self.reference) > self.pixel_delta
+        counts = np.bincount(self.mask.labels[moved], minlength=n_slots + 1)[1:]
+        return counts > self.threshold * np.maximum(self.mask.areas[1:], 1)
+
+    def crop(self, slots) -> tuple:
+        """
+        Frame region (x1, y1, x2, y2) covering `slots` plus a margin for vehicles overhanging
+        them, or None when it would be most of the frame anyway.
+        """
+        boxes = self.mask.boxes[slots]
+        if not len(boxes):
+            return None
+        height, width = self.mask.frame_shape
+        pad_x = self.margin * float(np.max(boxes[:, 2] - boxes[:, 0]))
+        pad_y = self.margin * float(np.max(boxes[:, 3] - boxes[:, 1]))
+        x1 = int(max(0, boxes[:, 0].min() - pad_x))
+        y1 = int(max(0, boxes[:, 1].min() - pad_y))
+        x2 = int(min(width, np.ceil(boxes[:, 2].max() + pad_x)))
+        y2 = int(min(height, np.ceil(boxes[:, 3].max() + pad_y)))
+        if (x2 - x1) * (y2 - y1) > self.max_crop_fraction * width * height:
+            return None
+        return x1, y1, x2, y2
+
+    def covered(self, region) -> np.ndarray:
+        """
+        Boolean vector over slots lying entirely inside `region` (all of them for the full frame).
+        """
+        if region is None:
+            return np.ones(len(self.mask), dtype=bool)
+        x1, y1, x2, y2 = region
+        height, width = self.mask.frame_shape
+        boxes = np.clip(self.mask.boxes, 0, [width, height, width, height])
+        return (boxes[:, 0] >= x1) & (boxes[:, 1] >= y1) & (boxes[:, 2] <= x2) & (boxes[:, 3] <= y2)
@@ -0,0 +1,100 @@
+"""
+Camera worker process: runs camera analysis for the API processes started with APP_ROLE=api.
+
+    APP_ROLE=camera python -m app.worker
+
+The model is loaded and warmed up once at startup and shared by every camera in the
+process. With several workers, CAMERA_WORKER_COUNT and CAMERA_WORKER_INDEX split the
+parks between them by park id.
+"""
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+from . import camera, camera_control, crud, database, events
+
+CAMERA_WORKER_COUNT = max(1, int(os.getenv("CAMERA_WORKER_COUNT", "1")))
+CAMERA_WORKER_INDEX = int(os.getenv("CAMERA_WORKER_INDEX", "0"))
+
+
+def owns(park_id: int) -> bool:
+    return park_id % CAMERA_WORKER_COUNT == CAMERA_WORKER_INDEX
+
+
+def apply_command(action: str, park_id: int):
+    db = database.WorkerSessionLocal()
+    try:
+        if action == "stop":
+            camera.stop_analysis(park_id)
+        elif action == "start":
+            url = crud.get_camera_urls(db, [park_id]).get(park_id)
+            camera.start_analysis(park_id, url, rois=crud.get_slot_rois(db, park_id))
+        elif action == "reload_rois":
+            camera.reload_rois(park_id, crud.get_slot_rois(db, park_id))
+    finally:
+        db.close()
+
+
+def start_cameras():
+    db = database.WorkerSessionLocal()
+    try:
+        urls = {park_id: url for park_id, url in crud.get_camera_urls(db).items() if owns(park_id)}
+        for park_id, url in urls.items():
+            camera.start_analysis(park_id, url, rois=crud.get_slot_rois(db, park_id))
+    finally:
+        db.close()
+    print(f"Camera worker {CAMERA_WORKER_INDEX}/{CAMERA_WORKER_COUNT} started {len(urls)} camera(s)")
+
+
+def publish_health():
+    events.publish(camera_control.HEALTH_TOPIC, {
+        "worker": CAMERA_WORKER_INDEX,
+        "cameras": camera.supervisor.health(),
+    })
+
+
+def main():
+    if camera_control.APP_ROLE == "api":
+        sys.exit("APP_ROLE=api processes do not run cameras")
+    if not events.REDIS_URL:
+        sys.exit("The camera worker takes commands over Redis, set REDIS_URL")
+    if not camera.warm_up_inference():
+        sys.exit("No inference model available, install ultralytics and check YOLO_WEIGHTS")
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    # Bus callbacks must not block, so commands are applied on the main thread
+    commands = queue.Queue()
+    def on_command(topic, payload):
+        commands.put(payload)
+    unsubscribe = events.bus.subscribe(camera_control.CONTROL_TOPIC, on_command)
+
+    start_cameras()
+    next_report = 0.0
+    while not stop.is_set():
+        if time.monotonic() >= next_report:
+            publish_health()
+            next_report = time.monotonic() + camera_control.CAMERA_HEALTH_INTERVAL
+        try:
+            command = json.loads(commands.get(timeout=1.0))
+        except queue.Empty:
+            continue
+        if owns(command["park_id"]):
+            try:
+                apply_command(command["action"], command["park_id"])
+            except Exception as e:
+                print(f"Camera command {command} failed: {e}")
+
+    unsubscribe()
+    camera.supervisor.shutdown()
+    events.bus.close()
+
+
+if __name__ == "__main__":
+    main()
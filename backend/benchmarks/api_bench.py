@@ -0,0 +1,422 @@
+"""
+Latency and throughput benchmark for the hot API endpoints.
+
+Seeds a database with parks, slots, bookings and logs at one or more data sizes,
+replaces Supabase auth with a header-selected bench user, and measures p50/p90/p99
+latency, throughput and SQL statements per request for each endpoint. Sizes grow
+the same database, smallest first. Results are written as JSON so runs from two
+commits can be compared.
+
+    python -m benchmarks.api_bench --sizes small,medium --output bench.json
+    python -m benchmarks.api_bench --sizes small --compare bench.json --fail-on-regression
+    python -m benchmarks.api_bench --mode http --concurrency 32   # through uvicorn
+
+By default requests go through the ASGI app in-process; --mode http starts uvicorn
+on a local port in this process and sends real HTTP requests.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SIZES = {
+    "small": {"parks": 100, "slots": 20, "users": 50, "bookings": 2000, "logs": 20000},
+    "medium": {"parks": 1000, "slots": 50, "users": 500, "bookings": 20000, "logs": 200000},
+    "large": {"parks": 5000, "slots": 100, "users": 5000, "bookings": 200000, "logs": 2000000},
+}
+ENDPOINTS = ["nearby", "park_detail", "bookings", "dashboard", "dashboard_cold", "logs"]
+
+CENTER = (12.9716, 77.5946)
+SPREAD_DEG = 0.2 # Parks are scattered over roughly 45 x 45 km around CENTER
+OWNER_ID = "bench-owner"
+INSERT_CHUNK_SIZE = 5000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--sizes", default="small", help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint and size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["asgi", "http"], default="asgi")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p99 regression tolerance in percent")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args()
+
+
+class Seeder:
+    """
+    Grows the bench data set to the requested size. Counts refer to rows this seeder created.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.park_ids = []
+        self.slot_ids = {} # park_id -> [slot ids]
+        self.users = 0
+        self.bookings = 0
+        self.logs = 0
+
+    def grow(self, parks, slots, users, bookings, logs):
+        from app import crud, database, models, schemas
+
+        db = database.SessionLocal()
+        try:
+            if db.get(models.User, OWNER_ID) is None:
+                db.add(models.User(id=OWNER_ID, email=None, role="owner", full_name="Bench Owner"))
+            db.add_all([
+                models.User(id=f"bench-user-{i}", email=None, role="user", full_name=f"Bench User {i}")
+                for i in range(self.users, users)
+            ])
+            db.commit()
+            self.users = max(self.users, users)
+
+            new_parks = [
+                schemas.ParkCreate(
+                    name=f"Bench Park {i}", location=f"Bench street {i}", total_slots=slots, hourly_rate=20.0,
+                    latitude=CENTER[0] + self.rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                    longitude=CENTER[1] + self.rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                )
+                for i in range(len(self.park_ids), parks)
+            ]
+            for start in range(0, len(new_parks), 500):
+                created = crud.bulk_create_parks(db, new_parks[start:start + 500], OWNER_ID)
+                self.park_ids.extend(p.id for p in created)
+            if new_parks:
+                new_ids = self.park_ids[-len(new_parks):]
+                for park_id, slot_id in db.query(models.Slot.park_id, models.Slot.id).filter(
+                    models.Slot.park_id.in_(new_ids)
+                ).order_by(models.Slot.id):
+                    self.slot_ids.setdefault(park_id, []).append(slot_id)
+
+            all_slots = [(park_id, slot_id) for park_id, ids in self.slot_ids.items() for slot_id in ids]
+            now = datetime.utcnow()
+            self._insert(db, models.Booking, bookings - self.bookings, lambda: self._booking(all_slots, now))
+            self.bookings = max(self.bookings, bookings)
+            self._insert(db, models.Log, logs - self.logs, lambda: self._log(all_slots, now))
+            self.logs = max(self.logs, logs)
+
+            # Roughly a third of the slots taken, so availability counts are not trivial
+            occupied = self.rng.sample(all_slots, len(all_slots) // 3)
+            db.query(models.Slot).filter(models.Slot.park_id.in_(self.park_ids)).update(
+                {models.Slot.is_occupied: False}, synchronize_session=False)
+            for start in range(0, len(occupied), INSERT_CHUNK_SIZE):
+                db.query(models.Slot).filter(models.Slot.id.in_([s for _, s in occupied[start:start + INSERT_CHUNK_SIZE]])).update(
+                    {models.Slot.is_occupied: True}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _insert(self, db, model, count, make_row):
+        from sqlalchemy import insert
+        for start in range(0, max(count, 0), INSERT_CHUNK_SIZE):
+            db.execute(insert(model), [make_row() for _ in range(min(INSERT_CHUNK_SIZE, count - start))])
+            db.commit()
+
+    def _booking(self, all_slots, now):
+        _, slot_id = self.rng.choice(all_slots)
+        start = now - timedelta(minutes=self.rng.randint(0, 60 * 24 * 90))
+        return {
+            "user_id": f"bench-user-{self.rng.randrange(self.users)}", "slot_id": slot_id,
+            "start_time": start, "end_time": start + timedelta(hours=2), "amount": 40.0,
+            "status": self.rng.choice(["completed", "completed", "completed", "active", "cancelled"]),
+        }
+
+    def _log(self, all_slots, now):
+        park_id, slot_id = self.rng.choice(all_slots)
+        entry = self.rng.random() < 0.5
+        return {
+            "park_id": park_id, "slot_id": slot_id,
+            "timestamp": now - timedelta(seconds=self.rng.randint(0, 3600 * 24 * 30)),
+            "event_type": "entry" if entry else "exit",
+            "description": f"Vehicle {'detected in' if entry else 'left'} slot",
+        }
+
+
+def install_auth_override(app):
+    """
+    Replaces Supabase token checks with users picked by the X-Bench-User header.
+    """
+    from fastapi import Header
+    from app import auth, database, models
+
+    cache = {}
+    lock = threading.Lock()
+
+    def bench_user(x_bench_user: str = Header(OWNER_ID)):
+        with lock:
+            user = cache.get(x_bench_user)
+        if user is None:
+            db = database.SessionLocal()
+            try:
+                user = db.get(models.User, x_bench_user)
+                db.expunge(user)
+            finally:
+                db.close()
+            with lock:
+                cache[x_bench_user] = user
+        return user
+
+    app.dependency_overrides[auth.get_current_user] = bench_user
+
+
+def build_requests(endpoint, seeder, rng, count):
+    """
+    Returns [(path, headers, before)] for one endpoint; `before` runs untimed ahead of the request.
+    """
+    from app.cache import dashboard_cache
+
+    owner = {"X-Bench-User": OWNER_ID}
+    requests = []
+    for _ in range(count):
+        park_id = rng.choice(seeder.park_ids)
+        before = None
+        if endpoint == "nearby":
+            lat = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+            lon = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+            path, headers = f"/user/parks/nearby?lat={lat:.5f}&lon={lon:.5f}&radius=5", owner
+        elif endpoint == "park_detail":
+            path, headers = f"/user/parks/{park_id}", owner
+        elif endpoint == "bookings":
+            path, headers = "/user/bookings", {"X-Bench-User": f"bench-user-{rng.randrange(seeder.users)}"}
+        elif endpoint == "dashboard":
+            path, headers = f"/owner/dashboard/{park_id}", owner
+        elif endpoint == "dashboard_cold":
+            path, headers = f"/owner/dashboard/{park_id}", owner
+            before = lambda park_id=park_id: dashboard_cache.invalidate(park_id)
+        elif endpoint == "logs":
+            path, headers = f"/owner/logs/{park_id}?limit=50", owner
+        else:
+            raise ValueError(f"Unknown endpoint {endpoint}")
+        requests.append((path, headers, before))
+    return requests
+
+
+class Transport:
+    """
+    One client per worker thread, either the in-process ASGI client or HTTP through uvicorn.
+    """
+
+    def __init__(self, app, mode):
+        self.app = app
+        self.mode = mode
+        self.local = threading.local()
+        self.server = None
+        if mode == "http":
+            self._start_server()
+
+    def _start_server(self):
+        import uvicorn
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, port=port, log_level="warning", lifespan="off"))
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def get(self, path, headers):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            if self.mode == "http":
+                import requests
+                client = requests.Session()
+            else:
+                from fastapi.testclient import TestClient
+                client = TestClient(self.app)
+            self.local.client = client
+        url = self.base_url + path if self.mode == "http" else path
+        return client.get(url, headers=headers).status_code
+
+    def close(self):
+        if self.server is not None:
+            self.server.should_exit = True
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def count_statements(transport, requests):
+    """
+    SQL statements per request, measured sequentially so other requests cannot interfere.
+    """
+    from sqlalchemy import event
+    from app import database
+
+    counter = [0]
+    def on_execute(*args):
+        counter[0] += 1
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine else [])
+    for path, headers, before in requests:
+        if before:
+            before()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", on_execute)
+        try:
+            transport.get(path, headers)
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", on_execute)
+    return counter[0] / max(len(requests), 1)
+
+
+def run_endpoint(transport, requests, concurrency):
+    latencies = [None] * len(requests)
+    errors = [0]
+    lock = threading.Lock()
+
+    def call(i):
+        path, headers, before = requests[i]
+        if before:
+            before()
+        started = time.perf_counter()
+        try:
+            status = transport.get(path, headers)
+        except Exception:
+            status = 0
+        latencies[i] = time.perf_counter() - started
+        if status != 200:
+            with lock:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(len(requests))))
+    elapsed = time.perf_counter() - started
+
+    ms = sorted(l * 1000 for l in latencies)
+    return {
+        "requests": len(requests),
+        "errors": errors[0],
+        "throughput_rps": round(len(requests) / elapsed, 1),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p90_ms": round(percentile(ms, 90), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints changes against a baseline run. Returns the number of regressions.
+    """
+    regressions = 0
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for size, endpoints in results["results"].items():
+        for name, current in endpoints.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            p99 = 100 * (current["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+            rps = 100 * (current["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] if before["throughput_rps"] else 0.0
+            more_sql = current["statements_per_request"] > before["statements_per_request"] + 0.01
+            regressed = p99 > threshold or more_sql
+            regressions += regressed
+            print(f"  {size:7} {name:15} p99 {p99:+6.1f}%  throughput {rps:+6.1f}%  "
+                  f"sql {before['statements_per_request']:.1f} -> {current['statements_per_request']:.1f}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            sys.exit(f"Unknown size {size}, choose from {', '.join(SIZES)}")
+    sizes.sort(key=lambda s: SIZES[s]["parks"])
+
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'api_bench.db')}"
+    # Must be set before the app modules create their engine
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from app import database, migrations
+    from app.main import app
+
+    database.Base.metadata.create_all(bind=database.engine)
+    migrations.migrate()
+    install_auth_override(app)
+    transport = Transport(app, args.mode)
+    # Separate generators keep the seeded data identical whatever endpoints are run
+    seeder = Seeder(random.Random(args.seed))
+    rng = random.Random(args.seed + 1)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "database": database.engine.dialect.name,
+            "async_engine": database.async_engine is not None,
+            "mode": args.mode,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        },
+        "sizes": {size: SIZES[size] for size in sizes},
+        "results": {},
+    }
+    try:
+        for size in sizes:
+            started = time.perf_counter()
+            seeder.grow(**SIZES[size])
+            print(f"\n{size}: {SIZES[size]} seeded in {time.perf_counter() - started:.1f}s")
+            print(f"  {'endpoint':15} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'errors':>6}")
+            results["results"][size] = {}
+            for endpoint in endpoints:
+                # Warm-up also primes the park index and dashboard cache
+                run_endpoint(transport, build_requests(endpoint, seeder, rng, min(50, args.requests)), args.concurrency)
+                # Same sample every run, so counts are comparable between commits
+                statements = count_statements(transport, build_requests(endpoint, seeder, random.Random(args.seed), 20))
+                stats = run_endpoint(transport, build_requests(endpoint, seeder, rng, args.requests), args.concurrency)
+                stats["statements_per_request"] = round(statements, 2)
+                results["results"][size][endpoint] = stats
+                print(f"  {endpoint:15} {stats['throughput_rps']:8.1f} {stats['p50_ms']:8.2f} {stats['p90_ms']:8.2f} "
+                      f"{stats['p99_ms']:8.2f} {statements:8.1f} {stats['errors']:6}")
+    finally:
+        transport.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"FAILED: {regressions} regression(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Concurrency stress test for the booking allocator.
+
+Fires many bookings in parallel at a small number of parks and checks that no
+slot was handed out twice. Runs against a throwaway SQLite file by default, or
+any database given with --database-url (its tables are created if missing).
+
+    python -m benchmarks.booking_stress --bookings 5000 --threads 64 --slots 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--parks", type=int, default=4)
+    parser.add_argument("--slots", type=int, default=1000, help="slots per park")
+    parser.add_argument("--bookings", type=int, default=5000, help="total booking attempts")
+    parser.add_argument("--threads", type=int, default=32)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress.db')}"
+    # Must be set before the app modules create their engine
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from sqlalchemy import func
+    from app import crud, database, models, schemas
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    owner_id = f"stress-owner-{time.time_ns()}"
+    db.add(models.User(id=owner_id, email=None, role="owner", full_name="Stress"))
+    db.commit()
+    park_ids = [
+        crud.create_park(db, schemas.ParkCreate(
+            name=f"Stress {i}", location="bench", total_slots=args.slots,
+            hourly_rate=10.0, latitude=12.9 + i * 0.01, longitude=77.6,
+        ), owner_id).id
+        for i in range(args.parks)
+    ]
+    db.close()
+
+    def book(n):
+        session = database.SessionLocal()
+        try:
+            request = schemas.BookingCreate(park_id=park_ids[n % len(park_ids)], duration_hours=1)
+            return crud.create_booking(session, request, owner_id) is not None
+        except Exception as e:
+            print(f"booking {n} failed: {e}", file=sys.stderr)
+            return False
+        finally:
+            session.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(book, range(args.bookings)))
+    elapsed = time.perf_counter() - started
+
+    db = database.SessionLocal()
+    double_booked = db.query(models.Booking.slot_id).filter(
+        models.Booking.user_id == owner_id
+    ).group_by(models.Booking.slot_id).having(func.count() > 1).count()
+    occupied = db.query(models.Slot).filter(models.Slot.park_id.in_(park_ids), models.Slot.is_occupied == True).count()
+    db.close()
+
+    succeeded = sum(results)
+    expected = min(args.bookings, args.parks * args.slots)
+    print(f"database:        {database.engine.dialect.name}")
+    print(f"attempts:        {args.bookings} on {args.threads} threads")
+    print(f"succeeded:       {succeeded} (expected {expected})")
+    print(f"occupied slots:  {occupied}")
+    print(f"double-booked:   {double_booked}")
+    print(f"throughput:      {args.bookings / elapsed:.0f} attempts/s ({elapsed:.2f}s)")
+
+    ok = double_booked == 0 and occupied == succeeded and succeeded == expected
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
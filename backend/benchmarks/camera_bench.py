@@ -0,0 +1,399 @@
+"""
+Capacity benchmark for the camera pipeline.
+
+Drives N simulated cameras through the real capture loop, shared inference worker,
+ROI matching, occupancy debouncing and DB writes, and reports per step:
+analysed frames/sec, capture-to-detection and detection-to-DB latency, CPU and
+memory per camera. The camera count is ramped (doubling, then bisecting) to find
+the largest number of cameras this node sustains at the target analysis rate.
+
+Frames come from a generated image, or a recorded local video with --video. In the
+generated image a different third of the slots is taken every --change-seconds, drawn as
+solid marker rectangles. Inference is a fake detector that finds those markers, whose
+cost is set with --fake-batch-ms and --fake-frame-ms, or the real model with --detector
+yolo. The motion gate is on unless --no-motion-gate is given; the share of frames it
+kept from the model is reported as "skip".
+
+    python -m benchmarks.camera_bench --cameras 8 --duration 20
+    python -m benchmarks.camera_bench --max-cameras 256 --output camera.json
+    python -m benchmarks.camera_bench --detector yolo --video parking.mp4 --max-cameras 64
+    python -m benchmarks.camera_bench --cameras 16 --no-motion-gate
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--cameras", type=int, help="run one step with this many cameras instead of ramping")
+    parser.add_argument("--max-cameras", type=int, default=128, help="upper bound of the ramp")
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per step")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each step")
+    parser.add_argument("--fps", type=float, help="analysed frames per camera per second (default CAMERA_FPS)")
+    parser.add_argument("--source-fps", type=float, default=25.0, help="frame rate of the simulated streams")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--slots", type=int, default=24, help="slots per camera")
+    parser.add_argument("--video", help="loop this local video file instead of a generated frame")
+    parser.add_argument("--detector", choices=["fake", "yolo"], default="fake")
+    parser.add_argument("--fake-batch-ms", type=float, default=4.0, help="fake detector cost per batch")
+    parser.add_argument("--fake-frame-ms", type=float, default=6.0, help="fake detector cost per frame")
+    parser.add_argument("--change-seconds", type=float, default=5.0, help="how often generated occupancy changes")
+    parser.add_argument("--no-motion-gate", action="store_true", help="send every sampled frame to the detector")
+    parser.add_argument("--batch-size", type=int, help="inference batch size (default INFERENCE_BATCH_SIZE)")
+    parser.add_argument("--min-rate", type=float, default=0.95, help="fraction of the target fps a step must reach")
+    parser.add_argument("--max-latency", type=float, default=2.0, help="p95 capture-to-DB seconds a step may reach")
+    parser.add_argument("--output", help="write results to this JSON file")
+    return parser.parse_args()
+
+
+def grid_rois(width, height, slots):
+    """
+    Slot polygons laid out as a grid over the frame, with a margin between slots.
+    """
+    import math
+    columns = math.ceil(math.sqrt(slots * width / height))
+    rows = math.ceil(slots / columns)
+    w, h = width / columns, height / rows
+    rois = []
+    for i in range(slots):
+        x, y = (i % columns) * w, (i // columns) * h
+        x1, y1, x2, y2 = x + w * 0.1, y + h * 0.1, x + w * 0.9, y + h * 0.9
+        rois.append([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+    return rois
+
+
+# BGR colour of the rectangles standing in for vehicles; the background never reaches it
+MARKER_COLOR = (255, 0, 255)
+
+
+def occupancy_frame(base, rois, phase):
+    """
+    `base` with a marker rectangle over every slot taken in `phase`.
+    """
+    import numpy as np
+    frame = base.copy()
+    taken = (np.arange(len(rois)) + phase) % 3 == 0
+    for roi, occupied in zip(rois, taken):
+        if occupied:
+            (x1, y1), (x2, y2) = roi[0], roi[2]
+            frame[int(y1):int(y2), int(x1):int(x2)] = MARKER_COLOR
+    return frame
+
+
+class FakeDetector:
+    """
+    Returns the bounding boxes of the marker rectangles in each frame, so detections
+    follow the frame content and work on crops. Costs `batch_ms` plus `frame_ms` per
+    frame, spent sleeping like a GPU call that releases the GIL.
+    """
+
+    def __init__(self, batch_ms, frame_ms, min_area=64):
+        self.batch_cost = batch_ms / 1000
+        self.frame_cost = frame_ms / 1000
+        self.min_area = min_area
+
+    def _markers(self, frame):
+        import cv2
+        import numpy as np
+        mask = cv2.inRange(frame, MARKER_COLOR, MARKER_COLOR)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= self.min_area]
+        x, y, w, h = (stats[:, i].astype(np.float32) for i in range(4))
+        return np.stack([x, y, x + w, y + h], axis=1)
+
+    def __call__(self, frames):
+        time.sleep(self.batch_cost + self.frame_cost * len(frames))
+        return [self._markers(frame) for frame in frames]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current outside Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def make_analyzer_class():
+    from app import camera
+
+    class BenchAnalyzer(camera.CameraAnalyzer):
+        """
+        CameraAnalyzer recording every latency sample and the CPU time of its capture thread.
+        """
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.detect_latencies = []
+            self.write_latencies = []
+            self.capture_cpu = 0.0
+            self.measuring = False
+
+        def _process_stream(self):
+            started = time.thread_time()
+            try:
+                super()._process_stream()
+            finally:
+                self.capture_cpu = time.thread_time() - started
+
+        def _on_detections(self, boxes, frame, captured_at, *args):
+            committed = self.writes_committed
+            super()._on_detections(boxes, frame, captured_at, *args)
+            if self.measuring:
+                self.detect_latencies.append(self.last_latency)
+                if self.writes_committed != committed:
+                    self.write_latencies.append(self.last_write_latency)
+
+    return BenchAnalyzer
+
+
+class Bench:
+    def __init__(self, args):
+        from app import camera, database, models
+
+        self.args = args
+        self.fps = args.fps or camera.CAMERA_FPS
+        self.analyzer_class = make_analyzer_class()
+        self.park_ids = []
+        self.frame = None
+        self._frames = {} # Generated frame per occupancy phase
+
+        if args.video:
+            import cv2
+            capture = cv2.VideoCapture(args.video)
+            ok, frame = capture.read()
+            capture.release()
+            if not ok:
+                sys.exit(f"Cannot read {args.video}")
+            self.width, self.height = frame.shape[1], frame.shape[0]
+        else:
+            import numpy as np
+            self.width, self.height = args.width, args.height
+            self.frame = np.random.default_rng(0).integers(32, 224, (self.height, self.width, 3), dtype=np.uint8)
+
+        self.rois = grid_rois(self.width, self.height, args.slots)
+        self.baseline_rss = rss_bytes()
+        db = database.SessionLocal()
+        try:
+            if db.get(models.User, "bench-owner") is None:
+                db.add(models.User(id="bench-owner", email=None, role="owner", full_name="Bench Owner"))
+                db.commit()
+        finally:
+            db.close()
+
+    def ensure_parks(self, count):
+        from app import crud, database, schemas
+
+        db = database.SessionLocal()
+        try:
+            while len(self.park_ids) < count:
+                park = crud.create_park(db, schemas.ParkCreate(
+                    name=f"Camera Bench {len(self.park_ids)}", location="bench", total_slots=self.args.slots,
+                    hourly_rate=10.0, latitude=12.9, longitude=77.6,
+                ), "bench-owner")
+                slot_ids = sorted(slot.id for slot in park.slots)
+                crud.set_slot_rois(db, park.id, dict(zip(slot_ids, self.rois)))
+                self.park_ids.append(park.id)
+        finally:
+            db.close()
+
+    def make_source(self):
+        from app import camera
+        if self.args.video:
+            return camera.VideoSource(self.args.video)
+        return camera.SyntheticSource(lambda seq: self.generated_frame(), fps=self.args.source_fps)
+
+    def generated_frame(self):
+        phase = int(time.time() // self.args.change_seconds)
+        frame = self._frames.get(phase)
+        if frame is None:
+            frame = self._frames[phase] = occupancy_frame(self.frame, self.rois, phase)
+            self._frames.pop(phase - 2, None)
+        return frame
+
+    def make_detector(self):
+        from app import camera
+        if self.args.detector == "yolo":
+            if camera.load_yolo() is None:
+                sys.exit("Ultralytics is not installed, use --detector fake")
+            return camera.YoloDetector()
+        return FakeDetector(self.args.fake_batch_ms, self.args.fake_frame_ms)
+
+    def run_step(self, cameras):
+        from app import camera
+
+        self.ensure_parks(cameras)
+        worker = camera.InferenceWorker(self.make_detector(), batch_size=self.args.batch_size or camera.INFERENCE_BATCH_SIZE)
+        worker.start()
+        # ROIs are loaded from the slots table, like in production
+        analyzers = [
+            self.analyzer_class(park_id, self.make_source(), fps=self.fps, worker=worker)
+            for park_id in self.park_ids[:cameras]
+        ]
+        for analyzer in analyzers:
+            analyzer.motion_gating = not self.args.no_motion_gate
+            analyzer.start()
+
+        time.sleep(self.args.warmup)
+        rss_before = rss_bytes()
+        cpu_before = time.process_time()
+        processed_before = [a.frames_processed for a in analyzers]
+        submitted_before = [a.frames_submitted for a in analyzers]
+        dropped_before = [a.frames_dropped for a in analyzers]
+        writes_before = [a.tracker.writes if a.tracker else 0 for a in analyzers]
+        batches_before = worker.batches
+        checked_before = sum(a.motion_checked for a in analyzers)
+        skipped_before = sum(a.motion_skipped for a in analyzers)
+        cropped_before = sum(a.motion_cropped for a in analyzers)
+        for analyzer in analyzers:
+            analyzer.measuring = True
+        started = time.monotonic()
+
+        time.sleep(self.args.duration)
+
+        for analyzer in analyzers:
+            analyzer.measuring = False
+        elapsed = time.monotonic() - started
+        cpu = time.process_time() - cpu_before
+        rss = rss_bytes()
+        processed = sum(a.frames_processed for a in analyzers) - sum(processed_before)
+        submitted = sum(a.frames_submitted for a in analyzers) - sum(submitted_before)
+        dropped = sum(a.frames_dropped for a in analyzers) - sum(dropped_before)
+        writes = sum(a.tracker.writes if a.tracker else 0 for a in analyzers) - sum(writes_before)
+        batches = worker.batches - batches_before
+        checked = sum(a.motion_checked for a in analyzers) - checked_before
+        skipped = sum(a.motion_skipped for a in analyzers) - skipped_before
+        cropped = sum(a.motion_cropped for a in analyzers) - cropped_before
+        saved = [a.motion_stats()["motion_saved_seconds"] for a in analyzers]
+
+        for analyzer in analyzers:
+            analyzer.stop()
+        for analyzer in analyzers:
+            analyzer.join(5)
+        worker.stop(5)
+
+        detect = [l for a in analyzers for l in a.detect_latencies]
+        write = [l for a in analyzers for l in a.write_latencies]
+        # Frames the gate skipped count as analysed: their slots were checked and had not changed
+        fps_per_camera = (processed + skipped) / elapsed / cameras
+        p95_write = percentile(write, 95)
+        result = {
+            "cameras": cameras,
+            "target_fps": self.fps,
+            "fps_total": round((processed + skipped) / elapsed, 2),
+            "inference_fps": round(processed / elapsed, 2),
+            "fps_per_camera": round(fps_per_camera, 3),
+            "frames_submitted": submitted,
+            "frames_dropped": dropped,
+            "avg_batch": round(processed / batches, 2) if batches else 0,
+            "motion_skip_ratio": round(skipped / checked, 3) if checked else None,
+            "motion_crop_ratio": round(cropped / checked, 3) if checked else None,
+            "motion_saved_seconds": round(sum(s for s in saved if s), 3),
+            "detect_latency_p50_ms": round(percentile(detect, 50) * 1000, 1) if detect else None,
+            "detect_latency_p95_ms": round(percentile(detect, 95) * 1000, 1) if detect else None,
+            "db_latency_p50_ms": round(percentile(write, 50) * 1000, 1) if write else None,
+            "db_latency_p95_ms": round(p95_write * 1000, 1) if write else None,
+            "slot_writes": writes,
+            "write_errors": sum(a.write_errors for a in analyzers),
+            "cpu_percent": round(100 * cpu / elapsed, 1),
+            "cpu_percent_per_camera": round(100 * cpu / elapsed / cameras, 2),
+            "capture_cpu_ms_per_camera": round(1000 * sum(a.capture_cpu for a in analyzers) / cameras, 1),
+            "rss_mb": round(rss / 2**20, 1),
+            "rss_mb_per_camera": round((rss - self.baseline_rss) / 2**20 / cameras, 2),
+            "rss_growth_mb": round((rss - rss_before) / 2**20, 1),
+        }
+        latency = p95_write if p95_write is not None else percentile(detect, 95)
+        result["sustained"] = (
+            fps_per_camera >= self.args.min_rate * self.fps
+            and latency is not None and latency <= self.args.max_latency
+            and result["write_errors"] == 0
+        )
+        return result
+
+
+def print_result(r):
+    def fmt(v):
+        return "-" if v is None else v
+    print(f"{r['cameras']:>5} {r['fps_per_camera']:>8.2f} {r['fps_total']:>8.1f} {fmt(r['detect_latency_p95_ms']):>10} "
+          f"{fmt(r['db_latency_p95_ms']):>10} {r['cpu_percent']:>6.1f} {r['cpu_percent_per_camera']:>8.2f} "
+          f"{r['rss_mb_per_camera']:>8.2f} {r['avg_batch']:>6} {fmt(r['motion_skip_ratio']):>6} "
+          f"{'yes' if r['sustained'] else 'NO':>4}")
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'camera_bench.db')}"
+    # Must be set before the app modules create their engine
+    os.environ["DATABASE_URL"] = args.database_url
+    # Evidence snapshots are part of the pipeline being measured, but not worth keeping
+    os.environ.setdefault("SNAPSHOT_DIR", tempfile.mkdtemp(prefix="camera_bench_snapshots"))
+
+    from app import camera, database, migrations
+
+    database.Base.metadata.create_all(bind=database.engine)
+    migrations.migrate()
+    bench = Bench(args)
+
+    print(f"{'cams':>5} {'fps/cam':>8} {'fps':>8} {'det p95':>10} {'db p95':>10} {'cpu%':>6} {'cpu%/cam':>8} "
+          f"{'MB/cam':>8} {'batch':>6} {'skip':>6} {'ok':>4}")
+    results = []
+    def step(n):
+        result = bench.run_step(n)
+        results.append(result)
+        print_result(result)
+        return result["sustained"]
+
+    best = None
+    if args.cameras:
+        best = args.cameras if step(args.cameras) else None
+    else:
+        # Double until a step fails, then bisect between the last good and first bad count
+        good, bad, n = 0, None, 1
+        while n <= args.max_cameras:
+            if step(n):
+                good = n
+                n *= 2
+            else:
+                bad = n
+                break
+        while bad is not None and bad - good > max(1, good // 10):
+            n = (good + bad) // 2
+            if step(n):
+                good = n
+            else:
+                bad = n
+        best = good or None
+
+    print(f"\nMax sustainable cameras at {bench.fps:g} fps: {best if best else 'none'}"
+          f"{' (ramp limit reached)' if best and not args.cameras and best >= args.max_cameras else ''}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "config": {k: v for k, v in vars(args).items() if k != "database_url"}
+                          | {"database": database.engine.dialect.name, "fps": bench.fps},
+                "steps": results,
+                "max_sustainable_cameras": best,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Query plan check for the hot read paths.
+
+Runs each hot path against seeded data, captures the SELECT statements it issues and
+EXPLAINs them. Exits non-zero if any of them scans a whole table instead of using an
+index. On Postgres, sequential scans are disabled for the session so a scan is only
+reported when no index can serve the query, whatever the table sizes.
+
+    python -m benchmarks.explain_check
+    python -m benchmarks.explain_check --database-url postgresql://...
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--parks", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=40, help="slots per park")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    return parser.parse_args()
+
+
+# A full index scan reads every row just the same, and an automatic index is built by
+# SQLite for every execution, so both count as a scan
+SQLITE_SCAN = re.compile(r"^(?:SCAN (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?|SEARCH (?:TABLE )?(\w+)(?: AS \w+)? USING AUTOMATIC .*)$")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def table_scans(conn, statement, parameters, tables):
+    """
+    Returns (plan lines, names of tables read with a full scan) for one statement.
+    """
+    if conn.dialect.name == "postgresql":
+        lines = [row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters)]
+        scans = [m.group(1) for line in lines for m in [POSTGRES_SCAN.search(line)] if m]
+    else:
+        lines = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        scans = [m.group(1) or m.group(2) for line in lines for m in [SQLITE_SCAN.match(line.strip())] if m]
+    # Plans name aliased tables by their alias
+    aliases = {alias: table for table, alias in re.findall(r"\b(\w+) AS (\w+)\b", statement) if table in tables}
+    return lines, [aliases.get(t, t) for t in scans if t in tables or t in aliases]
+
+
+def seed(db, args):
+    from app import crud, models, schemas
+
+    owner_id = f"explain-owner-{time.time_ns()}"
+    user_id = f"explain-user-{time.time_ns()}"
+    db.add_all([
+        models.User(id=owner_id, email=None, role="owner", full_name="Explain"),
+        models.User(id=user_id, email=None, role="user", full_name="Explain"),
+    ])
+    db.commit()
+    park_ids = [
+        crud.create_park(db, schemas.ParkCreate(
+            name=f"Explain {i}", location="bench", total_slots=args.slots, hourly_rate=10.0,
+            latitude=12.9 + (i % 10) * 0.01, longitude=77.6 + (i // 10) * 0.01,
+        ), owner_id).id
+        for i in range(args.parks)
+    ]
+    for park_id in park_ids[:5]:
+        crud.create_booking(db, schemas.BookingCreate(park_id=park_id, duration_hours=1), user_id)
+        slot_ids = list(crud.get_slot_states(db, [s.id for s in crud.get_park(db, park_id).slots][:10]))
+        crud.apply_slot_changes(db, park_id, {slot_id: True for slot_id in slot_ids[1:]})
+    return owner_id, user_id, park_ids
+
+
+def hot_paths(owner_id, user_id, park_id):
+    from app import allocator, analytics, cache, crud, forecast, models, scheduler
+
+    store = forecast.ForecastStore()
+    store.log_watermark = store.booking_watermark = 1
+
+    return [
+        ("allocator free slots", lambda db: allocator.free_slots.refill(db, park_id)),
+        ("nearby page", lambda db: crud.get_nearby_parks(db, 12.92, 77.61, 2.0)),
+        ("park slot states", lambda db: crud.get_slot_states(db, [1, 2, 3])),
+        ("owner parks", lambda db: db.query(models.Park).filter(models.Park.owner_id == owner_id).all()),
+        ("user bookings page", lambda db: crud.get_bookings_page(db, user_id, 50, statuses=["active", "completed"])),
+        ("user booking counts", lambda db: crud.get_booking_counts(db, user_id)),
+        ("booking expiry reload", lambda db: scheduler.due_bookings(db, datetime.utcnow() + timedelta(hours=2))),
+        ("forecast changed parks", lambda db: store._changed_parks(db)),
+        ("forecast park history", lambda db: forecast.build_profiles(db, [(park_id, 10), (park_id + 1, 10)])),
+        ("occupancy sample", lambda db: analytics.occupied_counts(db)),
+        ("owner dashboard", lambda db: cache.load_dashboard_state(db, park_id)),
+        ("owner snapshot link", lambda db: db.query(models.Log.id).filter(
+            models.Log.snapshot_url == f"/owner/logs/{park_id}/snapshots/{'0' * 64}.jpg", models.Log.park_id == park_id,
+        ).first()),
+        ("owner logs page", lambda db: crud.get_logs_page(db, park_id, 50, since=datetime.utcnow() - timedelta(days=1))),
+    ]
+
+
+def check_path(db, run, tables):
+    """
+    Runs one hot path and returns (statement, plan lines, scanned tables) for each SELECT it issued.
+    """
+    from sqlalchemy import event
+    from app import database
+
+    captured = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        run(db)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+    db.rollback()
+
+    results = []
+    with database.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in captured:
+            lines, scans = table_scans(conn, statement, parameters, tables)
+            results.append((statement, lines, scans))
+    return results
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'explain.db')}"
+    # Must be set before the app modules create their engine
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from app import crud, database, migrations
+
+    database.Base.metadata.create_all(bind=database.engine)
+    migrations.migrate()
+    db = database.SessionLocal()
+    owner_id, user_id, park_ids = seed(db, args)
+    crud._ensure_park_index(db)
+
+    tables = set(database.Base.metadata.tables)
+    failures = 0
+    for name, run in hot_paths(owner_id, user_id, park_ids[0]):
+        for statement, lines, scans in check_path(db, run, tables):
+            status = "SEQ SCAN " + ", ".join(scans) if scans else "ok"
+            failures += bool(scans)
+            print(f"{name:28} {status}")
+            if scans or args.verbose:
+                print("    " + " ".join(statement.split()))
+                for line in lines:
+                    print("      " + line)
+    db.close()
+
+    if failures:
+        print(f"FAILED: {failures} hot statement(s) fall back to a table scan")
+        sys.exit(1)
+    print("OK: every hot statement uses an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Import-time benchmark for the API and camera worker entry points.
+
+Imports each module in a fresh interpreter with -X importtime and reports the median
+wall time over --runs, the heaviest modules by cumulative import time, and whether a
+heavy camera dependency (cv2, ultralytics, torch) was loaded. Exits non-zero if the
+API entry point loads one of them, or if --max-ms is exceeded.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module app.worker --runs 3 --top 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("cv2", "ultralytics", "torch")
+# Entry points that must stay free of the camera dependencies
+API_MODULES = ("app.main",)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="module to import (default app.main and app.worker)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="heaviest modules to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import of an API module is slower")
+    return parser.parse_args()
+
+
+def import_once(module: str):
+    """
+    Returns (wall seconds, {module: cumulative microseconds}, heavy modules loaded).
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum)
+    heavy = [m for m in result.stdout.strip().split(",") if m]
+    return elapsed, cumulative, heavy
+
+
+def main():
+    args = parse_args()
+    modules = args.module or ["app.main", "app.worker"]
+    failed = False
+
+    for module in modules:
+        runs = [import_once(module) for _ in range(args.runs)]
+        median = statistics.median(r[0] for r in runs) * 1000
+        _, cumulative, heavy = runs[len(runs) // 2]
+        print(f"{module}: median {median:.0f} ms over {args.runs} runs (includes interpreter start)")
+        for name, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+        print(f"    heavy modules loaded: {', '.join(heavy) or 'none'}")
+
+        if module in API_MODULES and heavy:
+            print(f"FAILED: {module} loads {', '.join(heavy)}")
+            failed = True
+        if module in API_MODULES and args.max_ms and median > args.max_ms:
+            print(f"FAILED: {module} took {median:.0f} ms, limit {args.max_ms:.0f} ms")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
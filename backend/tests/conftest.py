@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Must be set before the app modules create their engine
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ.setdefault("SNAPSHOT_DIR", tempfile.mkdtemp(prefix="snapshots"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import database, models  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    db.add_all([
+        models.User(id="owner-1", email="owner@example.com", role="owner", full_name="Owner"),
+        models.User(id="owner-2", email="owner2@example.com", role="owner", full_name="Owner Two"),
+        models.User(id="user-1", email="user@example.com", role="user", full_name="User"),
+        models.User(id="user-2", email="user2@example.com", role="user", full_name="User Two"),
+    ])
+    db.commit()
+    db.close()
+    yield
+    database.Base.metadata.drop_all(bind=database.engine)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_park(db):
+    from app import crud, schemas
+
+    def make(total_slots=4, latitude=12.9, longitude=77.6, name="Test Park", owner_id="owner-1"):
+        return crud.create_park(db, schemas.ParkCreate(
+            name=name, location="Test", total_slots=total_slots, hourly_rate=10.0,
+            latitude=latitude, longitude=longitude,
+        ), owner_id)
+    return make
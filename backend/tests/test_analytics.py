@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import analytics, crud, database, models, schemas
+
+
+def test_bookings_do_not_count_occupancy_in_their_transaction(db, make_park):
+    park = make_park(total_slots=2)
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        crud.create_booking(db, schemas.BookingCreate(park_id=park.id, duration_hours=1), "user-1")
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    assert not [s for s in statements if "count(" in s.lower()]
+
+
+def test_quiet_hours_keep_the_sampled_level(db, make_park):
+    park = make_park(total_slots=4)
+    crud.create_booking(db, schemas.BookingCreate(park_id=park.id, duration_hours=3), "user-1")
+    now = datetime.utcnow()
+    # Two hours with no events at all still get samples
+    for hours_ago in (2, 1):
+        assert analytics.sample_occupancy(db, now - timedelta(hours=hours_ago)) >= 1
+
+    rows = db.query(models.ParkHourlyStat).filter(
+        models.ParkHourlyStat.park_id == park.id, models.ParkHourlyStat.samples > 0
+    ).all()
+    assert len(rows) == 2
+    assert all(row.occupied_sum == row.samples == 1 for row in rows)
+    stats = analytics.get_park_analytics(db, park, now=now)
+    sampled = {(now - timedelta(hours=h)).hour for h in (2, 1)}
+    assert all(h["occupancy"] == 25 for h in stats["hourly"] if h["hour"] in sampled)
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+from jose import jwk, jwt
+from sqlalchemy import event
+
+from app import auth, database
+from app.main import app
+
+SECRET = "test-jwt-secret"
+_private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PRIVATE_PEM = _private_key.private_bytes(
+    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+).decode()
+PUBLIC_JWK = {**jwk.construct(PRIVATE_PEM, "RS256").public_key().to_dict(), "kid": "key-1"}
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    """
+    Serves PUBLIC_JWK as the JWKS and records every fetch.
+    """
+    fetches = []
+    def get(url, timeout=None):
+        fetches.append(url)
+        return FakeResponse({"keys": [PUBLIC_JWK]})
+    cache = auth.JWKSCache("https://project.test/auth/v1/.well-known/jwks.json")
+    monkeypatch.setattr(cache, "start", lambda: None)
+    monkeypatch.setattr(auth.requests, "get", get)
+    monkeypatch.setattr(auth, "jwks_cache", cache)
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth, "user_cache", auth.UserCache())
+    return fetches
+
+
+def token(sub="user-1", kid="key-1", expires_in=3600, key=PRIVATE_PEM, algorithm="RS256"):
+    claims = {"sub": sub, "aud": auth.SUPABASE_JWT_AUDIENCE, "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, key, algorithm=algorithm, headers={"kid": kid} if kid else None)
+
+
+def me(token):
+    return TestClient(app).get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_valid_tokens_resolve_the_user(jwks):
+    response = me(token())
+    assert response.status_code == 200 and response.json()["id"] == "user-1"
+    response = me(token(sub="user-2", kid=None, key=SECRET, algorithm="HS256"))
+    assert response.status_code == 200 and response.json()["id"] == "user-2"
+    assert len(jwks) == 1
+
+
+def test_expired_token_is_rejected(jwks):
+    assert me(token(expires_in=-60)).status_code == 401
+    assert me(token(kid=None, key=SECRET, algorithm="HS256", expires_in=-60)).status_code == 401
+
+
+def test_bad_signature_is_rejected(jwks):
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    assert me(token(key=other)).status_code == 401
+    assert me(token(kid=None, key="not-the-secret", algorithm="HS256")).status_code == 401
+
+
+def test_unknown_kid_refreshes_once_within_the_interval(jwks):
+    assert me(token()).status_code == 200
+    assert len(jwks) == 1
+    assert me(token(kid="rotated")).status_code == 401
+    assert len(jwks) == 1 # Fetched moments ago, not refetched yet
+
+    auth.jwks_cache.fetched_at -= auth.jwks_cache.min_refresh_interval
+    assert me(token(kid="rotated")).status_code == 401
+    assert me(token(kid="rotated")).status_code == 401
+    assert len(jwks) == 2
+
+
+def test_repeat_request_is_served_from_the_user_cache(jwks):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    assert me(token()).status_code == 200
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        assert me(token()).status_code == 200
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    assert not [s for s in statements if "profiles" in s]
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from app import crud, database, models, schemas
+
+
+def test_concurrent_bookings_never_share_a_slot(db, make_park):
+    park = make_park(total_slots=6)
+    park_id = park.id
+
+    def book(n):
+        session = database.SessionLocal()
+        try:
+            request = schemas.BookingCreate(park_id=park_id, duration_hours=1)
+            return crud.create_booking(session, request, "user-1" if n % 2 else "user-2") is not None
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(book, range(30)))
+
+    slot_ids = db.query(models.Slot.id).filter(models.Slot.park_id == park_id)
+    double_booked = db.query(models.Booking.slot_id).filter(models.Booking.slot_id.in_(slot_ids)).group_by(
+        models.Booking.slot_id
+    ).having(func.count() > 1).count()
+    assert double_booked == 0
+    assert sum(results) == 6
+    assert db.query(models.Slot).filter(models.Slot.park_id == park_id, models.Slot.is_occupied == True).count() == 6
@@ -0,0 +1,17 @@
+from app import cache, crud, schemas
+
+
+def test_dashboard_revenue_comes_from_rollups(db, make_park):
+    park = make_park(total_slots=3)
+    for hours in (1, 2):
+        crud.create_booking(db, schemas.BookingCreate(park_id=park.id, duration_hours=hours), "user-1")
+
+    state = cache.load_dashboard_state(db, park.id)
+    assert state.total_revenue == 30.0
+    assert state.occupied == 2
+
+    dashboard = cache.DashboardCache(ttl=60)
+    dashboard.get(db, park.id)
+    crud.create_booking(db, schemas.BookingCreate(park_id=park.id, duration_hours=1), "user-1")
+    # Applied from the booking event, without reloading
+    assert dashboard.peek(park.id)[1]["total_revenue"] == 40.0
@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+import pytest
+
+from app import camera
+
+
+class FakeAnalyzer:
+    launches = []
+    fail = False
+
+    def __init__(self, park_id, source, rois=None, worker=None):
+        self.park_id, self.source, self._rois = park_id, source, rois
+        self.frames_processed = 0
+        self.error = None
+        self.state = "running"
+        self.last_frame_at = time.monotonic()
+        self.started_at = time.monotonic()
+        self.alive = True
+
+    def start(self):
+        if FakeAnalyzer.fail:
+            return False
+        FakeAnalyzer.launches.append(self)
+        return True
+
+    def stop(self):
+        self.alive = False
+
+    def join(self, timeout=None):
+        pass
+
+    def is_alive(self):
+        return self.alive
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    FakeAnalyzer.launches, FakeAnalyzer.fail = [], False
+    monkeypatch.setattr(camera, "CameraAnalyzer", FakeAnalyzer)
+    monkeypatch.setattr(camera, "CAMERA_RECONNECT_MIN_SECONDS", 0)
+    return camera.CameraSupervisor(max_workers=1, check_interval=3600, worker=object())
+
+
+def test_restart_backoff_survives_a_short_running_spell(supervisor):
+    supervisor.start(1, "rtsp://one")
+    for attempt in (1, 2):
+        FakeAnalyzer.launches[-1].alive = False
+        supervisor.check()
+        assert supervisor._restarts[1] == attempt
+        # The replacement runs, but not for long enough to count as recovered
+        supervisor.check()
+        assert supervisor._restarts[1] == attempt
+
+    FakeAnalyzer.launches[-1].started_at -= camera.CAMERA_STABLE_SECONDS
+    supervisor.check()
+    assert 1 not in supervisor._restarts
+
+
+def test_queued_camera_is_requeued_when_launch_fails(supervisor):
+    supervisor.start(1, "rtsp://one")
+    assert not supervisor.start(2, "rtsp://two")
+    supervisor.stop(1)
+
+    FakeAnalyzer.fail = True
+    supervisor.check()
+    assert list(supervisor.queued) == [2]
+
+    FakeAnalyzer.fail = False
+    supervisor.check()
+    assert 2 in supervisor.cameras and not supervisor.queued
+
+
+class StubWorker:
+    def discard(self, key):
+        pass
+
+
+def test_stopped_analyzer_ignores_late_detections():
+    analyzer = camera.CameraAnalyzer(1, "rtsp://one", rois={1: [[0, 0], [10, 0], [10, 10], [0, 10]]}, worker=StubWorker())
+    analyzer.running = True
+    analyzer.stop()
+    analyzer._on_detections(np.zeros((0, 4), dtype=np.float32), np.zeros((20, 20, 3), dtype=np.uint8), time.time())
+    assert analyzer.frames_processed == 0 and analyzer.tracker is None
+
+
+def test_failed_slot_write_is_retried_on_the_next_frame(monkeypatch):
+    analyzer = camera.CameraAnalyzer(1, "rtsp://one", rois={7: [[0, 0], [10, 0], [10, 10], [0, 10]]}, worker=StubWorker())
+    analyzer.running, analyzer.debounce_frames = True, 1
+    monkeypatch.setattr(analyzer, "_load_slot_states", lambda slot_ids: np.zeros(len(slot_ids), dtype=bool))
+    monkeypatch.setattr(camera.snapshots, "SNAPSHOTS_ENABLED", False)
+    writes = []
+    def apply_slot_changes(db, park_id, changes):
+        writes.append(changes)
+        if len(writes) == 1:
+            raise RuntimeError("database unavailable")
+        return []
+    monkeypatch.setattr(camera.crud, "apply_slot_changes", apply_slot_changes)
+
+    frame, car = np.zeros((20, 20, 3), dtype=np.uint8), np.array([[0, 0, 10, 10]], dtype=np.float32)
+    analyzer._on_detections(car, frame, time.time())
+    assert analyzer.write_errors == 1 and analyzer.tracker.unsaved.any()
+    # The slot already flipped in the tracker, but is written again until that succeeds
+    analyzer._on_detections(car, frame, time.time())
+    assert writes == [{7: True}, {7: True}] and not analyzer.tracker.unsaved.any()
+    analyzer._on_detections(car, frame, time.time())
+    assert len(writes) == 2
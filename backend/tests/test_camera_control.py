@@ -0,0 +1,35 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import camera_control, events, retention
+from app.main import app
+
+
+@pytest.mark.parametrize("role", ["api", "camera"])
+def test_split_roles_need_redis(monkeypatch, role):
+    monkeypatch.setattr(camera_control, "APP_ROLE", role)
+    monkeypatch.setattr(events, "REDIS_URL", None)
+    with pytest.raises(RuntimeError, match="REDIS_URL"):
+        camera_control.check_role()
+
+
+def test_misconfigured_role_fails_startup_before_any_job_starts(monkeypatch):
+    monkeypatch.setattr(camera_control, "APP_ROLE", "api")
+    monkeypatch.setattr(events, "REDIS_URL", None)
+    with pytest.raises(RuntimeError, match="REDIS_URL"):
+        with TestClient(app):
+            pass
+    assert retention.compaction_job._thread is None
+
+
+def test_unknown_role_is_rejected(monkeypatch):
+    monkeypatch.setattr(camera_control, "APP_ROLE", "cameras")
+    with pytest.raises(RuntimeError, match="APP_ROLE"):
+        camera_control.check_role()
+
+
+def test_single_process_role_runs_without_redis(monkeypatch):
+    monkeypatch.setattr(camera_control, "APP_ROLE", "all")
+    monkeypatch.setattr(events, "REDIS_URL", None)
+    camera_control.check_role()
+    camera_control.start()
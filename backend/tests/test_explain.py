@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import crud, database, migrations
+from benchmarks import explain_check
+
+HOT_PATHS = [name for name, _ in explain_check.hot_paths(None, None, 0)]
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    migrations.migrate()
+    db = database.SessionLocal()
+    owner_id, user_id, park_ids = explain_check.seed(db, SimpleNamespace(parks=12, slots=10))
+    crud._ensure_park_index(db)
+    db.close()
+    return dict(explain_check.hot_paths(owner_id, user_id, park_ids[0]))
+
+
+@pytest.mark.parametrize("name", HOT_PATHS)
+def test_hot_path_uses_an_index(seeded, db, name):
+    results = explain_check.check_path(db, seeded[name], set(database.Base.metadata.tables))
+    assert results
+    scanned = [(" ".join(statement.split()), lines) for statement, lines, scans in results if scans]
+    assert not scanned
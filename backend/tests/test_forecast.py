@@ -0,0 +1,14 @@
+from app import crud, forecast, schemas
+
+
+def test_parks_without_history_get_no_forecast(db, make_park):
+    busy = make_park(total_slots=2)
+    quiet = make_park(total_slots=2)
+    crud.create_booking(db, schemas.BookingCreate(park_id=busy.id, duration_hours=2), "user-1")
+
+    store = forecast.ForecastStore()
+    store.refresh(db)
+
+    assert busy.id in store.profiles and quiet.id not in store.profiles
+    assert store.available_in(quiet.id, 2, 2) is None
+    assert store.available_in(busy.id, 2, 1) is not None
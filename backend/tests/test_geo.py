@@ -0,0 +1,30 @@
+import numpy as np
+
+from app import geo
+
+
+def test_equatorial_parks_are_indexed():
+    index = geo.ParkIndex()
+    index.load([(1, 0.0, 32.58), (2, 0.3, 32.58), (3, 0.0, 0.0), (4, None, 32.58)])
+    ids, _, _ = index.candidates(0.0, 32.58, 5.0)
+    assert sorted(np.asarray(ids).tolist()) == [1]
+    ids, _, _ = index.candidates(0.3, 32.58, 5.0)
+    assert sorted(np.asarray(ids).tolist()) == [2]
+
+
+def test_nearby_page_is_full_when_indexed_parks_moved_away(db, make_park):
+    from sqlalchemy import update
+
+    from app import crud, models
+
+    lat, lon = -1.2921, 36.8219
+    parks = [make_park(total_slots=1, latitude=lat + i * 0.001, longitude=lon, name=f"Moved {i}") for i in range(6)]
+    crud._ensure_park_index(db)
+    # Another process moved the two closest parks; this process's index has not seen it
+    db.execute(update(models.Park).where(models.Park.id.in_([parks[0].id, parks[1].id])).values(latitude=lat + 1))
+    db.commit()
+
+    first = crud.get_nearby_parks(db, lat, lon, 2.0, skip=0, limit=3)
+    assert [p.id for p in first] == [parks[i].id for i in (2, 3, 4)]
+    second = crud.get_nearby_parks(db, lat, lon, 2.0, skip=3, limit=3)
+    assert [p.id for p in second] == [parks[5].id]
@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_profiler_refused_without_metrics_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    assert client.put("/metrics/profiler", params={"enabled": True}).status_code == 403
+    assert not metrics.profiler.enabled
+
+
+def test_profiler_requires_matching_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    assert client.put("/metrics/profiler", params={"enabled": False}).status_code == 401
+    response = client.put("/metrics/profiler", params={"enabled": False}, headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200 and response.json()["enabled"] is False
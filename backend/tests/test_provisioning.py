@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app import auth, crud, database, models, provisioning, schemas
+from app.main import app
+
+
+def test_slot_names_follow_layout():
+    layout = {"slot_pattern": "L{level}-{row}{index}", "rows_per_level": 2, "slots_per_row": 3}
+    assert list(provisioning.slot_names(layout, 0, 7)) == ["L1-A1", "L1-A2", "L1-A3", "L1-B1", "L1-B2", "L1-B3", "L2-A1"]
+    assert provisioning.slot_name({"slot_pattern": "{{P}}{n}"}, 4) == "{P}5"
+
+
+@pytest.mark.parametrize("pattern", [
+    "{n:>300000000}", "{n!r}", "{n.real}", "{n[0]}", "{row.__class__}", "{0}", "{}", "{slot}", "A{n", "x" * 33,
+])
+def test_unsafe_slot_patterns_are_rejected(pattern):
+    with pytest.raises(ValidationError):
+        schemas.SlotLayout(slot_pattern=pattern)
+
+
+def _import(client, filename, content, content_type):
+    app.dependency_overrides[auth.get_current_active_owner] = lambda: database.SessionLocal().get(models.User, "owner-1")
+    try:
+        return client.post("/owner/parks/import", files={"file": (filename, content, content_type)})
+    finally:
+        app.dependency_overrides.pop(auth.get_current_active_owner, None)
+
+
+def test_import_csv_upload(db):
+    content = (
+        "﻿name,location,total_slots,hourly_rate,latitude,longitude,slot_pattern\r\n"
+        "North,Here,3,2.5,12.9,77.6,N{n}\r\n"
+        "Broken,Here,-1,2.5,12.9,77.6,\r\n"
+        "South,There,2,1.0,13.0,77.7,\r\n"
+    ).encode("utf-8")
+    response = _import(TestClient(app), "parks.csv", content, "text/csv")
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["created"], result["slots"], result["failed"]) == (2, 5, 1)
+    assert result["errors"][0]["row"] == 2
+    names = [s.slot_number for s in db.query(models.Slot).filter(models.Slot.park_id == result["park_ids"][0]).order_by(models.Slot.id)]
+    assert names == ["N1", "N2", "N3"]
+
+
+def test_import_json_upload(db):
+    parks = [{"name": f"Park {i}", "location": "Here", "total_slots": 2, "hourly_rate": 1.0,
+              "latitude": 12.9, "longitude": 77.6} for i in range(3)]
+    response = _import(TestClient(app), "parks.json", json.dumps(parks).encode("utf-8"), "application/json")
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["created"], result["slots"], result["failed"]) == (3, 6, 0)
+    assert db.query(models.Slot).filter(models.Slot.park_id.in_(result["park_ids"])).count() == 6
+
+
+def test_bulk_create_parks_inserts_all_slots(db):
+    parks = [schemas.ParkCreate(name=f"Bulk {i}", location="Here", total_slots=i + 1, hourly_rate=1.0,
+                                latitude=12.9, longitude=77.6) for i in range(3)]
+    created = crud.bulk_create_parks(db, parks, "owner-1")
+    assert [p.total_slots for p in created] == [1, 2, 3]
+    for park in created:
+        assert db.query(models.Slot).filter(models.Slot.park_id == park.id).count() == park.total_slots
+
+
+def test_resize_removes_only_unbooked_newest_slots(db, make_park):
+    park = make_park(total_slots=4)
+    slots = db.query(models.Slot).filter(models.Slot.park_id == park.id).order_by(models.Slot.id).all()
+
+    assert crud.resize_slots(db, park, 2)
+    db.commit()
+    remaining = db.query(models.Slot.id).filter(models.Slot.park_id == park.id).order_by(models.Slot.id).all()
+    assert [slot_id for slot_id, in remaining] == [slots[0].id, slots[1].id]
+    assert park.total_slots == 2
+
+    db.add(models.Booking(user_id="user-1", slot_id=slots[1].id, status="completed",
+                          start_time=datetime.utcnow(), end_time=datetime.utcnow()))
+    db.commit()
+    assert not crud.resize_slots(db, park, 1)
+    db.rollback()
+    assert db.query(models.Slot).filter(models.Slot.park_id == park.id).count() == 2
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import auth, database, models
+from app.main import app
+
+LAT, LON = 40.4168, -3.7038
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[auth.get_current_user] = lambda: models.User(id="user-1", role="user")
+    yield TestClient(app)
+    app.dependency_overrides.pop(auth.get_current_user, None)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+
+
+def nearby(client):
+    response = client.get("/user/parks/nearby", params={"lat": LAT, "lon": LON, "radius": 5})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_nearby_statement_count_does_not_grow_with_parks(client, make_park):
+    make_park(total_slots=3, latitude=LAT, longitude=LON, name="Nearby 0")
+    nearby(client) # Builds the park index
+    with count_statements() as one:
+        parks = nearby(client)
+    assert len(parks) == 1 and len(parks[0]["slots"]) == 3
+
+    for i in range(1, 12):
+        make_park(total_slots=3, latitude=LAT + i * 0.001, longitude=LON, name=f"Nearby {i}")
+    nearby(client)
+    with count_statements() as many:
+        parks = nearby(client)
+    assert len(parks) == 12 and all(len(p["slots"]) == 3 for p in parks)
+    assert len(many) == len(one), many
+
+
+def test_park_detail_statement_count_does_not_grow_with_slots(client, make_park):
+    counts = []
+    for total_slots in (1, 40):
+        park = make_park(total_slots=total_slots, latitude=-33.9, longitude=18.4)
+        with count_statements() as statements:
+            response = client.get(f"/user/parks/{park.id}")
+        assert response.status_code == 200
+        assert response.json()["available_slots"] == total_slots
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
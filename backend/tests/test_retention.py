@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import database, models, retention
+
+
+def read_archive(root):
+    rows = []
+    for directory, _, names in os.walk(root):
+        assert not [name for name in names if name.endswith(".part")]
+        for name in names:
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                rows.extend(json.loads(line) for line in f)
+    return rows
+
+
+def test_concurrent_compaction_archives_each_row_once(db, make_park, tmp_path):
+    park_id = make_park(total_slots=1).id
+    old = datetime.utcnow() - timedelta(days=200)
+    db.add_all([
+        models.Log(park_id=park_id, timestamp=old + timedelta(minutes=i), event_type="entry", description=str(i))
+        for i in range(1200)
+    ])
+    db.commit()
+
+    cutoff = datetime.utcnow() - timedelta(days=90)
+    threads = [
+        threading.Thread(target=retention.compact_park_logs, args=(park_id, cutoff, str(tmp_path), 100))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [row["id"] for row in read_archive(tmp_path)]
+    assert len(ids) == len(set(ids)) == 1200
+    assert db.query(models.Log).filter(models.Log.park_id == park_id).count() == 0
+
+
+def add_old_logs(db, park_id, count):
+    old = datetime.utcnow() - timedelta(days=200)
+    db.add_all([
+        models.Log(park_id=park_id, timestamp=old + timedelta(minutes=i), event_type="entry", description=str(i))
+        for i in range(count)
+    ])
+    db.commit()
+
+
+def test_failed_commit_does_not_duplicate_archived_rows(db, make_park, tmp_path, monkeypatch):
+    park_id = make_park(total_slots=1).id
+    add_old_logs(db, park_id, 30)
+    cutoff = datetime.utcnow() - timedelta(days=90)
+
+    class FailingCommit(Session):
+        def commit(self):
+            raise RuntimeError("connection lost")
+    monkeypatch.setattr(retention.database, "WorkerSessionLocal",
+                        sessionmaker(bind=database.worker_engine, class_=FailingCommit))
+    with pytest.raises(RuntimeError):
+        retention.compact_park_logs(park_id, cutoff, str(tmp_path), 10)
+    monkeypatch.undo()
+
+    assert retention.compact_park_logs(park_id, cutoff, str(tmp_path), 10) == 30
+    ids = [row["id"] for row in read_archive(tmp_path)]
+    assert len(ids) == len(set(ids)) == 30
+
+
+def test_batch_committed_before_a_crash_is_recovered(db, make_park, tmp_path, monkeypatch):
+    park_id = make_park(total_slots=1).id
+    add_old_logs(db, park_id, 10)
+    cutoff = datetime.utcnow() - timedelta(days=90)
+
+    def crash(part):
+        raise OSError("killed before rename")
+    monkeypatch.setattr(retention, "_publish", crash)
+    with pytest.raises(OSError):
+        retention.compact_park_logs(park_id, cutoff, str(tmp_path), 10)
+    monkeypatch.undo()
+    assert db.query(models.Log).filter(models.Log.park_id == park_id).count() == 0
+
+    assert retention.compact_park_logs(park_id, cutoff, str(tmp_path), 10) == 0
+    assert sorted(row["description"] for row in read_archive(tmp_path)) == sorted(str(i) for i in range(10))
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from app import crud, models, scheduler, schemas
+
+
+def test_expiry_keeps_slot_rebooked_after_camera_freed_it(db, make_park):
+    park = make_park(total_slots=1)
+    slot_id = park.slots[0].id
+
+    first = crud.create_booking(db, schemas.BookingCreate(park_id=park.id, slot_id=slot_id, duration_hours=1), "user-1")
+    # The camera sees the vehicle leave early and the slot is booked again
+    crud.update_slot_status(db, slot_id, False)
+    second = crud.create_booking(db, schemas.BookingCreate(park_id=park.id, slot_id=slot_id, duration_hours=1), "user-2")
+    assert second is not None and second.slot_id == slot_id
+
+    now = first.end_time + timedelta(seconds=1)
+    released = scheduler.complete_bookings(db, [first.id], now)
+
+    assert released == [(first.id, slot_id, None, None)]
+    db.expire_all()
+    assert db.get(models.Booking, first.id).status == "completed"
+    assert db.get(models.Booking, second.id).status == "active"
+    assert db.get(models.Slot, slot_id).is_occupied
+
+
+def test_expiry_frees_slot_of_last_active_booking(db, make_park):
+    park = make_park(total_slots=1)
+    slot_id = park.slots[0].id
+    booking = crud.create_booking(db, schemas.BookingCreate(park_id=park.id, slot_id=slot_id, duration_hours=1), "user-1")
+
+    released = scheduler.complete_bookings(db, [booking.id], booking.end_time + timedelta(seconds=1))
+
+    assert [r[:3] for r in released] == [(booking.id, slot_id, park.id)]
+    db.expire_all()
+    assert not db.get(models.Slot, slot_id).is_occupied
+    # Not due yet: nothing is completed
+    assert scheduler.complete_bookings(db, [booking.id], datetime.utcnow()) == []
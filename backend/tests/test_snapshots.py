@@ -0,0 +1,40 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app import auth, database, models, snapshots
+from app.main import app
+
+
+def as_owner(owner_id):
+    app.dependency_overrides[auth.get_current_active_owner] = lambda: database.SessionLocal().get(models.User, owner_id)
+
+
+def test_snapshot_only_served_through_its_own_park(db, make_park):
+    mine = make_park(total_slots=1, owner_id="owner-1")
+    theirs = make_park(total_slots=1, owner_id="owner-2")
+    digest = snapshots.store.put(b"\xff\xd8 evidence \xff\xd9")
+    db.add(models.Log(park_id=theirs.id, event_type="entry", description="entry",
+                      snapshot_url=snapshots.snapshot_url(theirs.id, digest)))
+    db.commit()
+    client = TestClient(app)
+    try:
+        as_owner("owner-1")
+        assert client.get(f"/owner/logs/{mine.id}/snapshots/{digest}.jpg").status_code == 404
+        as_owner("owner-2")
+        response = client.get(f"/owner/logs/{theirs.id}/snapshots/{digest}.jpg")
+        assert response.status_code == 200 and response.content == b"\xff\xd8 evidence \xff\xd9"
+    finally:
+        app.dependency_overrides.pop(auth.get_current_active_owner, None)
+
+
+def test_stores_sharing_a_directory_evict_from_a_common_total(tmp_path):
+    first = snapshots.SnapshotStore(str(tmp_path), max_bytes=2500, rescan_seconds=0)
+    second = snapshots.SnapshotStore(str(tmp_path), max_bytes=2500, rescan_seconds=0)
+    digests = []
+    for i in range(6):
+        store = first if i % 2 else second
+        digests.append(store.put(bytes([i]) * 1000))
+
+    on_disk = [d for d in digests if os.path.exists(first.path(d))]
+    assert on_disk == digests[-2:]
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from fastapi import WebSocketDisconnect
+
+from app import events
+from app.main import ClientConnection, ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.fail:
+            raise WebSocketDisconnect(1006)
+        self.sent.append(message)
+
+
+def slot_event(slot_id, occupied):
+    return json.dumps({"type": "slot", "slot_id": slot_id, "is_occupied": occupied})
+
+
+def test_queued_slot_updates_coalesce_and_overflow_drops_the_oldest():
+    client = ClientConnection(FakeSocket(), max_queue=3)
+    client.offer(slot_event(1, True), "slot:1")
+    client.offer("booking", None)
+    client.offer(slot_event(1, False), "slot:1")
+    assert client.coalesced == 1 and list(client.pending.values()) == [slot_event(1, False), "booking"]
+
+    client.offer("a", None)
+    client.offer("b", None)
+    assert client.dropped == 1 and list(client.pending.values()) == ["booking", "a", "b"]
+
+
+def test_events_fan_out_to_subscribers_of_their_topic_only():
+    async def scenario():
+        manager = ConnectionManager(bus=events.InMemoryBus())
+        first, second, other = FakeSocket(), FakeSocket(), FakeSocket()
+        clients = [await manager.connect(first, "park:1"), await manager.connect(second, "park:1"),
+                   await manager.connect(other, "park:2")]
+        manager.bus.publish("park:1", {"type": "slot", "slot_id": 5, "is_occupied": True})
+        await asyncio.sleep(0.05)
+        for client, topic in zip(clients, ["park:1", "park:1", "park:2"]):
+            manager.disconnect(client, topic)
+        return first.sent, second.sent, other.sent, dict(manager.topics), manager.bus._subscribers
+
+    first, second, other, topics, subscribers = asyncio.run(scenario())
+    assert len(first) == 1 and first == second and other == []
+    assert json.loads(first[0])["slot_id"] == 5
+    assert not topics and not subscribers
+
+
+def test_client_is_unregistered_when_a_send_fails():
+    async def scenario():
+        manager = ConnectionManager(bus=events.InMemoryBus())
+        healthy, broken = FakeSocket(), FakeSocket(fail=True)
+        await manager.connect(healthy, "park:1")
+        dropped = await manager.connect(broken, "park:1")
+        manager.broadcast("park:1", "first")
+        await asyncio.sleep(0.05)
+        registered = dropped in manager.topics["park:1"]
+        manager.broadcast("park:1", "second")
+        await asyncio.sleep(0.05)
+        # The endpoint's own cleanup still runs once its receive loop ends
+        manager.disconnect(dropped, "park:1")
+        return registered, dropped.task.done(), healthy.sent, len(manager.topics["park:1"])
+
+    registered, finished, sent, remaining = asyncio.run(scenario())
+    assert not registered and finished
+    assert sent == ["first", "second"] and remaining == 1
@@ -25,21 +25,26 @@ const statusStyles = {
 const Bookings = () => {
   const [bookings, setBookings] = useState<Booking[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
 
   useEffect(() => {
     fetchBookings();
   }, []);
 
-  const fetchBookings = async () => {
+  // Bookings come newest first, one page at a time; X-Next-Cursor points at the next older page
+  const fetchBookings = async (cursor?: string) => {
+    if (cursor) setLoadingMore(true);
     try {
-      const response = await api.get('/user/bookings');
-      // Normalize statuses for UI if needed
-      setBookings(response.data);
+      const response = await api.get('/user/bookings', { params: cursor ? { cursor } : undefined });
+      setBookings(prev => (cursor ? [...prev, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] ?? null);
     } catch (error) {
       console.error(error);
       toast.error('Failed to load bookings');
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -166,6 +171,15 @@ const Bookings = () => {
           </div>
         </div>
       )}
+
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={() => fetchBookings(nextCursor)} disabled={loadingMore}>
+            {loadingMore && <Loader2 className="animate-spin mr-2" size={16} />}
+            Load older bookings
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
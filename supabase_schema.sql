@@ -112,3 +112,76 @@ create policy "Users can create bookings." on public.bookings for insert with ch
 create policy "Owners can view logs." on public.logs for select using (
   exists (select 1 from public.parks where parks.id = logs.park_id and parks.owner_id = auth.uid())
 );
+
+-- 9. SLOT ROIs
+-- Polygon of each slot in the camera frame, used by the occupancy detector
+alter table public.slots add column if not exists roi jsonb;
+
+-- 10. ANALYTICS ROLLUPS
+-- Hourly per-park counters and per-slot usage, maintained by the backend as bookings and camera events are written
+create table if not exists public.park_hourly_stats (
+  park_id bigint references public.parks(id) on delete cascade not null,
+  bucket timestamp not null,
+  revenue double precision default 0.0,
+  bookings integer default 0,
+  entries integer default 0,
+  exits integer default 0,
+  occupied_sum integer default 0,
+  samples integer default 0,
+  primary key (park_id, bucket)
+);
+
+create table if not exists public.slot_usage_stats (
+  slot_id bigint references public.slots(id) on delete cascade primary key,
+  park_id bigint references public.parks(id) on delete cascade,
+  bookings integer default 0,
+  entries integer default 0
+);
+create index if not exists ix_slot_usage_stats_park_id on public.slot_usage_stats (park_id);
+
+alter table public.park_hourly_stats enable row level security;
+alter table public.slot_usage_stats enable row level security;
+
+-- 11. LOG INDEXES
+-- Keyset pagination of a park's logs, newest first
+create index if not exists ix_logs_park_id_timestamp on public.logs (park_id, "timestamp" desc, id desc);
+
+-- 12. LOG RETENTION
+-- Days of raw logs kept per park before they are archived (null = server default, 0 = keep forever)
+alter table public.parks add column if not exists log_retention_days integer;
+
+-- 13. HOT FILTER INDEXES
+-- Also applied by `python -m app.migrations` (version 2)
+create index if not exists ix_slots_park_id_is_occupied on public.slots (park_id, is_occupied);
+create index if not exists ix_slots_park_id_free on public.slots (park_id, id) where is_occupied = false;
+create index if not exists ix_bookings_user_id_status on public.bookings (user_id, status);
+create index if not exists ix_bookings_slot_id on public.bookings (slot_id);
+create index if not exists ix_parks_owner_id on public.parks (owner_id);
+create index if not exists ix_parks_latitude_longitude on public.parks (latitude, longitude);
+
+-- 14. SLOT NAMING
+-- Naming scheme for generated slots, e.g. {"slot_pattern": "L{level}-{row}{index}", "rows_per_level": 10, "slots_per_row": 20}
+alter table public.parks add column if not exists slot_layout jsonb;
+
+-- 15. BOOKING HISTORY
+-- Keyset pages of a user's bookings; also applied by `python -m app.migrations` (version 4)
+create index if not exists ix_bookings_user_id_start_time on public.bookings (user_id, start_time desc, id desc)
+  include (slot_id, status, amount, end_time);
+
+-- 16. BOOKING EXPIRY
+-- Active bookings by end time, read by the expiry scheduler; also applied by `python -m app.migrations` (version 5)
+create index if not exists ix_bookings_active_end_time on public.bookings (end_time) where status = 'active';
+
+-- 17. LOG SNAPSHOTS
+-- Snapshot lookups by URL, to check a snapshot belongs to the requested park; also applied by `python -m app.migrations` (version 6)
+create index if not exists ix_logs_snapshot_url on public.logs (snapshot_url) where snapshot_url is not null;
+
+-- 18. ROLLUP REVENUE BACKFILL
+-- Counts bookings made before the hourly rollups existed, so dashboard revenue can be summed from them;
+-- also applied by `python -m app.migrations` (version 7)
+insert into public.park_hourly_stats (park_id, bucket, revenue, bookings, entries, exits, occupied_sum, samples)
+select slots.park_id, date_trunc('hour', bookings.start_time), sum(coalesce(bookings.amount, 0)), count(*), 0, 0, 0, 0
+from public.bookings join public.slots on slots.id = bookings.slot_id
+where bookings.start_time is not null
+group by slots.park_id, date_trunc('hour', bookings.start_time)
+on conflict (park_id, bucket) do update set revenue = excluded.revenue, bookings = excluded.bookings;